@@ -1,5 +1,18 @@
 import base.liferender
 import base.lifealgo
+import base.liferules
+import base.hqlifealgo
+import base.hlifealgo
+import base.sparsealgo
+import base.boundedalgo
+import base.ensemble
+import base.ghashbase
+import base.generationsalgo
+import base.ltlalgo
+import base.convolutionalgo
+import base.jvnalgo
+import base.superalgo
+import base.ruleloaderalgo
 import base.lifepoll
 import base.util
 import base.viewport
@@ -1,13 +1,26 @@
 import sys
 import ctypes
+import functools
 import typing
 from ctypes import c_int as cint
 from dataclasses import dataclass
 
 import click
 
+import base.boundedalgo as boundedalgo
+import base.convolutionalgo as convolutionalgo
+import base.jvnalgo as jvnalgo
+import base.ruleloaderalgo as ruleloaderalgo
+import base.generationsalgo as generationsalgo
+import base.hlifealgo as hlifealgo
+import base.hqlifealgo as hqlifealgo
 import base.lifealgo as lifealgo
+import base.liferules as liferules
+import base.ltlalgo as ltlalgo
+import base.sparsealgo as sparsealgo
+import base.superalgo as superalgo
 import base.liferender as liferender
+import base.readpattern as readpattern
 import base.util as util
 import base.viewport as viewport
 
@@ -145,6 +158,7 @@ class Options:
 
 hyper: cint = cint(0)
 hashlife: cint = cint(0)
+maxmem: cint = cint(256)
 render, autofit, quiet, pop_count, progress = cint(0), cint(0), cint(0), cint(0), cint(0)
 algo_name: str = ''
 verbose: cint = cint(0)
@@ -165,7 +179,7 @@ number_offset: cint = cint(0)
 @click.option("-i", "--stepsize",   "inc",
               help="Step size",                                         default=0)
 @click.option("-M", "--maxmemory",  "max_mem",
-              help="Max memory to use in megabytes",                    default=256)
+              help="Max memory to use in megabytes",                    default=maxmem.value)
 @click.option("-T", "--maxtime",    "max_time",
               help="Max duration",                                      default=max_time.value)
 @click.option("-b", "--benchmark",  "benchmark",
@@ -179,6 +193,10 @@ number_offset: cint = cint(0)
               help="Life rule to use",                                  default=life_rule)
 @click.option("-s", "--search", "user_rules",
               help="Search directory for .rule files",                  default=user_rules)
+@click.option("--rulecache", "rule_cache",
+              help="Directory for caching compiled rules",              default='')
+@click.option("--threads", "threads",
+              help="Threads for the step kernels (default one per core)", default=0)
 @click.option("-h", "--hashlife", "hashlife",
               help="Use Hashlife algorithm",                            is_flag=True)
 @click.option("-a", "--algorithm", "algo_name",
@@ -205,9 +223,22 @@ number_offset: cint = cint(0)
               help="Run testing script",                                default=test_script)
 @click.argument("patternfile", required=False)
 def main(max_gen, inc, max_mem, max_time, benchmark, hyper, quiet, quiet_, life_rule, user_rules, hashlife, algo_name,
-         out_filename, verbose, timeline, render, progress, pop_count, render_scale,  # step_thresh, step_factor,
+         rule_cache, threads, out_filename, verbose, timeline, render, progress, pop_count, render_scale,  # step_thresh, step_factor,
          autofit, test_script, patternfile,
          ):
+    global imp
+    # the options shadow the globals that createUniverse and the test script commands use
+    globals().update(maxmem=cint(max_mem), hashlife=cint(hashlife), algo_name=algo_name, user_rules=user_rules)
+    liferules.rule_cache.cache_dir = rule_cache or None
+    hqlifealgo.set_threads(threads)
+    if progress:
+        util.BaseLifeErrors.set_error_handler(prog_errors_instance)
+    else:
+        util.BaseLifeErrors.set_error_handler(std_errors_instance)
+    pattern = read_universe(patternfile) if patternfile else None
+    imp = create_universe(pattern=pattern, rule=life_rule, max_gen=max_gen)
+    if verbose:
+        imp.verbose = cint(1)
     ...
 
 
@@ -236,6 +267,156 @@ def writepat(fc: cint) -> None:
     imp.find_edges()
 
 
+# the algorithms createUniverse can pick by name
+algorithms: dict[str, typing.Callable[[], lifealgo.LifeAlgo]] = {
+    "QuickLife": hqlifealgo.HQLifeAlgo,
+    "HashLife": hlifealgo.HLifeAlgo,
+    "Sparse": sparsealgo.SparseAlgo,
+    "Bounded": boundedalgo.BoundedAlgo,
+    "Generations": generationsalgo.GenerationsAlgo,
+    "Larger than Life": ltlalgo.LtLAlgo,
+    "Convolution": convolutionalgo.ConvolutionAlgo,
+    "JvN": jvnalgo.JvNAlgo,
+    "Super": superalgo.SuperAlgo,
+    "RuleLoader": ruleloaderalgo.RuleLoaderAlgo,
+}
+
+# -h runs these multi-state algorithms under hashlife
+hashlife_algorithms: dict[str, typing.Callable[[], lifealgo.LifeAlgo]] = {
+    "Generations": generationsalgo.HGenerationsAlgo,
+    "JvN": jvnalgo.HJvNAlgo,
+    "RuleLoader": ruleloaderalgo.HRuleLoaderAlgo,
+}
+
+
+# Without -a or -h the algorithm is chosen from the rule, the pattern and
+# the number of generations asked for.  Two state rules on a bounded plane
+# or torus go to Bounded.  Other two state rules go to Sparse when
+# the live cells are too thinly spread for QuickLife's tiles to pay off, to
+# HashLife for long runs or for boxes too big for QuickLife's words, and to
+# QuickLife otherwise; multi-state rules go to their hashlife variant under
+# the same conditions.
+SPARSE_DENSITY = 1 / 1024   # about one live cell per 32x32 tile
+HASHLIFE_GENS = 1 << 14     # runs this long repay hashlife's memoisation
+
+# the algorithms that accept a rule, in the order Golly tries them
+rule_families: list[str] = ["QuickLife", "Generations", "Larger than Life", "Convolution", "JvN", "Super",
+                            "RuleLoader"]
+
+
+@functools.cache
+def probe_universe(creator: typing.Callable[[], lifealgo.LifeAlgo]) -> lifealgo.LifeAlgo:
+    """the universe kept for trying rules on, as some algorithms are slow to create"""
+    return creator()
+
+
+@functools.lru_cache(maxsize=liferules.RULE_CACHE_SIZE)
+def accepts(creator: typing.Callable[[], lifealgo.LifeAlgo], rule: str) -> bool:
+    """does the algorithm accept the rule"""
+    return probe_universe(creator).set_rule(rule) is None
+
+
+def hashed_algorithm(family: str) -> typing.Callable[[], lifealgo.LifeAlgo] | None:
+    """the hashlife variant of a family's algorithm, if it has one"""
+    return algorithms["HashLife"] if family == "QuickLife" else hashlife_algorithms.get(family)
+
+
+def rule_family(rule: str) -> str | None:
+    """the first algorithm in rule_families that accepts the rule"""
+    return next((name for name in rule_families if accepts(algorithms[name], rule)), None)
+
+
+def choose_algorithm(rule: str, pattern: lifealgo.LifeAlgo | None = None,
+                     max_gen: int = -1) -> tuple[str, bool, str]:
+    """Pick an algorithm for running the pattern (if any) under the rule
+       for max_gen generations (or an unknown number if negative).  Returns
+       its name, whether to use its hashlife variant and the reason."""
+    family = rule_family(rule)
+    if family is None:
+        return "QuickLife", False, "no algorithm accepts rule {}".format(rule)
+    if family == "QuickLife" and ':' in rule and accepts(algorithms["Bounded"], rule):
+        return "Bounded", False, "bounded grid {}".format(rule[rule.index(':'):])
+    hashed_algo = hashed_algorithm(family)
+    if hashed_algo is None or not accepts(hashed_algo, rule):
+        # eg. triangular rules, which only the counting engines run
+        return family, False, "only {} supports rule {}".format(family, rule)
+    population, area, box = 0, 0, "no pattern to sample" if pattern is None else "empty pattern"
+    if pattern is not None and not pattern.is_empty().value:
+        population = pattern.population
+        top, left, bottom, right = pattern.find_edges()
+        area = (bottom - top + 1) * (right - left + 1)
+        box = "{} cells in a {}x{} box".format(population, right - left + 1, bottom - top + 1)
+    # bytes the dense engines would need for the bounding box
+    dense_bytes = area // 8 if family == "QuickLife" else area
+    hashed = "HashLife" if family == "QuickLife" else family
+    if max_gen >= HASHLIFE_GENS:
+        return hashed, family != "QuickLife", "{} generations requested".format(max_gen)
+    if family == "QuickLife" and population and population < area * SPARSE_DENSITY:
+        return "Sparse", False, "{}, density {:.2g}".format(box, population / area)
+    if dense_bytes > maxmem.value << 20:
+        return hashed, family != "QuickLife", "{} is over {} MB as a dense array".format(box, maxmem.value)
+    return family, False, box
+
+
+def copy_pattern(src: lifealgo.LifeAlgo, dst: lifealgo.LifeAlgo) -> None:
+    """copy the rule, generation count and cells of one universe into another"""
+    dst.set_rule(src.get_rule())
+    dst.generation = src.generation
+    if not src.is_empty().value:
+        dst.set_cells(*src.live_cells_in(*src.find_edges()))
+    dst.end_of_pattern()
+
+
+def create_universe(pattern: lifealgo.LifeAlgo | None = None, rule: str = "",
+                    max_gen: int = -1) -> lifealgo.LifeAlgo:
+    """Create a universe for the algorithm given by -a and -h, or if there
+       are neither, one chosen for the rule (by default the pattern's) and
+       the pattern, which is then copied into the new universe."""
+    global algo_name
+    name, use_hashlife = algo_name, bool(hashlife.value)
+    chosen = not name and not use_hashlife and (pattern is not None or bool(rule))
+    if chosen:
+        name, use_hashlife, reason = choose_algorithm(rule or pattern.get_rule(), pattern, max_gen)
+        util.life_status("Using {}{}: {}".format(name, " (hashlife)" if use_hashlife else "", reason))
+    elif not name:
+        name = algo_name = "HashLife" if use_hashlife else "QuickLife"
+    elif name in ("RuleTable", "RuleTree"):
+        # RuleTable and RuleTree algos have been replaced by RuleLoader
+        name = algo_name = "RuleLoader"
+    creator = algorithms.get(name)
+    if use_hashlife and name in hashlife_algorithms:
+        creator = hashlife_algorithms[name]
+    if creator is None:
+        print(name)
+        util.life_fatal("No such algorithm")
+    universe = creator()
+    if universe is None:
+        util.life_fatal("Could not create universe")
+    universe.max_memory = maxmem
+    if pattern is not None:
+        copy_pattern(pattern, universe)
+    if rule:
+        err = universe.set_rule(rule)
+        if err:
+            util.life_fatal(err)
+    return universe
+
+
+def read_universe(filename: str) -> lifealgo.LifeAlgo:
+    """Read a pattern file into a universe of the first algorithm that
+       accepts its rule, as Golly does.  Each family's hashlife variant is
+       tried before its own algorithm, as it holds a pattern of any size and
+       reads macrocell files."""
+    err = None
+    for family in rule_families:
+        for creator in filter(None, (hashed_algorithm(family), algorithms[family])):
+            universe = creator()
+            err = readpattern.read_pattern(filename, universe)
+            if err is None:
+                return universe
+    util.life_fatal(err)
+
+
 """
 #define STRINGIFY(ARG) STR2(ARG)
 #define STR2(ARG) #ARG
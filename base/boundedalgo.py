@@ -0,0 +1,377 @@
+from __future__ import annotations
+
+import multiprocessing
+import multiprocessing.pool
+import multiprocessing.shared_memory
+import os
+
+import numpy as np
+
+import base.hqlifealgo as hqlifealgo
+import base.liferules as liferules
+from base.lifealgo import *
+
+
+# Two state rules on a bounded grid held as QuickLife's 32-bit words,
+# covering the grid exactly: row y - top, bit x - left.  The bits past the
+# grid's width in the last word of each row stay clear.
+#
+# Every topology Golly has (plane, torus, Klein bottle, cross-surface,
+# sphere and shifted torus) is stepped natively: LifeAlgo.ring_cells says
+# which grid cell each cell of a one cell border shows, and before every
+# generation the border is gathered from the grid with that map, so no
+# border cells are ever written into the grid and a step can run any
+# number of generations.
+#
+# Big planes and unshifted tori are stepped by a pool of worker processes,
+# each owning a band of rows.  The words live in two shared memory buffers,
+# the current and the next generation.  A worker copies its band plus HALO
+# rows above and below it, steps the copy HALO generations (each one eats a
+# row from both ends) and writes the band to the other buffer; the buffers
+# then swap.  So the workers only synchronise once every HALO generations,
+# at the cost of recomputing 2 * HALO rows per band.
+HALO = 8                    # generations between synchronisations
+PARALLEL_CELLS = 1 << 24    # use the worker pool from grids this size up
+MIN_BAND_ROWS = 16 * HALO   # keep the recomputed halo small next to the band
+WORD_BITS = hqlifealgo.WORD_BITS
+
+
+def tail_mask(width: int) -> np.uint32:
+    """the bits of the last word of a row that are inside the grid"""
+    return np.uint32((1 << (width - 1) % WORD_BITS + 1) - 1)
+
+
+def even_rows(rows: int) -> int:
+    """rows rounded up to an even number, which suits the leaf table kernel"""
+    return rows + (rows & 1)
+
+
+def next_block(block: np.ndarray, rules: liferules.LifeRules, width: int, wrap: bool) -> np.ndarray:
+    """Step rows of a grid (any number of leading batch axes) one
+       generation; the result loses the first and last row, whose neighbors
+       are not known.  With wrap the left and right edges of the grid are
+       joined."""
+    rows, words = block.shape[-2:]
+    padded = np.zeros(block.shape[:-2] + (even_rows(rows), words + 2), np.uint32)
+    padded[..., :rows, 1:-1] = block
+    if wrap:
+        # cell width - 1 becomes the left neighbor of cell 0, and cell 0
+        # the right neighbor of cell width - 1
+        last = (block[..., -1] >> np.uint32((width - 1) % WORD_BITS)) & np.uint32(1)
+        padded[..., :rows, 0] = last << np.uint32(WORD_BITS - 1)
+        padded[..., :rows, 1 + width // WORD_BITS] |= (block[..., 0] & np.uint32(1)) << np.uint32(width % WORD_BITS)
+    new = hqlifealgo.next_words(padded, rules)[..., :rows - 2, :]
+    new[..., -1] &= tail_mask(width)
+    return new
+
+
+def border_ring(src: np.ndarray, width: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Turn the flat indices from LifeAlgo.ring_cells into the row, column
+       and validity of the cells the border shows: its top row, bottom row,
+       left column and right column, in that order."""
+    valid = src >= 0
+    src = np.where(valid, src, 0)
+    return src // width, src % width, valid
+
+
+def bordered(words: np.ndarray, ring: tuple[np.ndarray, np.ndarray, np.ndarray], width: int) -> np.ndarray:
+    """the grid's words with a one word, one row border filled from ring,
+       ready for hqlifealgo.next_words"""
+    height, count = words.shape
+    rows, cols, valid = ring
+    cells = valid & ((words[rows, cols >> 5] >> (cols & 31).astype(np.uint32)) & np.uint32(1)).astype(bool)
+    top, bottom = cells[:width + 2], cells[width + 2:2 * width + 4]
+    left, right = cells[2 * width + 4:2 * width + 4 + height], cells[2 * width + 4 + height:]
+    padded = np.zeros((even_rows(height + 2), count + 2), np.uint32)
+    padded[1:height + 1, 1:-1] = words
+    # cell x of a border row is bit WORD_BITS + x of the row
+    lines = np.zeros((2, (count + 2) * WORD_BITS), bool)
+    lines[0, WORD_BITS - 1:WORD_BITS + width + 1] = top
+    lines[1, WORD_BITS - 1:WORD_BITS + width + 1] = bottom
+    packed = np.packbits(lines, axis=1, bitorder="little").view("<u4")
+    padded[0], padded[height + 1] = packed[0], packed[1]
+    padded[1:height + 1, 0] = left.astype(np.uint32) << np.uint32(WORD_BITS - 1)
+    padded[1:height + 1, 1 + width // WORD_BITS] |= right.astype(np.uint32) << np.uint32(width % WORD_BITS)
+    return padded
+
+
+def step_rows(words: np.ndarray, top: int, bottom: int, gens: int,
+              rules: liferules.LifeRules, width: int, torus: bool) -> np.ndarray:
+    """Step rows top .. bottom - 1 of a grid gens generations, taking the
+       rows beyond its top and bottom from the other side (torus) or dead."""
+    height = words.shape[0]
+    rows = np.arange(top - gens, bottom + gens)
+    inside = (rows >= 0) & (rows < height)
+    if torus:
+        block = words[rows % height]
+    else:
+        block = np.where(inside[:, None], words[np.clip(rows, 0, height - 1)], np.uint32(0))
+    for g in range(gens):
+        block = next_block(block, rules, width, torus)
+        if not torus:
+            # rows off the grid stay dead
+            block[~inside[g + 1:len(inside) - g - 1]] = 0
+    return block
+
+
+# each worker's views of the shared buffers, by name
+_attached: dict[str, tuple[multiprocessing.shared_memory.SharedMemory, np.ndarray]] = {}
+
+
+def _attach(name: str, shape: tuple[int, int]) -> np.ndarray:
+    if name not in _attached:
+        shm = multiprocessing.shared_memory.SharedMemory(name=name)
+        _attached[name] = shm, np.ndarray(shape, np.uint32, buffer=shm.buf)
+    return _attached[name][1]
+
+
+def _init_worker(cache_dir: str | None) -> None:
+    """a spawned worker starts afresh, so it takes the rule cache directory
+       (and with it the compiled rule kernels) from the main process"""
+    hqlifealgo.set_threads(1)
+    liferules.rule_cache.cache_dir = cache_dir
+
+
+def _step_band(src: str, dst: str, shape: tuple[int, int], top: int, bottom: int, gens: int,
+               rules: liferules.LifeRules, width: int, torus: bool) -> None:
+    """worker side of BandPool.step"""
+    _attach(dst, shape)[top:bottom] = step_rows(_attach(src, shape), top, bottom, gens, rules, width, torus)
+
+
+class BandPool(object):
+    """Worker processes sharing two word buffers of the grid's shape."""
+    words: list[np.ndarray]    # the current and next generation
+    _shms: list[multiprocessing.shared_memory.SharedMemory]
+    _pool: multiprocessing.pool.Pool
+    _bands: list[tuple[int, int]]
+
+    def __init__(self, shape: tuple[int, int], workers: int):
+        nbytes = max(1, shape[0] * shape[1] * 4)
+        self._shms = [multiprocessing.shared_memory.SharedMemory(create=True, size=nbytes) for _ in range(2)]
+        self.words = [np.ndarray(shape, np.uint32, buffer=shm.buf) for shm in self._shms]
+        bands = max(1, min(workers, shape[0] // MIN_BAND_ROWS))
+        edges = [shape[0] * i // bands for i in range(bands + 1)]
+        self._bands = list(zip(edges[:-1], edges[1:]))
+        # Numba's thread pool does not survive a fork, so the workers are
+        # spawned; each steps its band on a single thread
+        self._pool = multiprocessing.get_context("spawn").Pool(len(self._bands), _init_worker,
+                                                               (liferules.rule_cache.cache_dir,))
+
+    def step(self, gens: int, rules: liferules.LifeRules, width: int, torus: bool) -> None:
+        """step the grid in words[0] gens (at most HALO) generations"""
+        src, dst = (shm.name for shm in self._shms)
+        shape = self.words[0].shape
+        self._pool.starmap(_step_band, [(src, dst, shape, top, bottom, gens, rules, width, torus)
+                                        for top, bottom in self._bands])
+        self._shms.reverse()
+        self.words.reverse()
+
+    def close(self) -> None:
+        self._pool.terminate()
+        self.words = []
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
+
+
+class BoundedAlgo(LifeAlgo):
+    """Two state rules (any rule QuickLife runs) on a bounded grid of a
+       fixed size and any topology, like "B3/S23:T1000,1000",
+       "B36/S23:P500,300" or "B3/S23:K200*,100".  Planes and unshifted tori
+       of PARALLEL_CELLS or more are stepped in bands by a pool of
+       `workers` processes."""
+    _words: np.ndarray   # the grid; a view of the pool's buffer while there is one
+    _ring: tuple[np.ndarray, np.ndarray, np.ndarray]   # border_ring of the grid
+    _band_pool: BandPool | None
+    _population: int
+    _pop_valid: bool
+    _rules: liferules.LifeRules
+    workers: int
+
+    def __init__(self):
+        super(BoundedAlgo, self).__init__()
+        self._max_cell_states = cint(2)
+        self._increment = 1
+        self._rules = liferules.LifeRules()
+        self._words = np.zeros((0, 0), np.uint32)
+        self._band_pool = None
+        self._population = 0
+        self._pop_valid = True
+        self.workers = os.cpu_count() or 1
+        self.unbounded = False
+        self.set_rule(self.default_rule)
+
+    def __del__(self):
+        self._close_pool()
+        super(BoundedAlgo, self).__del__()
+
+    # storage management
+
+    def _close_pool(self) -> None:
+        """copy the grid out of the shared buffers and stop the workers"""
+        if getattr(self, "_band_pool", None) is not None:
+            self._words = self._words.copy()
+            self._band_pool.close()
+            self._band_pool = None
+
+    def _open_pool(self) -> None:
+        if (self._band_pool is None and self.workers > 1 and self._words.size * WORD_BITS >= PARALLEL_CELLS
+                and self._banded()):
+            self._band_pool = BandPool(self._words.shape, self.workers)
+            self._band_pool.words[0][...] = self._words
+            self._words = self._band_pool.words[0]
+
+    def _banded(self) -> bool:
+        """whether the worker pool can step this grid: its bands only
+           know planes and unshifted tori"""
+        return not (self.sphere or self.twist["h"] or self.twist["v"] or self.shift["h"] or self.shift["v"])
+
+    def _locate(self, x: int, y: int) -> tuple[int, int, int] | None:
+        """return row, word column and bit of a cell, or None if it is off the grid"""
+        col, row = x - self.grid["left"], y - self.grid["top"]
+        if 0 <= row < self.grid["ht"] and 0 <= col < self.grid["wd"]:
+            return row, col >> 5, col & 31
+        return None
+
+    # cell access
+
+    def set_cell(self, x: cint, y: cint, new_state: cint) -> cint:
+        x, y = as_int(x), as_int(y)
+        new_state = as_int(new_state)
+        place = self._locate(x, y)
+        if new_state < 0 or new_state >= self._max_cell_states.value or place is None:
+            return cint(-1)
+        row, col, bit = place
+        if new_state:
+            self._words[row, col] |= np.uint32(1 << bit)
+        else:
+            self._words[row, col] &= ~np.uint32(1 << bit)
+        self._pop_valid = False
+        return cint(0)
+
+    def get_cell(self, x: cint, y: cint) -> cint:
+        place = self._locate(as_int(x), as_int(y))
+        if place is None:
+            # cells outside the grid are dead, as in Golly
+            return cint(0)
+        row, col, bit = place
+        return cint(int(self._words[row, col] >> bit) & 1)
+
+    def next_cell(self, x: cint, y: cint, v: cint) -> cint:
+        """return the distance to the next live cell at or to the right of
+           (x, y) and store its state in v, or return -1 if there is none"""
+        x, y = as_int(x), as_int(y)
+        row, col = y - self.grid["top"], max(x - self.grid["left"], 0)
+        if not 0 <= row < self._words.shape[0] or col >= self.grid["wd"]:
+            return cint(-1)
+        line = self._words[row, col >> 5:]
+        first = int(line[0]) & ~((1 << (col & 31)) - 1)
+        if first:
+            found = (col >> 5) * WORD_BITS + ((first & -first).bit_length() - 1)
+        else:
+            rest = np.flatnonzero(line[1:])
+            if not len(rest):
+                return cint(-1)
+            w = int(line[rest[0] + 1])
+            found = ((col >> 5) + rest[0] + 1) * WORD_BITS + ((w & -w).bit_length() - 1)
+        if isinstance(v, cint):
+            v.value = 1
+        return cint(self.grid["left"] + int(found) - x)
+
+    def end_of_pattern(self):
+        """call after set_cell calls"""
+        self._poller.bail_if_calculating()
+        self._pop_valid = False
+        return cint(0)
+
+    @property
+    def population(self) -> int:
+        if not self._pop_valid:
+            self._population = hqlifealgo.popcount(self._words)
+            self._pop_valid = True
+        return self._population
+
+    def is_empty(self) -> cint:
+        return cint(not self._words.any())
+
+    def find_edges(self) -> tuple[int, int, int, int]:
+        rows = np.flatnonzero(self._words.any(axis=1))
+        if not len(rows):
+            return 0, 0, 0, 0
+        cols = np.flatnonzero(self._words.any(axis=0))
+        low = int(np.bitwise_or.reduce(self._words[:, cols[0]]))
+        high = int(np.bitwise_or.reduce(self._words[:, cols[-1]]))
+        top, left = self.grid["top"], self.grid["left"]
+        return (top + int(rows[0]), left + int(cols[0]) * WORD_BITS + (low & -low).bit_length() - 1,
+                top + int(rows[-1]), left + int(cols[-1]) * WORD_BITS + high.bit_length() - 1)
+
+    # rules and stepping
+
+    @property
+    def default_rule(self) -> str:
+        return "B3/S23:T100,100"
+
+    def set_rule(self, s: str) -> str | None:
+        old_grid = dict(self.grid)
+        previous = self._rules.get_rule() if self._words.size else None
+        err = self._rules.set_rule(s, self)
+        if err is None:
+            if not self.grid["wd"] or not self.grid["ht"]:
+                err = "Bounded grids need a width and a height."
+        if err is not None:
+            # go back to the grid the current pattern is on
+            if previous is not None:
+                self._rules.set_rule(previous, self)
+            return err
+        self._grid_type = TGridType[liferules.GRID_TYPES[self._rules.neighbormask]]
+        shape = (self.grid["ht"], -(-self.grid["wd"] // WORD_BITS))
+        if self._words.shape != shape or any(old_grid[k] != self.grid[k] for k in ("top", "left", "wd")):
+            self._regrid(shape, old_grid["top"], old_grid["left"], old_grid["wd"])
+        if self._band_pool is not None and not self._banded():
+            self._close_pool()
+        self._ring = border_ring(self.ring_cells(self.grid["ht"], self.grid["wd"])[2], self.grid["wd"])
+        return None
+
+    def _regrid(self, shape: tuple[int, int], old_top: int, old_left: int, old_width: int) -> None:
+        """move the live cells onto a new grid, saving those that fall off it"""
+        self._close_pool()
+        bits = np.unpackbits(self._words.astype("<u4").view(np.uint8), axis=1, bitorder="little")
+        rows, cols = np.nonzero(bits[:, :old_width])
+        ys, xs = rows + old_top, cols + old_left
+        g = self.grid
+        inside = (ys >= g["top"]) & (ys <= g["bottom"]) & (xs >= g["left"]) & (xs <= g["right"])
+        self.clipped_cells = [(int(x), int(y), 1) for x, y in zip(xs[~inside], ys[~inside])]
+        self._words = np.zeros(shape, np.uint32)
+        cols = xs[inside] - g["left"]
+        np.bitwise_or.at(self._words, (ys[inside] - g["top"], cols >> 5),
+                         np.left_shift(np.uint32(1), (cols & 31).astype(np.uint32)))
+        self._pop_valid = False
+
+    def get_rule(self) -> str:
+        return self._rules.get_rule()
+
+    def step(self) -> None:
+        """do inc gens"""
+        self._poller.bail_if_calculating()
+        self._open_pool()
+        width, torus = self.grid["wd"], not self.bounded_plane
+        gens = self._increment
+        while gens > 0 and not self._poller.poll():
+            if self._band_pool is not None:
+                k = min(gens, HALO)
+                self._band_pool.step(k, self._rules, width, torus)
+                self._words = self._band_pool.words[0]
+            else:
+                k = 1
+                padded = bordered(self._words, self._ring, width)
+                self._words = hqlifealgo.next_words(padded, self._rules)[:self._words.shape[0]]
+                self._words[:, -1] &= tail_mask(width)
+            self.running_hperf.tiles_calculated += k * self._words.size // hqlifealgo.TILE_ROWS
+            self._generation += k
+            gens -= k
+        self._pop_valid = False
+        self.step_hperf, self.inc_hperf = self.running_hperf.report_step(
+            self.step_hperf, self.inc_hperf, float(self._generation), self._verbose)
+
+    def write_native_format(self, os: io.StringIO, comments: str) -> str:
+        return "No native format for boundedalgo yet."
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import math
+
+import numpy as np
+
+import base.ltlalgo as ltlalgo
+from base.lifealgo import *
+
+
+# The Convolution algorithm runs Larger than Life rules in every one of
+# Golly's neighborhoods: besides Moore and von Neumann (still counted with
+# LtLAlgo's summed-area tables) the circular, cross, saltire, star, L2,
+# hexagonal, checkerboard, hash, tripod, asterisk, triangular and gaussian
+# shapes, custom (N@) neighborhoods and weighted (NW) ones with optional
+# state weights.  Each such neighborhood is a kernel of weights, and the
+# counts of all cells are the correlation of the live cells (or the state
+# weights of all cells) with it, over the array with a border of R cells
+# that LtLAlgo fills according to the grid's topology.
+#
+# A kernel with few cells is applied directly, one shifted slice of the
+# array per cell.  A bigger one costs O(N log N) whatever its size: the
+# array and the kernel are multiplied in Fourier space, and the transform
+# of the kernel only depends on the shape of the array, so it is kept from
+# one generation to the next (on a bounded grid it is computed once).
+DIRECT_CELLS = 12  # kernel cells worth one FFT, per doubling of the array beyond 4096 cells
+
+
+def direct_is_faster(kernel_cells: int, array_cells: int) -> bool:
+    """whether shifted slices beat the FFT, whose cost per cell grows with
+       the log of the array size (about 24 kernel cells for 128 x 128 and
+       96 for 1024 x 1024)"""
+    return kernel_cells <= DIRECT_CELLS * max(2.0, math.log2(max(array_cells, 1)) - 12)
+
+
+def fast_length(n: int) -> int:
+    """the smallest 2^a 3^b 5^c at least n, a length numpy.fft transforms fast"""
+    best = 1 << (n - 1).bit_length()
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            m = p35
+            while m < n:
+                m += m
+            best = min(best, m)
+            p35 *= 3
+        p5 *= 5
+    return best
+
+
+def correlate_direct(bordered: np.ndarray, kernel: np.ndarray) -> np.ndarray:
+    """sum of kernel times the cells around every inner cell of bordered,
+       which has a border of R cells, one shifted slice per kernel cell"""
+    k = kernel.shape[0]
+    h, w = bordered.shape[0] - k + 1, bordered.shape[1] - k + 1
+    counts = np.zeros((h, w), np.int32)
+    for dy, dx in zip(*np.nonzero(kernel)):
+        cells = bordered[dy:dy + h, dx:dx + w]
+        weight = int(kernel[dy, dx])
+        if weight == 1:
+            counts += cells
+        else:
+            counts += weight * cells
+    return counts
+
+
+def kernel_transform(kernel: np.ndarray, shape: tuple[int, int]) -> np.ndarray:
+    """the transform to multiply by in correlate_fft for arrays of shape"""
+    return np.fft.rfft2(kernel[::-1, ::-1], shape)
+
+
+def correlate_fft(bordered: np.ndarray, transform: np.ndarray, k: int) -> np.ndarray:
+    """Same as correlate_direct for a kernel of k x k cells, given its
+       kernel_transform.  The product of the transforms is the cyclic
+       convolution with the kernel turned around, so the cells that wrap
+       around are only those of the border, which are dropped."""
+    h, w = bordered.shape
+    shape = (fast_length(h), fast_length(w))
+    product = np.fft.rfft2(bordered, shape)
+    product *= transform
+    full = np.fft.irfft2(product, shape)
+    return np.rint(full[k - 1:h, k - 1:w]).astype(np.int32)
+
+
+class ConvolutionAlgo(ltlalgo.LtLAlgo):
+    """Larger than Life in any of Golly's neighborhoods, including custom
+       and weighted ones, by correlating the cells with the neighborhood's
+       kernel; on the same universes as LtLAlgo."""
+    _neighborhoods = ltlalgo.NEIGHBORHOODS
+    _transforms: dict  # kernel transforms by array shape and orientation
+
+    def __init__(self):
+        self._transforms = {}
+        super(ConvolutionAlgo, self).__init__()
+
+    def _correlate(self, bordered: np.ndarray, flipped: bool) -> np.ndarray:
+        kernel = self._rule.kernel[::-1] if flipped else self._rule.kernel
+        if direct_is_faster(np.count_nonzero(kernel), bordered.size):
+            return correlate_direct(bordered, kernel)
+        key = (bordered.shape, flipped)
+        transform = self._transforms.get(key)
+        if transform is None:
+            if len(self._transforms) > 1:
+                # the array has changed shape
+                self._transforms.clear()
+            shape = (fast_length(bordered.shape[0]), fast_length(bordered.shape[1]))
+            transform = self._transforms[key] = kernel_transform(kernel, shape)
+        return correlate_fft(bordered, transform, kernel.shape[0])
+
+    def _counts(self, live: np.ndarray) -> np.ndarray:
+        rule = self._rule
+        if rule.kernel is None:
+            return super(ConvolutionAlgo, self)._counts(live)
+        if rule.state_weights is None:
+            bordered = self._bordered(live)
+        else:
+            weights = rule.state_weights
+            bordered = self._bordered(weights[self._states], weights[0])
+        counts = self._correlate(bordered, False)
+        if rule.grid_type == "TRI_GRID":
+            # triangles with odd x + y point the other way
+            rows, cols = np.ogrid[:counts.shape[0], :counts.shape[1]]
+            odd = (rows + cols + self._y0 + self._x0) & 1 == 1
+            counts = np.where(odd, self._correlate(bordered, True), counts)
+        if rule.ntype == 'W':
+            # the last flag stands for every negative count
+            np.maximum(counts, -1, out=counts)
+        return counts
+
+    def set_rule(self, s: str) -> str | None:
+        self._transforms = {}
+        return super(ConvolutionAlgo, self).set_rule(s)
+
+    def write_native_format(self, os: io.StringIO, comments: str) -> str:
+        return "No native format for convolutionalgo yet."
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import numpy as np
+
+import base.boundedalgo as boundedalgo
+import base.hqlifealgo as hqlifealgo
+import base.liferules as liferules
+
+
+# An ensemble is N small universes of the same size and rule stepped
+# together, for soup searches: one (N, H, words) array of QuickLife's words
+# goes through the kernel in a single call, so the cost per universe is the
+# kernel's and not the interpreter's.  Each universe is a bounded plane (or
+# a torus) of H x W cells.
+#
+# After every generation each member's cells are hashed, and a member whose
+# hash matches one of its last MAX_PERIOD hashes has settled into a still
+# life or oscillator.  It is then retired: its cells stay as they are and
+# later generations only step the members that are still active.
+MAX_PERIOD = 60
+WORD_BITS = hqlifealgo.WORD_BITS
+
+
+class Ensemble(object):
+    """N universes of height x width cells under one two state rule."""
+    words: np.ndarray       # (N, height, words) cells, bit x % 32 of word x // 32
+    width: int
+    torus: bool
+    generation: int
+    active: np.ndarray      # per member: still being stepped
+    period: np.ndarray      # per member: period it settled with, or 0
+    settled_at: np.ndarray  # per member: first generation of its final cycle, or -1
+    _rules: liferules.LifeRules
+    _weights: np.ndarray    # random odd multipliers for hashing a member
+    _history: np.ndarray    # (N, MAX_PERIOD) hashes of the last generations
+
+    def __init__(self, count: int, height: int, width: int, rule: str = "B3/S23", torus: bool = False):
+        self._rules = liferules.LifeRules()
+        err = self._rules.set_rule(rule)
+        if err is not None:
+            raise ValueError(err)
+        self.words = np.zeros((count, height, -(-width // WORD_BITS)), np.uint32)
+        self.width = width
+        self.torus = torus
+        self.generation = 0
+        self._weights = np.random.default_rng(0).integers(0, 1 << 63, self.words.shape[1:], np.uint64) * 2 + 1
+        self.active = np.ones(count, bool)
+        self.period = np.zeros(count, np.int64)
+        self.settled_at = np.full(count, -1, np.int64)
+        self._history = np.zeros((count, MAX_PERIOD), np.uint64)
+        self._history[:, :] = self._hash(self.words)[:, None]
+
+    @staticmethod
+    def from_cells(cells: np.ndarray, rule: str = "B3/S23", torus: bool = False) -> Ensemble:
+        """an ensemble holding a (N, H, W) array of cells (nonzero is alive)"""
+        count, height, width = cells.shape
+        ensemble = Ensemble(count, height, width, rule, torus)
+        ensemble.set_cells(np.arange(count), cells)
+        return ensemble
+
+    def set_cells(self, members: np.ndarray, cells: np.ndarray) -> None:
+        """replace the cells of some members, which become active again"""
+        padded = np.zeros(cells.shape[:-1] + (self.words.shape[-1] * WORD_BITS,), bool)
+        padded[..., :self.width] = cells != 0
+        packed = np.packbits(padded, axis=-1, bitorder="little").view("<u4").astype(np.uint32, copy=False)
+        self.words[members] = packed
+        self.active[members] = True
+        self.period[members] = 0
+        self.settled_at[members] = -1
+        self._history[members] = self._hash(self.words[members])[..., None]
+
+    def cells(self, member: int) -> np.ndarray:
+        """the cells of one member as a (H, W) boolean array"""
+        bits = np.unpackbits(self.words[member].astype("<u4").view(np.uint8), axis=-1, bitorder="little")
+        return bits[:, :self.width].view(bool)
+
+    @property
+    def population(self) -> np.ndarray:
+        """the number of live cells of every member"""
+        if hasattr(np, "bitwise_count"):
+            return np.bitwise_count(self.words).sum(axis=(1, 2), dtype=np.int64)
+        return np.unpackbits(self.words.view(np.uint8), axis=-1).sum(axis=(1, 2), dtype=np.int64)
+
+    @property
+    def settled(self) -> np.ndarray:
+        """per member: has settled into a still life or oscillator"""
+        return self.period > 0
+
+    def _hash(self, words: np.ndarray) -> np.ndarray:
+        return (words.astype(np.uint64) * self._weights).sum(axis=(-2, -1), dtype=np.uint64)
+
+    def _next(self, words: np.ndarray) -> np.ndarray:
+        height = words.shape[1]
+        rows = np.arange(-1, height + 1)
+        if self.torus:
+            block = words[:, rows % height]
+        else:
+            block = np.zeros(words.shape[:1] + (height + 2,) + words.shape[2:], np.uint32)
+            block[:, 1:-1] = words
+        return boundedalgo.next_block(block, self._rules, self.width, self.torus)
+
+    def step(self, gens: int = 1) -> None:
+        """step the active members gens generations, retiring those that settle"""
+        for _ in range(gens):
+            members = np.flatnonzero(self.active)
+            if not len(members):
+                self.generation += 1
+                continue
+            everyone = len(members) == len(self.active)
+            words = self._next(self.words if everyone else self.words[members])
+            if everyone:
+                self.words = words
+            else:
+                self.words[members] = words
+            self.generation += 1
+            hashes = self._hash(words)
+            history = self._history[members]
+            # the member's state k generations ago is in column (generation - k) % MAX_PERIOD
+            ago = (self.generation - np.arange(1, MAX_PERIOD + 1)) % MAX_PERIOD
+            repeats = history[:, ago] == hashes[:, None]
+            settled = repeats.any(axis=1)
+            if settled.any():
+                done = members[settled]
+                self.period[done] = np.argmax(repeats[settled], axis=1) + 1
+                self.settled_at[done] = self.generation - self.period[done]
+                self.active[done] = False
+            history[:, self.generation % MAX_PERIOD] = hashes
+            self._history[members] = history
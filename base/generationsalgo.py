@@ -0,0 +1,427 @@
+from __future__ import annotations
+
+
+import numba as nb
+import numpy as np
+
+import base.ghashbase as ghashbase
+import base.hqlifealgo as hqlifealgo
+import base.liferules as liferules
+from base.lifealgo import *
+
+
+# The universe is held as a dense array of cell states, one byte per cell:
+# 0 is dead, 1 is alive and 2 .. states - 1 are the dying states a cell
+# passes through after it stops surviving.  The array covers whole tiles of
+# TILE x TILE cells and, like QuickLife, keeps one to two empty tiles of
+# margin around the pattern.  Only live cells (state 1) count as
+# neighbors, so each generation packs the live cells into QuickLife's
+# 32-bit words and steps them with QuickLife's bit-parallel kernel; the
+# dying states then advance in one parallel pass over the rows.
+TILE = hqlifealgo.TILE_ROWS
+WORD_BITS = hqlifealgo.WORD_BITS
+
+MIN_STATES = 2
+MAX_STATES = 256
+
+
+def pack_live(states: np.ndarray) -> np.ndarray:
+    """pack the live cells of a state array into words, bit 0 leftmost"""
+    packed = np.packbits(states == 1, axis=-1, bitorder="little")
+    return packed.view("<u4").astype(np.uint32, copy=False)
+
+
+def unpack_live(words: np.ndarray) -> np.ndarray:
+    """the inverse of pack_live, as a boolean array"""
+    return np.unpackbits(words.astype("<u4", copy=False).view(np.uint8), axis=-1, bitorder="little").view(bool)
+
+
+def next_states(states: np.ndarray, rules: GenerationsRules) -> np.ndarray:
+    """Compute the next generation of a state array, taking the cells
+       beyond its edges as dead."""
+    rows, cols = states.shape
+    padded = np.zeros((rows + 2, cols // WORD_BITS + 2), np.uint32)
+    padded[1:-1, 1:-1] = pack_live(states)
+    return advance_words(states, hqlifealgo.next_words(padded, rules), rules.states)
+
+
+@nb.njit(parallel=True, nogil=True, cache=True)
+def advance_words(states, words, num_states):
+    """As advance, given the live cells of the next generation packed into
+       words.  Dying cells are dead in the live plane, so births the words
+       report there are dropped."""
+    rows, cols = states.shape
+    out = np.empty_like(states)
+    for y in nb.prange(rows):
+        for x in range(cols):
+            state = states[y, x]
+            if state <= 1 and (words[y, x >> 5] >> (x & 31)) & 1:
+                out[y, x] = 1
+            elif state == 0 or state + 1 >= num_states:
+                out[y, x] = 0
+            else:
+                out[y, x] = state + 1
+    return out
+
+
+def advance(states: np.ndarray, live: np.ndarray, num_states: int) -> np.ndarray:
+    """The next states given which cells are alive in the next generation:
+       every other cell that is not dead ages by one state, dying when it
+       reaches num_states."""
+    older = states + (states != 0).view(np.uint8)
+    if num_states < MAX_STATES:
+        older[older >= num_states] = 0
+    # (with 256 states the increment from 255 wraps to 0 by itself)
+    return np.where(live, np.uint8(1), older)
+
+
+def transition(rules: GenerationsRules) -> ghashbase.Transition:
+    """The rule as a Transition for hashlife.  The index has a bit per
+       live neighbor, as in rule3x3, plus 512 times the cell's state."""
+    num_states = rules.states
+    order = [p for p in range(9) if rules.neighbormask >> p & 1]
+    live = (np.arange(num_states) == 1).astype(np.int64)
+    weights = np.zeros((9, num_states), np.int64)
+    for p in order:
+        weights[p] = live << p
+    weights[4] += np.arange(num_states) * len(liferules.ALL3X3)
+    older = np.arange(1, num_states + 1)
+    older[-1] = 0
+    # births and survivals only happen in states 0 and 1
+    on = rules.rule3x3 != 0
+    table = np.repeat(older, len(on)).reshape(num_states, len(on))
+    table[0] = on
+    table[1] = np.where(on, 1, older[1])
+    return ghashbase.flat_transition(num_states, order, weights, table.astype(np.uint8).ravel())
+
+
+class GenerationsRules(liferules.LifeRules):
+    """Generations rules like "12/34/3" (survival/birth/states), "B34/S12/3",
+       "345/2/4H" or "MAP.../3".  A live cell that does not survive starts
+       to die: it goes through the states 2 .. states - 1 and then becomes
+       dead, and only live cells count as neighbors.  The birth and survival
+       part is parsed by LifeRules, so every neighborhood and notation it
+       supports works here too, sharing its compiled tables."""
+    states: int
+    __canon_rule: str
+
+    def init_rule(self) -> None:
+        """default to Brian's Brain"""
+        super(GenerationsRules, self).init_rule()
+        self.set_rule("12/34/3")
+
+    def set_rule(self, rule_string: str, algo=None) -> str | None:
+        """parse a Generations rule (optionally followed by a bounded grid
+           suffix); returns an error message, or None if the rule is valid"""
+        if len(rule_string) > liferules.MAX_RULE_SIZE:
+            return "Rule name is too long."
+        rule, colon, suffix = rule_string.strip().partition(':')
+        parsed = self.parse_generations(rule)
+        if isinstance(parsed, str):
+            return parsed
+        canon, life_canon, rule3x3, totalistic, mask, states = parsed
+        if rule3x3[0]:
+            return "Generations does not support B0."
+        err = self.check_neighborhood(mask, algo)
+        if err is not None:
+            return err
+
+        if colon:
+            if algo is None:
+                return "Bounded grids are not supported here."
+            err = algo.set_grid_size(colon + suffix)
+            if err != chr(0):
+                return err
+        elif algo is not None:
+            algo.set_grid_size(":")
+
+        if algo is not None:
+            canon += algo.canonical_suffix().rstrip(chr(0))
+        # the tables only depend on births and survivals, so they are
+        # shared with the equivalent two state rule
+        self._use(liferules.rule_cache.get(life_canon, lambda: liferules.CompiledRule.compile(
+            rule3x3, totalistic, mask)))
+        self.states = states
+        self.__canon_rule = canon
+        return None
+
+    def get_rule(self) -> str:
+        return self.__canon_rule
+
+    @staticmethod
+    def parse_generations(rule: str) -> tuple[str, str, np.ndarray, bool, int, int] | str:
+        """Parse a Generations rule without its bounded grid suffix.  Returns
+           the canonical name, the canonical name of the birth and survival
+           part as a LifeRules rule, the 3x3 table, totalistic, the
+           neighborhood mask and the number of states, or an error."""
+        rule = rule.strip()
+        if rule[:3].lower() == "map":
+            part, slash, count = rule.rpartition('/')
+            if not slash:
+                return "Generations rule needs number of states."
+            digits = len(count) - len(count.lstrip("0123456789"))
+            states, trailing = int(count[:digits] or 0), count[digits:]
+        else:
+            if not rule.replace(' ', ''):
+                return "Rule cannot be empty string."
+            separators = [i for i, c in enumerate(rule) if c in "/_"]
+            if len(separators) > 2:
+                return "Only two slashes allowed."
+            if len(separators) < 2:
+                return "Rule must contain two slashes."
+            # the state count follows the second slash; a neighborhood
+            # letter there belongs to the birth and survival part
+            part, count = rule[:separators[1]], rule[separators[1] + 1:].replace(' ', '').lower()
+            if any(c not in "0123456789hvl" for c in count):
+                return "Bad character found."
+            neighborhood = "".join(c for c in count if c in "hvl")
+            if any(c in "hvl" for c in part.lower()):
+                return "Only one neighborhood allowed." if neighborhood else "Neighborhood must be at end of rule."
+            part += neighborhood
+            states, trailing = int("".join(c for c in count if c.isdigit()) or 0), ""
+        if states < MIN_STATES:
+            return "Number of states too low in Generations rule."
+        if states > MAX_STATES:
+            return "Number of states too high in Generations rule."
+        if trailing:
+            return "Illegal trailing characters after MAP."
+
+        parsed = liferules.LifeRules.parse(part)
+        if isinstance(parsed, str):
+            return parsed
+        life_canon, rule3x3, totalistic, mask = parsed
+        if '_' in rule and totalistic:
+            return "Underscore not valid for totalistic rules, use slash."
+        if life_canon.startswith("MAP"):
+            canon = life_canon + "/" + str(states)
+        else:
+            # LifeRules names the rule B<birth>/S<survival><neighborhood>
+            birth, survival = life_canon[1:].split("/S")
+            survival = survival.rstrip("HVL")
+            canon = survival + "/" + birth + "/" + str(states) + liferules.NEIGHBORHOOD_SUFFIX[mask]
+        return canon, life_canon, rule3x3, totalistic, mask, states
+
+
+class GenerationsAlgo(LifeAlgo):
+    """Generations: multi-state rules where dying cells age through extra
+       states.  Each generation is computed over the whole state array:
+       births and survivals come from the live plane stepped by QuickLife's
+       bit-parallel kernel (or its leaf table for rules it cannot count),
+       the ageing is a single parallel pass."""
+    _states: np.ndarray  # TILE * n rows of TILE * m cell states
+    _x0: int             # universe coordinates of _states[0, 0]
+    _y0: int
+    _population: int
+    _pop_valid: bool
+    _rules: GenerationsRules
+
+    def __init__(self):
+        super(GenerationsAlgo, self).__init__()
+        self._increment = 1
+        self._rules = GenerationsRules()
+        self._max_cell_states = cint(self._rules.states)
+        self._x0 = self._y0 = -TILE
+        self._states = np.zeros((3 * TILE, 3 * TILE), np.uint8)
+        self._population = 0
+        self._pop_valid = True
+
+    # coordinates and storage management
+
+    def _locate(self, x: int, y: int) -> tuple[int, int]:
+        """return the row and column of a cell (possibly out of range)"""
+        return y - self._y0, x - self._x0
+
+    def _resize_tiles(self, top: int, left: int, bottom: int, right: int) -> None:
+        """add (or remove, if negative) whole tiles on each side of the array"""
+        rows, cols = self._states.shape
+        new_rows, new_cols = rows + (top + bottom) * TILE, cols + (left + right) * TILE
+        states = np.zeros((new_rows, new_cols), np.uint8)
+        src_r0, dst_r0 = max(0, -top) * TILE, max(0, top) * TILE
+        src_c0, dst_c0 = max(0, -left) * TILE, max(0, left) * TILE
+        h = min(rows - src_r0, new_rows - dst_r0)
+        w = min(cols - src_c0, new_cols - dst_c0)
+        states[dst_r0:dst_r0 + h, dst_c0:dst_c0 + w] = self._states[src_r0:src_r0 + h, src_c0:src_c0 + w]
+        self._states = states
+        self._y0 -= top * TILE
+        self._x0 -= left * TILE
+
+    def _ensure_cell(self, x: int, y: int) -> None:
+        """grow the array so the cell has a tile of margin on every side;
+           grow generously so that loading a pattern cell by cell stays cheap"""
+        ty, tx = self._states.shape[0] // TILE, self._states.shape[1] // TILE
+        row, col = self._locate(x, y)
+        tile_row, tile_col = row // TILE, col // TILE
+        need = [max(0, 1 - tile_row), max(0, 1 - tile_col),
+                max(0, tile_row + 2 - ty), max(0, tile_col + 2 - tx)]
+        if any(need):
+            slack = [ty >> 1, tx >> 1, ty >> 1, tx >> 1]
+            self._resize_tiles(*(n + s if n else 0 for n, s in zip(need, slack)))
+
+    def _fit_margin(self) -> None:
+        """Keep one to two empty tiles around the pattern, so the next
+           generation fits in the array without wasting work on empty space."""
+        rows, cols = self._states.shape
+        occupied = self._states.reshape(rows // TILE, TILE, cols // TILE, TILE).any(axis=(1, 3))
+        tile_rows, tile_cols = np.flatnonzero(occupied.any(axis=1)), np.flatnonzero(occupied.any(axis=0))
+        if not len(tile_rows):
+            return
+        ty, tx = occupied.shape
+        margins = [int(tile_rows[0]), int(tile_cols[0]), int(ty - 1 - tile_rows[-1]), int(tx - 1 - tile_cols[-1])]
+        if all(1 <= m <= 2 for m in margins):
+            return
+        self._resize_tiles(*(0 if 1 <= m <= 2 else 1 - m for m in margins))
+
+    # cell access
+
+    def set_cell(self, x: cint, y: cint, new_state: cint) -> cint:
+        x, y = as_int(x), as_int(y)
+        new_state = as_int(new_state)
+        if new_state < 0 or new_state >= self._max_cell_states.value:
+            return cint(-1)
+        if new_state:
+            self._ensure_cell(x, y)
+        row, col = self._locate(x, y)
+        if 0 <= row < self._states.shape[0] and 0 <= col < self._states.shape[1]:
+            self._states[row, col] = new_state
+            self._pop_valid = False
+        return cint(0)
+
+    def get_cell(self, x: cint, y: cint) -> cint:
+        x, y = as_int(x), as_int(y)
+        row, col = self._locate(x, y)
+        if 0 <= row < self._states.shape[0] and 0 <= col < self._states.shape[1]:
+            return cint(int(self._states[row, col]))
+        return cint(0)
+
+    def next_cell(self, x: cint, y: cint, v: cint) -> cint:
+        """return the distance to the next non-dead cell at or to the right
+           of (x, y) and store its state in v, or return -1 if there is none"""
+        x, y = as_int(x), as_int(y)
+        row, col = self._locate(x, y)
+        if not 0 <= row < self._states.shape[0] or col >= self._states.shape[1]:
+            return cint(-1)
+        col = max(col, 0)
+        found = np.flatnonzero(self._states[row, col:])
+        if not len(found):
+            return cint(-1)
+        col += int(found[0])
+        if isinstance(v, cint):
+            v.value = int(self._states[row, col])
+        return cint(self._x0 + col - x)
+
+    def live_cells_in(self, top: int, left: int, bottom: int,
+                      right: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        r0, r1 = max(top - self._y0, 0), min(bottom - self._y0 + 1, self._states.shape[0])
+        c0, c1 = max(left - self._x0, 0), min(right - self._x0 + 1, self._states.shape[1])
+        block = self._states[r0:max(r0, r1), c0:max(c0, c1)]
+        ys, xs = np.nonzero(block)
+        return self._x0 + c0 + xs, self._y0 + r0 + ys, block[ys, xs].astype(np.int64)
+
+    def set_cells(self, xs: np.ndarray, ys: np.ndarray, states: np.ndarray) -> cint:
+        if not self._valid_states(states):
+            return cint(-1)
+        born = states != 0
+        if born.any():
+            self._ensure_cell(int(xs[born].min()), int(ys[born].min()))
+            self._ensure_cell(int(xs[born].max()), int(ys[born].max()))
+        rows, cols = ys - self._y0, xs - self._x0
+        inside = (rows >= 0) & (rows < self._states.shape[0]) & (cols >= 0) & (cols < self._states.shape[1])
+        self._states[rows[inside], cols[inside]] = states[inside]
+        self._pop_valid = False
+        return cint(0)
+
+    def end_of_pattern(self):
+        """call after set_cell calls"""
+        self._poller.bail_if_calculating()
+        self._pop_valid = False
+        return cint(0)
+
+    @property
+    def population(self) -> int:
+        """the number of cells in any state but dead, as in Golly"""
+        if not self._pop_valid:
+            self._population = int(np.count_nonzero(self._states))
+            self._pop_valid = True
+        return self._population
+
+    def is_empty(self) -> cint:
+        return cint(not self._states.any())
+
+    def find_edges(self) -> tuple[int, int, int, int]:
+        rows = np.flatnonzero(self._states.any(axis=1))
+        if not len(rows):
+            return 0, 0, 0, 0
+        cols = np.flatnonzero(self._states.any(axis=0))
+        return (self._y0 + int(rows[0]), self._x0 + int(cols[0]),
+                self._y0 + int(rows[-1]), self._x0 + int(cols[-1]))
+
+    # rules and stepping
+
+    @property
+    def default_rule(self) -> str:
+        return "12/34/3"
+
+    def set_rule(self, s: str) -> str | None:
+        err = self._rules.set_rule(s, self)
+        if err is None:
+            self._max_cell_states = cint(self._rules.states)
+            self._grid_type = TGridType[liferules.GRID_TYPES[self._rules.neighbormask]]
+            # cells in states the new rule does not have are dying cells
+            # that would have died by now
+            self._states[self._states >= self._rules.states] = 0
+            self._pop_valid = False
+        return err
+
+    def get_rule(self) -> str:
+        return self._rules.get_rule()
+
+    def triangular_capable(self) -> cint:
+        return cint(1)
+
+    def _dogen(self) -> None:
+        self._fit_margin()
+        self._states = next_states(self._states, self._rules)
+        self.running_hperf.tiles_calculated += self._states.size // (TILE * TILE)
+        self._generation += 1
+
+    def step(self) -> None:
+        """do inc gens"""
+        self._poller.bail_if_calculating()
+        for _ in range(self._increment):
+            if self._poller.poll():
+                break
+            self._dogen()
+        self._pop_valid = False
+        self.step_hperf, self.inc_hperf = self.running_hperf.report_step(
+            self.step_hperf, self.inc_hperf, float(self._generation), self._verbose)
+
+    def write_native_format(self, os: io.StringIO, comments: str) -> str:
+        return "No native format for generationsalgo yet."
+
+
+class HGenerationsAlgo(ghashbase.GHashBase):
+    """Generations under hashlife: the cells of the base case look their
+       next state up in a table built from the rule's 3x3 table."""
+    _rules: GenerationsRules
+
+    def __init__(self):
+        super(HGenerationsAlgo, self).__init__()
+        self._rules = GenerationsRules()
+        self.set_rule(self.default_rule)
+
+    @property
+    def default_rule(self) -> str:
+        return "12/34/3"
+
+    def set_rule(self, s: str) -> str | None:
+        err = self._rules.set_rule(s, self)
+        if err is None:
+            self._grid_type = TGridType[liferules.GRID_TYPES[self._rules.neighbormask]]
+            self._rule_changed()
+        return err
+
+    def get_rule(self) -> str:
+        return self._rules.get_rule()
+
+    def _rule_transition(self) -> ghashbase.Transition:
+        return transition(self._rules)
@@ -0,0 +1,548 @@
+from __future__ import annotations
+
+import collections
+import typing
+
+import numba as nb
+import numpy as np
+
+import base.hlifealgo as hlifealgo
+from base.hlifealgo import COUNT, STEP_EXP, CALCULATED, NATIVE_LEVEL, INITIAL_NODES, DEFAULT_MAX_MEMORY, \
+    new_nodes, find_node, save
+from base.lifealgo import *
+
+
+# Hashlife for rules with more than two states, like ghashbase.cpp.  The
+# quadtree and its node store are those of HashLife, except at the bottom:
+# a level 1 node is a 2x2 block whose four "children" are cell states, and
+# the states themselves are level 0.  Nodes of level 3 (8x8) are the base
+# case of the recursion: their center 4x4 is advanced one or two
+# generations directly, cell by cell.
+#
+# The cells are computed by a Transition, which any rule that maps a cell
+# and its 3x3 neighborhood to the next state can be compiled into.  order
+# lists the positions of the neighborhood the rule looks at (y * 3 + x, so
+# 4 is the cell itself), in the order they are read.  Without a tree, the
+# next state is table[sum of weights[position, state]]: eg. the states as
+# digits in base num_states.  With a tree, the lookup starts at the last
+# node (num_states entries per node, as in LoadedRule) and each state read
+# picks the entry holding the offset of the next node, or in the nodes of
+# the last level the next state.
+LEAF_LEVEL = 1
+BASE_LEVEL = 3
+BOARD = 1 << BASE_LEVEL
+
+Transition = collections.namedtuple("Transition", ["num_states", "order", "weights", "table", "tree"])
+
+
+def flat_transition(num_states: int, order: typing.Sequence[int], weights: np.ndarray,
+                    table: np.ndarray) -> Transition:
+    """a Transition looking the next state up in table"""
+    return Transition(num_states, np.array(order, np.int64), weights.astype(np.int64),
+                      table, np.zeros(0, np.int32))
+
+
+def tree_transition(num_states: int, order: typing.Sequence[int], tree: np.ndarray) -> Transition:
+    """a Transition walking tree"""
+    return Transition(num_states, np.array(order, np.int64), np.zeros((9, num_states), np.int64),
+                      np.zeros(0, np.uint8), tree)
+
+
+@nb.njit
+def next_state(rule, board, y, x):
+    """the next state of the cell at row y, column x of board"""
+    order = rule.order
+    if len(rule.tree):
+        node = len(rule.tree) - rule.num_states
+        for i in range(len(order)):
+            p = order[i]
+            node = rule.tree[node + board[y + p // 3 - 1, x + p % 3 - 1]]
+        return node
+    index = 0
+    for i in range(len(order)):
+        p = order[i]
+        index += rule.weights[p, board[y + p // 3 - 1, x + p % 3 - 1]]
+    return np.int32(rule.table[index])
+
+
+@nb.njit
+def center(nodes, m, k):
+    """the centered level k-1 subnode of node m, without advancing time"""
+    return find_node(nodes, nodes.se[nodes.nw[m]], nodes.sw[nodes.ne[m]],
+                     nodes.ne[nodes.sw[m]], nodes.nw[nodes.se[m]], k - 1)
+
+
+@nb.njit
+def fill_board(nodes, n, k, board, y, x):
+    """copy the states of a node of level <= BASE_LEVEL into board at (y, x)"""
+    if k == 0:
+        board[y, x] = n
+        return
+    half = 1 << (k - 1)
+    fill_board(nodes, nodes.nw[n], k - 1, board, y, x)
+    fill_board(nodes, nodes.ne[n], k - 1, board, y, x + half)
+    fill_board(nodes, nodes.sw[n], k - 1, board, y + half, x)
+    fill_board(nodes, nodes.se[n], k - 1, board, y + half, x + half)
+
+
+@nb.njit
+def board_node(nodes, board, y, x):
+    """the level 2 node of the 4x4 block of board at (y, x), or -1"""
+    q = np.empty(4, np.int32)
+    for i in range(4):
+        r, c = y + (i >> 1) * 2, x + (i & 1) * 2
+        q[i] = find_node(nodes, board[r, c], board[r, c + 1], board[r + 1, c], board[r + 1, c + 1], 1)
+    if q.min() < 0:
+        return -1
+    return find_node(nodes, q[0], q[1], q[2], q[3], 2)
+
+
+@nb.njit
+def base_result(nodes, n, rule, boards):
+    """the center 4x4 of a level 3 node advanced 2^min(1, STEP_EXP)
+       generations; boards is scratch space for two 8x8 boards"""
+    board, new = boards[0], boards[1]
+    fill_board(nodes, n, BASE_LEVEL, board, 0, 0)
+    if nodes.meta[STEP_EXP] >= 1:
+        for y in range(1, BOARD - 1):
+            for x in range(1, BOARD - 1):
+                new[y, x] = next_state(rule, board, y, x)
+        board, new = new, board
+    for y in range(2, BOARD - 2):
+        for x in range(2, BOARD - 2):
+            new[y, x] = next_state(rule, board, y, x)
+    return board_node(nodes, new, 2, 2)
+
+
+@nb.njit
+def result(nodes, n, k, rule, boards):
+    """The level k-1 center of node n, advanced by 2^min(k-2, STEP_EXP)
+       generations.  Returns -1 if the store overflowed; results computed
+       so far stay cached and the nodes holding them are saved, so the
+       caller can make room and call again."""
+    r = nodes.res[n]
+    if r >= 0:
+        return r
+    j = nodes.meta[STEP_EXP]
+    if k == BASE_LEVEL:
+        r = base_result(nodes, n, rule, boards)
+        if r < 0:
+            return -1
+    else:
+        a, b, c, d = nodes.nw[n], nodes.ne[n], nodes.sw[n], nodes.se[n]
+        k1 = k - 1
+        n01 = find_node(nodes, nodes.ne[a], nodes.nw[b], nodes.se[a], nodes.sw[b], k1)
+        n10 = find_node(nodes, nodes.sw[a], nodes.se[a], nodes.nw[c], nodes.ne[c], k1)
+        n11 = find_node(nodes, nodes.se[a], nodes.sw[b], nodes.ne[c], nodes.nw[d], k1)
+        n12 = find_node(nodes, nodes.sw[b], nodes.se[b], nodes.nw[d], nodes.ne[d], k1)
+        n21 = find_node(nodes, nodes.ne[c], nodes.nw[d], nodes.se[c], nodes.sw[d], k1)
+        if min(n01, n10, n11, n12, n21) < 0:
+            return save(nodes, n, n01, n10, n11, n12, n21, 0, 0, 0, 0)
+        if k - 2 <= j:
+            # full speed: both halves of the step advance time
+            r00, r01, r02 = result(nodes, a, k1, rule, boards), \
+                result(nodes, n01, k1, rule, boards), result(nodes, b, k1, rule, boards)
+            r10, r11, r12 = result(nodes, n10, k1, rule, boards), \
+                result(nodes, n11, k1, rule, boards), result(nodes, n12, k1, rule, boards)
+            r20, r21, r22 = result(nodes, c, k1, rule, boards), \
+                result(nodes, n21, k1, rule, boards), result(nodes, d, k1, rule, boards)
+        else:
+            # the step is smaller than this node can do; only the second half advances
+            r00, r01, r02 = center(nodes, a, k1), center(nodes, n01, k1), center(nodes, b, k1)
+            r10, r11, r12 = center(nodes, n10, k1), center(nodes, n11, k1), center(nodes, n12, k1)
+            r20, r21, r22 = center(nodes, c, k1), center(nodes, n21, k1), center(nodes, d, k1)
+        if min(r00, r01, r02, r10, r11, r12, r20, r21, r22) < 0:
+            return save(nodes, n, n01, n10, n11, n12, n21, 0, 0, 0, 0)
+        q00 = find_node(nodes, r00, r01, r10, r11, k1)
+        q01 = find_node(nodes, r01, r02, r11, r12, k1)
+        q10 = find_node(nodes, r10, r11, r20, r21, k1)
+        q11 = find_node(nodes, r11, r12, r21, r22, k1)
+        if min(q00, q01, q10, q11) < 0:
+            return save(nodes, n, n01, n10, n11, n12, n21, q00, q01, q10, q11)
+        s00, s01 = result(nodes, q00, k1, rule, boards), result(nodes, q01, k1, rule, boards)
+        s10, s11 = result(nodes, q10, k1, rule, boards), result(nodes, q11, k1, rule, boards)
+        r = -1
+        if min(s00, s01, s10, s11) >= 0:
+            r = find_node(nodes, s00, s01, s10, s11, k1)
+        if r < 0:
+            return save(nodes, n, n01, n10, n11, n12, n21, q00, q01, q10, q11)
+    nodes.res[n] = r
+    nodes.meta[CALCULATED] += 1
+    return r
+
+
+@nb.njit
+def population(nodes, n, k):
+    """number of cells that aren't dead in a node of level <= NATIVE_LEVEL
+       (memoised)"""
+    if k == 0:
+        return np.int64(n != 0)
+    if nodes.pop[n] < 0:
+        nodes.pop[n] = population(nodes, nodes.nw[n], k - 1) + population(nodes, nodes.ne[n], k - 1) + \
+            population(nodes, nodes.sw[n], k - 1) + population(nodes, nodes.se[n], k - 1)
+    return nodes.pop[n]
+
+
+@nb.njit
+def set_bit(nodes, n, k, x, y, state):
+    """return node n with the cell at offset (x, y) set to state, or -1"""
+    if k == 0:
+        return state
+    half = np.int64(1) << (k - 1)
+    a, b, c, d = nodes.nw[n], nodes.ne[n], nodes.sw[n], nodes.se[n]
+    if y < half:
+        if x < half:
+            a = set_bit(nodes, a, k - 1, x, y, state)
+        else:
+            b = set_bit(nodes, b, k - 1, x - half, y, state)
+    elif x < half:
+        c = set_bit(nodes, c, k - 1, x, y - half, state)
+    else:
+        d = set_bit(nodes, d, k - 1, x - half, y - half, state)
+    if min(a, b, c, d) < 0:
+        return -1
+    return find_node(nodes, a, b, c, d, k)
+
+
+@nb.njit
+def set_bits(nodes, n, k, xs, ys, states):
+    """set many cells at once; offsets are relative to the node's corner"""
+    for i in range(len(xs)):
+        n = set_bit(nodes, n, k, xs[i], ys[i], states[i])
+        if n < 0:
+            return -1
+    return n
+
+
+@nb.njit
+def count_in_rect(nodes, n, k, top, left, bottom, right):
+    """number of cells that aren't dead in a node of level <= NATIVE_LEVEL
+       inside a rectangle of offsets from its corner"""
+    size = np.int64(1) << k
+    if bottom < 0 or right < 0 or top >= size or left >= size:
+        return 0
+    if k == 0:
+        return np.int64(n != 0)
+    if population(nodes, n, k) == 0:
+        return 0
+    if top <= 0 and left <= 0 and bottom >= size - 1 and right >= size - 1:
+        return population(nodes, n, k)
+    half = size >> 1
+    return count_in_rect(nodes, nodes.nw[n], k - 1, top, left, bottom, right) + \
+        count_in_rect(nodes, nodes.ne[n], k - 1, top, left - half, bottom, right - half) + \
+        count_in_rect(nodes, nodes.sw[n], k - 1, top - half, left, bottom - half, right) + \
+        count_in_rect(nodes, nodes.se[n], k - 1, top - half, left - half, bottom - half, right - half)
+
+
+@nb.njit
+def cells_in_rect(nodes, n, k, oy, ox, top, left, bottom, right, xs, ys, states, i):
+    """store the offsets and states of the cells that aren't dead in a
+       node (whose corner is at offset (ox, oy)) inside a rectangle of
+       offsets from index i on; return the next free index"""
+    size = np.int64(1) << k
+    if bottom < oy or right < ox or top >= oy + size or left >= ox + size:
+        return i
+    if k == 0:
+        if n:
+            xs[i], ys[i], states[i] = ox, oy, n
+            i += 1
+        return i
+    if population(nodes, n, k) == 0:
+        return i
+    half = size >> 1
+    i = cells_in_rect(nodes, nodes.nw[n], k - 1, oy, ox, top, left, bottom, right, xs, ys, states, i)
+    i = cells_in_rect(nodes, nodes.ne[n], k - 1, oy, ox + half, top, left, bottom, right, xs, ys, states, i)
+    i = cells_in_rect(nodes, nodes.sw[n], k - 1, oy + half, ox, top, left, bottom, right, xs, ys, states, i)
+    return cells_in_rect(nodes, nodes.se[n], k - 1, oy + half, ox + half, top, left, bottom, right,
+                         xs, ys, states, i)
+
+
+@nb.njit
+def drop_states(nodes, n, k, num_states, memo):
+    """node n with every state >= num_states made dead, or -1; memo maps
+       the nodes done so far to their replacements"""
+    if k == 0:
+        return 0 if n >= num_states else n
+    if n < len(memo) and memo[n] >= 0:
+        return memo[n]
+    a = drop_states(nodes, nodes.nw[n], k - 1, num_states, memo)
+    b = drop_states(nodes, nodes.ne[n], k - 1, num_states, memo)
+    c = drop_states(nodes, nodes.sw[n], k - 1, num_states, memo)
+    d = drop_states(nodes, nodes.se[n], k - 1, num_states, memo)
+    if min(a, b, c, d) < 0:
+        return -1
+    r = find_node(nodes, a, b, c, d, k)
+    if r >= 0 and n < len(memo):
+        memo[n] = r
+    return r
+
+
+@nb.njit
+def edges(nodes, n, k, memo):
+    """(top, left, bottom, right) offsets of the cells that aren't dead in
+       a nonempty node of level <= NATIVE_LEVEL; memo caches them per node"""
+    if k == LEAF_LEVEL:
+        top, left, bottom, right = 2, 2, -1, -1
+        children = (nodes.nw[n], nodes.ne[n], nodes.sw[n], nodes.se[n])
+        for i in range(4):
+            if children[i]:
+                y, x = i >> 1, i & 1
+                top, left = min(top, y), min(left, x)
+                bottom, right = max(bottom, y), max(right, x)
+        return np.int64(top), np.int64(left), np.int64(bottom), np.int64(right)
+    if memo[n, 0] >= 0:
+        return memo[n, 0], memo[n, 1], memo[n, 2], memo[n, 3]
+    half = np.int64(1) << (k - 1)
+    top, left = np.int64(1) << k, np.int64(1) << k
+    bottom, right = np.int64(-1), np.int64(-1)
+    children = (nodes.nw[n], nodes.ne[n], nodes.sw[n], nodes.se[n])
+    for i in range(4):
+        child = children[i]
+        if population(nodes, child, k - 1) == 0:
+            continue
+        t, l, b, r = edges(nodes, child, k - 1, memo)
+        oy, ox = (i >> 1) * half, (i & 1) * half
+        top, left = min(top, t + oy), min(left, l + ox)
+        bottom, right = max(bottom, b + oy), max(right, r + ox)
+    memo[n, 0], memo[n, 1], memo[n, 2], memo[n, 3] = top, left, bottom, right
+    return top, left, bottom, right
+
+
+
+
+class GHashBase(hlifealgo.HLifeAlgo):
+    """HashLife for multi-state rules: the node store, stepping, memory
+       management and timeline of HLifeAlgo over 2x2 leaves of states.
+       Subclasses parse the rule and call _rule_changed, which compiles it
+       with _rule_transition."""
+    _transition: Transition | None
+    _boards: np.ndarray
+    _node_level = LEAF_LEVEL
+
+    def __init__(self):
+        # HLifeAlgo's own setup would build two state leaves
+        super(hlifealgo.HLifeAlgo, self).__init__()
+        self._increment = 1
+        self._nodes = new_nodes(INITIAL_NODES)
+        self._empty = [0]
+        self._root = self._empty_node(BASE_LEVEL)
+        self._root_level = BASE_LEVEL
+        self._pending = {}
+        self._transition = None
+        self._boards = np.zeros((2, BOARD, BOARD), np.int32)
+        self._pop_memo = {}
+        self._max_memory = DEFAULT_MAX_MEMORY
+        self._clipboard = 0
+        self._in_gc = False
+        self._need_pop = False
+
+    # cell access
+
+    def _set_bits(self, xs: np.ndarray, ys: np.ndarray, states: np.ndarray) -> None:
+        """set many cells in the tree, growing it to hold them"""
+        lo, hi = min(int(xs.min()), int(ys.min())), max(int(xs.max()), int(ys.max()))
+        while lo < -self._half() or hi >= self._half():
+            self._push_root()
+        if self._root_level < 63:
+            half = self._half()
+            self._root = self._call(set_bits, self._root, self._root_level, xs + half, ys + half, states)
+        else:
+            for x, y, state in zip(xs.tolist(), ys.tolist(), states.tolist()):
+                self._root = self._set_bit(self._root, self._root_level, x + self._half(), y + self._half(), state)
+        self._pop_memo.clear()
+
+    def _set_bit(self, n: int, k: int, x: int, y: int, state: int) -> int:
+        """set_bit for nodes too big for int64 offsets"""
+        if k < 63:
+            return self._call(set_bit, n, k, x, y, state)
+        half = 1 << (k - 1)
+        q = [*self._children(n)]
+        i = (y >= half) * 2 + (x >= half)
+        q[i] = self._set_bit(q[i], k - 1, x - (i & 1) * half, y - (i >> 1) * half, state)
+        return self._find(*q, k)
+
+    def get_cell(self, x: cint, y: cint) -> cint:
+        x, y = as_int(x), as_int(y)
+        if (x, y) in self._pending:
+            return cint(self._pending[x, y])
+        half = self._half()
+        x, y = x + half, y + half
+        if not (0 <= x < 2 * half and 0 <= y < 2 * half):
+            return cint(0)
+        n, k = self._root, self._root_level
+        while k > 0:
+            if n == self._empty_node(k):
+                return cint(0)
+            half = 1 << (k - 1)
+            i = (y >= half) * 2 + (x >= half)
+            n = self._children(n)[i]
+            x, y, k = x - (i & 1) * half, y - (i >> 1) * half, k - 1
+        return cint(n)
+
+    def _next_in_row(self, n: int, k: int, x: int, y: int) -> int:
+        """offset of the first cell that isn't dead at or right of (x, y) in
+           node n, or -1"""
+        if n == self._empty_node(k) or x >= 1 << k:
+            return -1
+        if k == 0:
+            return 0
+        half = 1 << (k - 1)
+        a, b, c, d = self._children(n)
+        left, right = (a, b) if y < half else (c, d)
+        y = y if y < half else y - half
+        if x < half:
+            found = self._next_in_row(left, k - 1, x, y)
+            if found >= 0:
+                return found
+            x = half
+        found = self._next_in_row(right, k - 1, x - half, y)
+        return found + half if found >= 0 else -1
+
+    def next_cell(self, x: cint, y: cint, v: cint) -> cint:
+        """return the distance to the next non-dead cell at or to the right
+           of (x, y) and store its state in v, or return -1 if there is none"""
+        self._flush()
+        x, y = as_int(x), as_int(y)
+        half = self._half()
+        if not -half <= y < half or x >= half:
+            return cint(-1)
+        start = max(x, -half)
+        found = self._next_in_row(self._root, self._root_level, start + half, y + half)
+        if found < 0:
+            return cint(-1)
+        if isinstance(v, cint):
+            v.value = self.get_cell(cint(found - half), cint(y)).value
+        return cint(found - half - x)
+
+    def live_cells_in(self, top: int, left: int, bottom: int,
+                      right: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        self._flush()
+        if self._root_level > NATIVE_LEVEL:
+            return LifeAlgo.live_cells_in(self, top, left, bottom, right)
+        half = self._half()
+        args = (self._root_level, top + half, left + half, bottom + half, right + half)
+        count = int(count_in_rect(self._nodes, self._root, *args))
+        xs, ys, states = np.empty(count, np.int64), np.empty(count, np.int64), np.empty(count, np.int64)
+        cells_in_rect(self._nodes, self._root, self._root_level, 0, 0, *args[1:], xs, ys, states, 0)
+        return xs - half, ys - half, states
+
+    def _population(self, n: int, k: int) -> int:
+        if k <= NATIVE_LEVEL:
+            return int(population(self._nodes, n, k))
+        return super(GHashBase, self)._population(n, k)
+
+    def _edges(self, n: int, k: int, memo: np.ndarray, big_memo: dict) -> tuple[int, int, int, int] | None:
+        if n != self._empty_node(k) and k <= NATIVE_LEVEL:
+            return tuple(int(v) for v in edges(self._nodes, n, k, memo))
+        return super(GHashBase, self)._edges(n, k, memo, big_memo)
+
+    # rules and stepping
+
+    def set_rule(self, s: str) -> str | None:
+        raise NotImplementedError
+
+    def get_rule(self) -> str:
+        raise NotImplementedError
+
+    def _rule_transition(self) -> Transition:
+        """the rule just installed by set_rule, compiled for the kernels"""
+        raise NotImplementedError
+
+    def _rule_changed(self) -> None:
+        """call when set_rule installs a new rule: forgets the results of the
+           old rule and makes the cells in states the new one lacks dead"""
+        transition = self._rule_transition()
+        self._nodes.res[:] = -1
+        if self._transition is not None and transition.num_states < self._transition.num_states:
+            self._flush()
+            memo = np.full(int(self._nodes.meta[COUNT]), -1, np.int32)
+            self._root = self._call(drop_states, self._root, self._root_level, transition.num_states, memo)
+            self._pop_memo.clear()
+        self._transition = transition
+        self._max_cell_states = cint(transition.num_states)
+
+    def _result(self) -> int:
+        return result(self._nodes, self._root, self._root_level, self._transition, self._boards)
+
+    # macrocell format
+
+    def read_macrocell(self, lines: typing.Iterable[str]) -> str | None:
+        """read a pattern in macrocell format, with level 1 lines giving the
+           states of 2x2 leaves; returns an error message or None"""
+        index = [0]               # node index of each line; 0 is the empty node
+        levels = [0]
+        root = root_level = 0
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith('[M2]'):
+                continue
+            if line.startswith('#'):
+                if line.startswith('#R'):
+                    err = self.set_rule(line[2:].strip())
+                    if err:
+                        return err
+                elif line.startswith('#G'):
+                    try:
+                        self._generation = int(line[2:].strip())
+                    except ValueError:
+                        return "Bad generation count in macrocell."
+                continue
+            try:
+                k, *children = (int(v) for v in line.split())
+            except ValueError:
+                return "Parse error in readmacrocell."
+            if len(children) < 4:
+                return "Parse error in readmacrocell."
+            if k < LEAF_LEVEL:
+                return "Oops; bad depth in readmacrocell."
+            children = children[:4]
+            if k == LEAF_LEVEL:
+                if any(not 0 <= s < self._max_cell_states.value for s in children):
+                    return "Cell state values too high for this algorithm."
+                root, root_level = self._find(*children, LEAF_LEVEL), LEAF_LEVEL
+            else:
+                quad = []
+                for child in children:
+                    if child < 0 or child >= len(index) or (child and levels[child] != k - 1):
+                        return "Node out of range in readmacrocell."
+                    quad.append(index[child] if child else self._empty_node(k - 1))
+                root, root_level = self._find(*quad, k), k
+            index.append(root)
+            levels.append(root_level)
+        self._pending.clear()
+        self._pop_memo.clear()
+        if not root:
+            # an empty pattern is allowed
+            root, root_level = self._empty_node(BASE_LEVEL), BASE_LEVEL
+        while root_level < BASE_LEVEL:
+            e = self._empty_node(root_level)
+            root, root_level = self._find(root, e, e, e, root_level + 1), root_level + 1
+        self._root, self._root_level = root, root_level
+        return None
+
+    def write_native_format(self, os: io.StringIO, comments: str) -> str | None:
+        """write the universe in macrocell format"""
+        self._flush()
+        os.write("[M2] (pylife)\n")
+        os.write("#R " + self.get_rule() + "\n")
+        if self._generation:
+            os.write("#G " + str(self._generation) + "\n")
+        for line in (comments or "").splitlines():
+            os.write(line if line.startswith("#C") else "#C " + line)
+            os.write("\n")
+        written: dict[int, int] = {}
+
+        def write_node(n: int, k: int) -> int:
+            if n == self._empty_node(k):
+                return 0
+            if n not in written:
+                if k == LEAF_LEVEL:
+                    ids = self._children(n)
+                else:
+                    ids = [write_node(q, k - 1) for q in self._children(n)]
+                os.write("{} {} {} {} {}\n".format(k, *ids))
+                written[n] = len(written) + 1
+            return written[n]
+
+        write_node(self._root, self._root_level)
+        return None
@@ -0,0 +1,986 @@
+from __future__ import annotations
+
+import collections
+import typing
+from time import monotonic as get_time
+
+import numba as nb
+import numpy as np
+
+import base.liferules as liferules
+import base.util as util
+from base.lifealgo import *
+
+
+# Hashlife keeps the universe as a quadtree of canonical nodes.  A node of
+# level k is 2^k cells on a side.  4x4 leaves (level 2) are not stored at
+# all: they are their own 16-bit bitmaps (bit y * 4 + x), so an 8x8 node
+# (level 3) holds four bitmaps and every larger node holds four node indices.
+#
+# Nodes live in a struct-of-arrays store: parallel int32 arrays for the four
+# children, the node level, the cached result (the center of the node,
+# advanced by the current step) and the hash chain link, plus the memoised
+# population.  A chained hash table over the children makes every node
+# canonical, so equal subtrees share a single index.  Index 0 is never used
+# so that it can mean "no node".
+LEAF_LEVEL = 2
+BASE_LEVEL = 3
+NATIVE_LEVEL = 30       # below this coordinates and populations fit in int64
+INITIAL_NODES = 1 << 16
+
+# The store grows by doubling until it reaches max_memory; after that a full
+# store is garbage collected.  Only nodes reachable from the root, the
+# timeline frames, the clipboard, a cached result or the save stack survive,
+# and they are slid down to the front of the arrays.  If a collection frees
+# less than 1/GC_MIN_FREE of the store we grow past the limit rather than
+# thrash.
+#
+# A step that overflows the store unwinds, collects and starts again from
+# the root.  Like Golly's save stack, every result() call it unwinds through
+# pushes the nodes it had found onto the save stack, so their cached results
+# survive the collection and the next attempt gets further.
+NODE_BYTES = 4 * 4 + 2 + 4 + 4 + 8 + 4      # children, level, result, chain, population, hash head
+DEFAULT_MAX_MEMORY = 256                    # megabytes
+MIN_MAX_MEMORY = 10
+GC_MIN_FREE = 10
+SAVE_SIZE = 1 << 12                         # room for 10 nodes a level
+
+# slots of the meta array
+COUNT = 0               # next free node index
+STEP_EXP = 1            # result() advances nodes by 2^STEP_EXP generations
+OVERFLOW = 2            # set when a node could not be allocated
+CALCULATED = 3          # number of results computed so far
+SAVED = 4               # nodes on the save stack
+META_SIZE = 5
+
+Nodes = collections.namedtuple("Nodes", ["nw", "ne", "sw", "se", "lev", "res", "nxt", "pop", "hashtab", "saved",
+                                         "meta"])
+
+
+def hash_size(capacity: int) -> int:
+    """the hash table has a power of two heads, at least one per node"""
+    return 1 << max(capacity - 1, 1).bit_length()
+
+
+def new_nodes(capacity: int) -> Nodes:
+    """allocate an empty node store"""
+    nodes = Nodes(nw=np.zeros(capacity, np.int32), ne=np.zeros(capacity, np.int32),
+                  sw=np.zeros(capacity, np.int32), se=np.zeros(capacity, np.int32),
+                  lev=np.zeros(capacity, np.int16), res=np.full(capacity, -1, np.int32),
+                  nxt=np.zeros(capacity, np.int32), pop=np.full(capacity, -1, np.int64),
+                  hashtab=np.zeros(hash_size(capacity), np.int32), saved=np.zeros(SAVE_SIZE, np.int32),
+                  meta=np.zeros(META_SIZE, np.int64))
+    nodes.meta[COUNT] = 1
+    nodes.meta[STEP_EXP] = -1
+    return nodes
+
+
+@nb.njit
+def node_hash(a, b, c, d, k, mask):
+    h = np.int64(a) * 0x9E3779B1 + np.int64(b) * 0x85EBCA77 + np.int64(c) * 0xC2B2AE3D
+    h = h + np.int64(d) * 0x27D4EB2F + np.int64(k)
+    return (h ^ (h >> 29)) & mask
+
+
+@nb.njit
+def find_node(nodes, a, b, c, d, k):
+    """return the canonical node with the given children, creating it if
+       needed; returns -1 (and sets the OVERFLOW flag) if the store is full"""
+    h = node_hash(a, b, c, d, k, len(nodes.hashtab) - 1)
+    p = nodes.hashtab[h]
+    while p:
+        if nodes.nw[p] == a and nodes.ne[p] == b and nodes.sw[p] == c and nodes.se[p] == d and nodes.lev[p] == k:
+            return p
+        p = nodes.nxt[p]
+    p = nodes.meta[COUNT]
+    if p >= len(nodes.nw):
+        nodes.meta[OVERFLOW] = 1
+        return -1
+    nodes.meta[COUNT] = p + 1
+    nodes.nw[p], nodes.ne[p], nodes.sw[p], nodes.se[p] = a, b, c, d
+    nodes.lev[p] = k
+    nodes.res[p] = -1
+    nodes.pop[p] = -1
+    nodes.nxt[p] = nodes.hashtab[h]
+    nodes.hashtab[h] = p
+    return p
+
+
+@nb.njit
+def rehash(nodes):
+    """rebuild the hash chains, eg. after the arrays were resized"""
+    nodes.hashtab[:] = 0
+    mask = len(nodes.hashtab) - 1
+    for p in range(1, nodes.meta[COUNT]):
+        h = node_hash(nodes.nw[p], nodes.ne[p], nodes.sw[p], nodes.se[p], nodes.lev[p], mask)
+        nodes.nxt[p] = nodes.hashtab[h]
+        nodes.hashtab[h] = p
+
+
+@nb.njit
+def push_saved(nodes, m):
+    sp = nodes.meta[SAVED]
+    if m > 0 and sp < len(nodes.saved):
+        nodes.saved[sp] = m
+        nodes.meta[SAVED] = sp + 1
+
+
+@nb.njit
+def save(nodes, n, n01, n10, n11, n12, n21, q00, q01, q10, q11):
+    """push the nodes found by a result() call that overflowed onto the
+       save stack, so the collection that follows keeps its partial work;
+       returns -1 for the caller to pass on"""
+    push_saved(nodes, n)
+    push_saved(nodes, n01)
+    push_saved(nodes, n10)
+    push_saved(nodes, n11)
+    push_saved(nodes, n12)
+    push_saved(nodes, n21)
+    push_saved(nodes, q00)
+    push_saved(nodes, q01)
+    push_saved(nodes, q10)
+    push_saved(nodes, q11)
+    return -1
+
+
+@nb.njit
+def mark_nodes(nodes, roots, bottom):
+    """flag every node reachable from roots through children or cached
+       results; nodes of level bottom or below have no nodes as children"""
+    count = nodes.meta[COUNT]
+    marked = np.zeros(count, np.bool_)
+    stack = np.empty(5 * count + len(roots), np.int32)
+    sp = 0
+    for r in roots:
+        if r > 0:
+            stack[sp] = r
+            sp += 1
+    while sp:
+        sp -= 1
+        n = stack[sp]
+        if marked[n]:
+            continue
+        marked[n] = True
+        if nodes.lev[n] > bottom:
+            stack[sp], stack[sp + 1], stack[sp + 2], stack[sp + 3] = nodes.nw[n], nodes.ne[n], nodes.sw[n], nodes.se[n]
+            sp += 4
+            if nodes.res[n] > 0:
+                stack[sp] = nodes.res[n]
+                sp += 1
+    return marked
+
+
+@nb.njit
+def compact_nodes(nodes, marked, bottom):
+    """slide the marked nodes down to the front of the store, renumbering
+       the children and results of those above level bottom; returns the
+       old to new index map (0 = freed)"""
+    count = nodes.meta[COUNT]
+    remap = np.zeros(count, np.int32)
+    t = 1
+    for p in range(1, count):
+        if marked[p]:
+            remap[p] = t
+            t += 1
+    for p in range(1, count):
+        t = remap[p]
+        if not t:
+            continue
+        k = nodes.lev[p]
+        if k > bottom:
+            nodes.nw[t], nodes.ne[t] = remap[nodes.nw[p]], remap[nodes.ne[p]]
+            nodes.sw[t], nodes.se[t] = remap[nodes.sw[p]], remap[nodes.se[p]]
+            r = nodes.res[p]
+            nodes.res[t] = remap[r] if r > 0 else -1
+        else:
+            nodes.nw[t], nodes.ne[t], nodes.sw[t], nodes.se[t] = nodes.nw[p], nodes.ne[p], nodes.sw[p], nodes.se[p]
+            nodes.res[t] = nodes.res[p]
+        nodes.lev[t] = k
+        nodes.pop[t] = nodes.pop[p]
+    used = remap.max() + 1
+    nodes.nw[used:count] = 0
+    nodes.ne[used:count] = 0
+    nodes.sw[used:count] = 0
+    nodes.se[used:count] = 0
+    nodes.lev[used:count] = 0
+    nodes.res[used:count] = -1
+    nodes.pop[used:count] = -1
+    nodes.meta[COUNT] = used
+    rehash(nodes)
+    return remap
+
+
+# 8x8 boards: the four leaves of a level 3 node packed into a uint64 with
+# bit y * 8 + x; generations are computed with the rule's leaf table, which
+# maps any 4x4 block of the board to the next state of its center 2x2
+
+NIBBLE = np.uint64(15)
+
+
+@nb.njit
+def leaves_to_board(a, b, c, d):
+    board = np.uint64(0)
+    for r in range(4):
+        shift = np.uint64(4 * r)
+        top, bottom = np.uint64(8 * r), np.uint64(8 * r + 32)
+        board |= ((np.uint64(a) >> shift) & NIBBLE) << top
+        board |= ((np.uint64(b) >> shift) & NIBBLE) << (top + np.uint64(4))
+        board |= ((np.uint64(c) >> shift) & NIBBLE) << bottom
+        board |= ((np.uint64(d) >> shift) & NIBBLE) << (bottom + np.uint64(4))
+    return board
+
+
+@nb.njit
+def board_center(board):
+    """the center 4x4 of a board as a leaf"""
+    leaf = 0
+    for r in range(4):
+        leaf |= np.int64((board >> np.uint64(8 * (r + 2) + 2)) & NIBBLE) << (4 * r)
+    return leaf
+
+
+@nb.njit
+def board_window(board, x, y):
+    """the 4x4 block of a board with its top left corner at (x, y), as a leaf"""
+    leaf = 0
+    for r in range(4):
+        leaf |= np.int64((board >> np.uint64(8 * (y + r) + x)) & NIBBLE) << (4 * r)
+    return leaf
+
+
+@nb.njit
+def board_step(board, table):
+    """next generation of the inner 6x6 of a board; the outer ring is cleared"""
+    out = np.uint64(0)
+    for y in range(0, 6, 2):
+        for x in range(0, 6, 2):
+            r = np.uint64(table[board_window(board, x, y)])
+            out |= ((r & np.uint64(3)) << np.uint64(8 * (y + 1) + x + 1)) | \
+                ((r >> np.uint64(2)) << np.uint64(8 * (y + 2) + x + 1))
+    return out
+
+
+@nb.njit
+def board_center_step(board, table):
+    """next generation of the center 4x4 of a board, as a leaf"""
+    leaf = 0
+    for y in (1, 3):
+        for x in (1, 3):
+            r = np.int64(table[board_window(board, x, y)])
+            leaf |= ((r & 3) << ((y - 1) * 4 + x - 1)) | ((r >> 2) << (y * 4 + x - 1))
+    return leaf
+
+
+@nb.njit
+def center(nodes, m, k):
+    """the centered level k-1 subnode of node m, without advancing time"""
+    if k == BASE_LEVEL:
+        return board_center(leaves_to_board(nodes.nw[m], nodes.ne[m], nodes.sw[m], nodes.se[m]))
+    return find_node(nodes, nodes.se[nodes.nw[m]], nodes.sw[nodes.ne[m]],
+                     nodes.ne[nodes.sw[m]], nodes.nw[nodes.se[m]], k - 1)
+
+
+@nb.njit
+def result(nodes, n, k, table):
+    """The level k-1 center of node n, advanced by 2^min(k-2, STEP_EXP)
+       generations.  Returns -1 if the store overflowed; results computed
+       so far stay cached and the nodes holding them are saved, so the
+       caller can make room and call again."""
+    r = nodes.res[n]
+    if r >= 0:
+        return r
+    j = nodes.meta[STEP_EXP]
+    if k == BASE_LEVEL:
+        board = leaves_to_board(nodes.nw[n], nodes.ne[n], nodes.sw[n], nodes.se[n])
+        if j >= 1:
+            board = board_step(board, table)
+        r = board_center_step(board, table)
+    else:
+        a, b, c, d = nodes.nw[n], nodes.ne[n], nodes.sw[n], nodes.se[n]
+        k1 = k - 1
+        n01 = find_node(nodes, nodes.ne[a], nodes.nw[b], nodes.se[a], nodes.sw[b], k1)
+        n10 = find_node(nodes, nodes.sw[a], nodes.se[a], nodes.nw[c], nodes.ne[c], k1)
+        n11 = find_node(nodes, nodes.se[a], nodes.sw[b], nodes.ne[c], nodes.nw[d], k1)
+        n12 = find_node(nodes, nodes.sw[b], nodes.se[b], nodes.nw[d], nodes.ne[d], k1)
+        n21 = find_node(nodes, nodes.ne[c], nodes.nw[d], nodes.se[c], nodes.sw[d], k1)
+        if min(n01, n10, n11, n12, n21) < 0:
+            return save(nodes, n, n01, n10, n11, n12, n21, 0, 0, 0, 0)
+        if k - 2 <= j:
+            # full speed: both halves of the step advance time
+            r00, r01, r02 = result(nodes, a, k1, table), \
+                result(nodes, n01, k1, table), result(nodes, b, k1, table)
+            r10, r11, r12 = result(nodes, n10, k1, table), \
+                result(nodes, n11, k1, table), result(nodes, n12, k1, table)
+            r20, r21, r22 = result(nodes, c, k1, table), \
+                result(nodes, n21, k1, table), result(nodes, d, k1, table)
+        else:
+            # the step is smaller than this node can do; only the second half advances
+            r00, r01, r02 = center(nodes, a, k1), center(nodes, n01, k1), center(nodes, b, k1)
+            r10, r11, r12 = center(nodes, n10, k1), center(nodes, n11, k1), center(nodes, n12, k1)
+            r20, r21, r22 = center(nodes, c, k1), center(nodes, n21, k1), center(nodes, d, k1)
+        if min(r00, r01, r02, r10, r11, r12, r20, r21, r22) < 0:
+            return save(nodes, n, n01, n10, n11, n12, n21, 0, 0, 0, 0)
+        q00 = find_node(nodes, r00, r01, r10, r11, k1)
+        q01 = find_node(nodes, r01, r02, r11, r12, k1)
+        q10 = find_node(nodes, r10, r11, r20, r21, k1)
+        q11 = find_node(nodes, r11, r12, r21, r22, k1)
+        if min(q00, q01, q10, q11) < 0:
+            return save(nodes, n, n01, n10, n11, n12, n21, q00, q01, q10, q11)
+        s00, s01 = result(nodes, q00, k1, table), result(nodes, q01, k1, table)
+        s10, s11 = result(nodes, q10, k1, table), result(nodes, q11, k1, table)
+        r = -1
+        if min(s00, s01, s10, s11) >= 0:
+            r = find_node(nodes, s00, s01, s10, s11, k1)
+        if r < 0:
+            return save(nodes, n, n01, n10, n11, n12, n21, q00, q01, q10, q11)
+    nodes.res[n] = r
+    nodes.meta[CALCULATED] += 1
+    return r
+
+
+@nb.njit
+def leaf_population(leaf):
+    count = 0
+    while leaf:
+        leaf &= leaf - 1
+        count += 1
+    return count
+
+
+@nb.njit
+def population(nodes, n, k):
+    """number of live cells in a node of level <= NATIVE_LEVEL (memoised)"""
+    if k == LEAF_LEVEL:
+        return leaf_population(n)
+    if nodes.pop[n] < 0:
+        nodes.pop[n] = population(nodes, nodes.nw[n], k - 1) + population(nodes, nodes.ne[n], k - 1) + \
+            population(nodes, nodes.sw[n], k - 1) + population(nodes, nodes.se[n], k - 1)
+    return nodes.pop[n]
+
+
+@nb.njit
+def set_bit(nodes, n, k, x, y, state):
+    """return node n with the cell at offset (x, y) set to state, or -1"""
+    if k == LEAF_LEVEL:
+        bit = 1 << (y * 4 + x)
+        return (n | bit) if state else (n & ~bit)
+    half = np.int64(1) << (k - 1)
+    a, b, c, d = nodes.nw[n], nodes.ne[n], nodes.sw[n], nodes.se[n]
+    if y < half:
+        if x < half:
+            a = set_bit(nodes, a, k - 1, x, y, state)
+        else:
+            b = set_bit(nodes, b, k - 1, x - half, y, state)
+    elif x < half:
+        c = set_bit(nodes, c, k - 1, x, y - half, state)
+    else:
+        d = set_bit(nodes, d, k - 1, x - half, y - half, state)
+    if min(a, b, c, d) < 0:
+        return -1
+    return find_node(nodes, a, b, c, d, k)
+
+
+@nb.njit
+def set_bits(nodes, n, k, xs, ys, states):
+    """set many cells at once; offsets are relative to the node's corner"""
+    for i in range(len(xs)):
+        n = set_bit(nodes, n, k, xs[i], ys[i], states[i])
+        if n < 0:
+            return -1
+    return n
+
+
+@nb.njit
+def count_in_rect(nodes, n, k, top, left, bottom, right):
+    """number of live cells of a node of level <= NATIVE_LEVEL inside a
+       rectangle of offsets from its corner"""
+    size = np.int64(1) << k
+    if bottom < 0 or right < 0 or top >= size or left >= size:
+        return 0
+    if k == LEAF_LEVEL:
+        count = 0
+        for y in range(max(top, 0), min(bottom, 3) + 1):
+            for x in range(max(left, 0), min(right, 3) + 1):
+                count += (n >> (y * 4 + x)) & 1
+        return count
+    if population(nodes, n, k) == 0:
+        return 0
+    if top <= 0 and left <= 0 and bottom >= size - 1 and right >= size - 1:
+        return population(nodes, n, k)
+    half = size >> 1
+    return count_in_rect(nodes, nodes.nw[n], k - 1, top, left, bottom, right) + \
+        count_in_rect(nodes, nodes.ne[n], k - 1, top, left - half, bottom, right - half) + \
+        count_in_rect(nodes, nodes.sw[n], k - 1, top - half, left, bottom - half, right) + \
+        count_in_rect(nodes, nodes.se[n], k - 1, top - half, left - half, bottom - half, right - half)
+
+
+@nb.njit
+def cells_in_rect(nodes, n, k, oy, ox, top, left, bottom, right, xs, ys, i):
+    """store the offsets of the live cells of a node (whose corner is at
+       offset (ox, oy)) inside a rectangle of offsets into xs and ys from
+       index i on; return the next free index"""
+    size = np.int64(1) << k
+    if bottom < oy or right < ox or top >= oy + size or left >= ox + size:
+        return i
+    if k == LEAF_LEVEL:
+        for y in range(4):
+            for x in range(4):
+                if (n >> (y * 4 + x)) & 1 and top <= oy + y <= bottom and left <= ox + x <= right:
+                    xs[i], ys[i] = ox + x, oy + y
+                    i += 1
+        return i
+    if population(nodes, n, k) == 0:
+        return i
+    half = size >> 1
+    i = cells_in_rect(nodes, nodes.nw[n], k - 1, oy, ox, top, left, bottom, right, xs, ys, i)
+    i = cells_in_rect(nodes, nodes.ne[n], k - 1, oy, ox + half, top, left, bottom, right, xs, ys, i)
+    i = cells_in_rect(nodes, nodes.sw[n], k - 1, oy + half, ox, top, left, bottom, right, xs, ys, i)
+    return cells_in_rect(nodes, nodes.se[n], k - 1, oy + half, ox + half, top, left, bottom, right, xs, ys, i)
+
+
+@nb.njit
+def edges(nodes, n, k, memo):
+    """(top, left, bottom, right) offsets of the live cells in a nonempty
+       node of level <= NATIVE_LEVEL; memo caches them per node index"""
+    if k == LEAF_LEVEL:
+        top, left, bottom, right = 4, 4, -1, -1
+        for y in range(4):
+            for x in range(4):
+                if (n >> (y * 4 + x)) & 1:
+                    top, left = min(top, y), min(left, x)
+                    bottom, right = max(bottom, y), max(right, x)
+        return top, left, bottom, right
+    if memo[n, 0] >= 0:
+        return memo[n, 0], memo[n, 1], memo[n, 2], memo[n, 3]
+    half = np.int64(1) << (k - 1)
+    top, left = np.int64(1) << k, np.int64(1) << k
+    bottom, right = np.int64(-1), np.int64(-1)
+    children = (nodes.nw[n], nodes.ne[n], nodes.sw[n], nodes.se[n])
+    for i in range(4):
+        child = children[i]
+        if (child == 0) if k == BASE_LEVEL else population(nodes, child, k - 1) == 0:
+            continue
+        t, l, b, r = edges(nodes, child, k - 1, memo)
+        oy, ox = (i >> 1) * half, (i & 1) * half
+        top, left = min(top, t + oy), min(left, l + ox)
+        bottom, right = max(bottom, b + oy), max(right, r + ox)
+    memo[n, 0], memo[n, 1], memo[n, 2], memo[n, 3] = top, left, bottom, right
+    return top, left, bottom, right
+
+
+class HLifeAlgo(LifeAlgo):
+    """HashLife: a quadtree of canonical nodes in NumPy arrays, stepped by
+       memoised recursion; steps can be any power of two generations."""
+    _nodes: Nodes
+    _root: int
+    _root_level: int
+    _empty: list[int]           # the empty node of each level (index 2 is the empty leaf)
+    _pending: dict[tuple[int, int], int]
+    _rules: liferules.LifeRules
+    _pop_memo: dict[int, int]
+    _max_memory: int            # megabytes
+    _clipboard: int
+    _in_gc: bool
+    _need_pop: bool
+    # the lowest level stored as nodes, whose children are leaf bitmaps
+    _node_level = BASE_LEVEL
+
+    def __init__(self):
+        super(HLifeAlgo, self).__init__()
+        self._max_cell_states = cint(2)
+        self._increment = 1
+        self._rules = liferules.LifeRules()
+        self._nodes = new_nodes(INITIAL_NODES)
+        self._empty = [0, 0, 0]
+        self._root = self._empty_node(BASE_LEVEL)
+        self._root_level = BASE_LEVEL
+        self._pending = {}
+        self._pop_memo = {}
+        self._max_memory = DEFAULT_MAX_MEMORY
+        self._clipboard = 0
+        self._in_gc = False
+        self._need_pop = False
+
+    # node store management
+
+    def _max_nodes(self) -> int:
+        return (self._max_memory << 20) // NODE_BYTES
+
+    def _resize(self, capacity: int) -> None:
+        """reallocate the node store; capacity must hold the nodes in use"""
+        old = self._nodes
+        used = int(old.meta[COUNT])
+        resized = {}
+        for name, array in old._asdict().items():
+            if name in ("hashtab", "saved", "meta"):
+                continue
+            resized[name] = np.full(capacity, -1, array.dtype) if name in ("res", "pop") \
+                else np.zeros(capacity, array.dtype)
+            resized[name][:used] = array[:used]
+        self._nodes = Nodes(hashtab=np.zeros(hash_size(capacity), np.int32), saved=old.saved, meta=old.meta.copy(),
+                            **resized)
+        rehash(self._nodes)
+
+    def _make_room(self, collect: bool = True) -> None:
+        """The store is full: grow it up to max_memory, then collect
+           garbage.  Callers that hold node indices in local variables
+           must pass collect=False, since collecting renumbers nodes."""
+        capacity, limit = len(self._nodes.nw), self._max_nodes()
+        if capacity < limit:
+            self._resize(min(2 * capacity, limit))
+            return
+        if collect:
+            self._collect_garbage()
+            if int(self._nodes.meta[COUNT]) * GC_MIN_FREE <= capacity * (GC_MIN_FREE - 1):
+                return
+        util.life_warning("Node store is over the memory limit; growing it anyway.")
+        self._resize(2 * capacity)
+
+    def _collect_garbage(self, *extra: int) -> list[int]:
+        """Free every node not reachable from the root, the timeline, the
+           clipboard, the empty nodes, the save stack or the extra nodes
+           given, and compact the store.  Returns the extra nodes renumbered."""
+        started = get_time()
+        self._in_gc = True
+        tl = self._timeline
+        frames = tl.frames[:tl.frame_count.value]
+        saved = self._nodes.saved[:self._nodes.meta[SAVED]]
+        k = self._node_level
+        roots = np.array([self._root, self._clipboard, *frames, *self._empty[k:], *saved, *extra], np.int32)
+        before = int(self._nodes.meta[COUNT])
+        remap = compact_nodes(self._nodes, mark_nodes(self._nodes, roots, k), k).tolist()
+        self._root = remap[self._root]
+        self._clipboard = remap[self._clipboard]
+        tl.frames[:len(frames)] = [remap[n] for n in frames]
+        del tl.frames[len(frames):]
+        self._empty[k:] = [remap[n] for n in self._empty[k:]]
+        self._pop_memo.clear()
+        after = int(self._nodes.meta[COUNT])
+        if len(self._nodes.nw) > self._max_nodes() >= 2 * after:
+            self._resize(self._max_nodes())
+        self._in_gc = False
+        elapsed = get_time() - started
+        self.running_hperf.gc_count += 1
+        self.running_hperf.gc_time += elapsed
+        self.running_hperf.gc_reclaimed += (before - after) * NODE_BYTES
+        if self._verbose:
+            util.life_status("GC #{}: kept {} of {} nodes in {:.3f}s".format(
+                int(self.running_hperf.gc_count), after - 1, before - 1, elapsed))
+        if self._need_pop:
+            self._need_pop = False
+            self._poller.update_pop()
+        return [remap[n] for n in extra]
+
+    def _call(self, fn: typing.Callable, *args) -> int:
+        """run a node store kernel, making room and retrying on overflow"""
+        while True:
+            r = fn(self._nodes, *args)
+            if not self._nodes.meta[OVERFLOW]:
+                return int(r)
+            self._nodes.meta[OVERFLOW] = 0
+            self._make_room(collect=False)
+
+    def _find(self, a: int, b: int, c: int, d: int, k: int) -> int:
+        return self._call(find_node, a, b, c, d, k)
+
+    def _empty_node(self, k: int) -> int:
+        while len(self._empty) <= k:
+            e = self._empty[-1]
+            self._empty.append(self._find(e, e, e, e, len(self._empty)))
+        return self._empty[k]
+
+    def _children(self, n: int) -> tuple[int, int, int, int]:
+        nodes = self._nodes
+        return int(nodes.nw[n]), int(nodes.ne[n]), int(nodes.sw[n]), int(nodes.se[n])
+
+    def _push_root(self) -> None:
+        """double the size of the universe, keeping the pattern centered"""
+        k = self._root_level
+        e = self._empty_node(k - 1)
+        a, b, c, d = self._children(self._root)
+        self._root = self._find(self._find(e, e, e, a, k), self._find(e, e, b, e, k),
+                                self._find(e, c, e, e, k), self._find(d, e, e, e, k), k + 1)
+        self._root_level = k + 1
+
+    def _pop_zeros(self) -> None:
+        """shrink the universe while its outer ring of grandchildren is empty"""
+        while self._root_level > BASE_LEVEL:
+            k = self._root_level
+            e = self._empty_node(k - 2)
+            a, b, c, d = (self._children(q) for q in self._children(self._root))
+            if any(g != e for g in (a[0], a[1], a[2], b[0], b[1], b[3], c[0], c[2], c[3], d[1], d[2], d[3])):
+                break
+            self._root = self._find(a[3], b[2], c[1], d[0], k - 1)
+            self._root_level = k - 1
+
+    def _half(self) -> int:
+        return 1 << (self._root_level - 1)
+
+    # cell access
+
+    def _flush(self) -> None:
+        """apply the cells buffered by set_cell to the tree"""
+        if not self._pending:
+            return
+        xs = np.fromiter((p[0] for p in self._pending), np.int64, len(self._pending))
+        ys = np.fromiter((p[1] for p in self._pending), np.int64, len(self._pending))
+        states = np.fromiter(self._pending.values(), np.int64, len(self._pending))
+        self._pending.clear()
+        self._set_bits(xs, ys, states)
+
+    def _set_bits(self, xs: np.ndarray, ys: np.ndarray, states: np.ndarray) -> None:
+        """set many cells in the tree, growing it to hold them"""
+        lo, hi = min(int(xs.min()), int(ys.min())), max(int(xs.max()), int(ys.max()))
+        while lo < -self._half() or hi >= self._half():
+            self._push_root()
+        if self._root_level < 63:
+            half = self._half()
+            self._root = self._call(set_bits, self._root, self._root_level, xs + half, ys + half, states)
+        else:
+            for x, y, state in zip(xs.tolist(), ys.tolist(), states.tolist()):
+                self._root = self._set_bit(self._root, self._root_level, x + self._half(), y + self._half(), state)
+        self._pop_memo.clear()
+
+    def _set_bit(self, n: int, k: int, x: int, y: int, state: int) -> int:
+        """set_bit for nodes too big for int64 offsets"""
+        if k < 63:
+            return self._call(set_bit, n, k, x, y, state)
+        half = 1 << (k - 1)
+        q = [*self._children(n)]
+        i = (y >= half) * 2 + (x >= half)
+        q[i] = self._set_bit(q[i], k - 1, x - (i & 1) * half, y - (i >> 1) * half, state)
+        return self._find(*q, k)
+
+    def set_cell(self, x: cint, y: cint, new_state: cint) -> cint:
+        new_state = as_int(new_state)
+        if new_state < 0 or new_state >= self._max_cell_states.value:
+            return cint(-1)
+        self._pending[as_int(x), as_int(y)] = new_state
+        return cint(0)
+
+    def get_cell(self, x: cint, y: cint) -> cint:
+        x, y = as_int(x), as_int(y)
+        if (x, y) in self._pending:
+            return cint(self._pending[x, y])
+        half = self._half()
+        x, y = x + half, y + half
+        if not (0 <= x < 2 * half and 0 <= y < 2 * half):
+            return cint(0)
+        n, k = self._root, self._root_level
+        while k > LEAF_LEVEL:
+            if n == self._empty_node(k):
+                return cint(0)
+            half = 1 << (k - 1)
+            i = (y >= half) * 2 + (x >= half)
+            n = self._children(n)[i]
+            x, y, k = x - (i & 1) * half, y - (i >> 1) * half, k - 1
+        return cint((n >> (y * 4 + x)) & 1)
+
+    def _next_in_row(self, n: int, k: int, x: int, y: int) -> int:
+        """offset of the first live cell at or right of (x, y) in node n, or -1"""
+        if n == self._empty_node(k) or x >= 1 << k:
+            return -1
+        if k == LEAF_LEVEL:
+            row = ((n >> (y * 4)) & 15) >> x << x
+            return (row & -row).bit_length() - 1 if row else -1
+        half = 1 << (k - 1)
+        a, b, c, d = self._children(n)
+        left, right = (a, b) if y < half else (c, d)
+        y = y if y < half else y - half
+        if x < half:
+            found = self._next_in_row(left, k - 1, x, y)
+            if found >= 0:
+                return found
+            x = half
+        found = self._next_in_row(right, k - 1, x - half, y)
+        return found + half if found >= 0 else -1
+
+    def next_cell(self, x: cint, y: cint, v: cint) -> cint:
+        """return the distance to the next live cell at or to the right of
+           (x, y) and store its state in v, or return -1 if there is none"""
+        self._flush()
+        x, y = as_int(x), as_int(y)
+        half = self._half()
+        if not -half <= y < half or x >= half:
+            return cint(-1)
+        start = max(x, -half)
+        found = self._next_in_row(self._root, self._root_level, start + half, y + half)
+        if found < 0:
+            return cint(-1)
+        if isinstance(v, cint):
+            v.value = 1
+        return cint(found - half - x)
+
+    def live_cells_in(self, top: int, left: int, bottom: int,
+                      right: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        self._flush()
+        if self._root_level > NATIVE_LEVEL:
+            return super(HLifeAlgo, self).live_cells_in(top, left, bottom, right)
+        half = self._half()
+        args = (self._root_level, top + half, left + half, bottom + half, right + half)
+        count = int(count_in_rect(self._nodes, self._root, *args))
+        xs, ys = np.empty(count, np.int64), np.empty(count, np.int64)
+        cells_in_rect(self._nodes, self._root, self._root_level, 0, 0, *args[1:], xs, ys, 0)
+        return xs - half, ys - half, np.ones(count, np.int64)
+
+    def set_cells(self, xs: np.ndarray, ys: np.ndarray, states: np.ndarray) -> cint:
+        if not self._valid_states(states):
+            return cint(-1)
+        self._flush()
+        if len(xs):
+            self._set_bits(np.asarray(xs, np.int64), np.asarray(ys, np.int64), np.asarray(states, np.int64))
+        return cint(0)
+
+    def end_of_pattern(self):
+        """call after set_cell calls"""
+        self._poller.bail_if_calculating()
+        self._flush()
+        return cint(0)
+
+    def _population(self, n: int, k: int) -> int:
+        if k <= NATIVE_LEVEL:
+            return int(population(self._nodes, n, k))
+        if n not in self._pop_memo:
+            self._pop_memo[n] = sum(self._population(q, k - 1) for q in self._children(n))
+        return self._pop_memo[n]
+
+    @property
+    def population(self) -> int:
+        if self._in_gc:
+            # can't count now; the poller is told once the GC is done
+            self._need_pop = True
+            return -1
+        self._flush()
+        return self._population(self._root, self._root_level)
+
+    def is_empty(self) -> cint:
+        self._flush()
+        return cint(self._root == self._empty_node(self._root_level))
+
+    def _edges(self, n: int, k: int, memo: np.ndarray, big_memo: dict) -> tuple[int, int, int, int] | None:
+        if n == self._empty_node(k):
+            return None
+        if k <= NATIVE_LEVEL:
+            return tuple(int(v) for v in edges(self._nodes, n, k, memo))
+        if n not in big_memo:
+            half, found = 1 << (k - 1), []
+            for i, q in enumerate(self._children(n)):
+                e = self._edges(q, k - 1, memo, big_memo)
+                if e is not None:
+                    oy, ox = (i >> 1) * half, (i & 1) * half
+                    found.append((e[0] + oy, e[1] + ox, e[2] + oy, e[3] + ox))
+            big_memo[n] = min(f[0] for f in found), min(f[1] for f in found), \
+                max(f[2] for f in found), max(f[3] for f in found)
+        return big_memo[n]
+
+    def find_edges(self) -> tuple[int, int, int, int]:
+        self._flush()
+        memo = np.full((int(self._nodes.meta[COUNT]), 4), -1, np.int64)
+        e = self._edges(self._root, self._root_level, memo, {})
+        if e is None:
+            return 0, 0, 0, 0
+        half = self._half()
+        return e[0] - half, e[1] - half, e[2] - half, e[3] - half
+
+    # rules and stepping
+
+    def set_rule(self, s: str) -> str | None:
+        err = self._rules.set_rule(s, self)
+        if err is None:
+            self._nodes.res[:] = -1
+        return err
+
+    def get_rule(self) -> str:
+        return self._rules.get_rule()
+
+    def hyper_capable(self) -> cint:
+        """can we do the gen count doubling? only hashlife"""
+        return cint(1)
+
+    def _set_step_exp(self, j: int) -> None:
+        """results are only valid for one step size; forget them on a change"""
+        if self._nodes.meta[STEP_EXP] != j:
+            self._nodes.res[:] = -1
+            self._nodes.meta[STEP_EXP] = j
+
+    def _result(self) -> int:
+        """run the result kernel on the root; -1 if the store overflowed"""
+        return result(self._nodes, self._root, self._root_level, self._rules.leaf_table)
+
+    def _run_pattern(self, j: int) -> None:
+        """advance the universe by 2^j generations"""
+        self._push_root()
+        self._push_root()
+        while self._root_level < j + 3:
+            self._push_root()
+        while True:
+            # the root and the save stack keep the partial work alive across a collection
+            r = self._result()
+            if not self._nodes.meta[OVERFLOW]:
+                break
+            self._nodes.meta[OVERFLOW] = 0
+            self._make_room()
+            self._nodes.meta[SAVED] = 0
+        self._root = int(r)
+        self._root_level -= 1
+        self._pop_zeros()
+        self._generation += 1 << j
+
+    def step(self) -> None:
+        """do inc gens; an increment of m * 2^j is done as m steps of 2^j"""
+        self._poller.bail_if_calculating()
+        self._flush()
+        inc = self._increment
+        if inc <= 0:
+            return
+        j = (inc & -inc).bit_length() - 1
+        self._set_step_exp(j)
+        calculated = int(self._nodes.meta[CALCULATED])
+        for _ in range(inc >> j):
+            if self._poller.poll():
+                break
+            self._run_pattern(j)
+        self._pop_memo.clear()
+        self.running_hperf.nodes_calculated += int(self._nodes.meta[CALCULATED]) - calculated
+        self.step_hperf, self.inc_hperf = self.running_hperf.report_step(
+            self.step_hperf, self.inc_hperf, float(self._generation), self._verbose)
+
+    @property
+    def max_memory(self) -> cint:
+        """never alloc more than this many megabytes for nodes"""
+        return cint(self._max_memory)
+
+    @max_memory.setter
+    def max_memory(self, value: int | cint) -> None:
+        limit = max(as_int(value), MIN_MAX_MEMORY)
+        if len(self._nodes.nw) * NODE_BYTES > limit << 20:
+            self._collect_garbage()
+            if int(self._nodes.meta[COUNT]) * NODE_BYTES > limit << 20:
+                util.life_warning("Sorry, more memory currently used than allowed.")
+                return
+            self._max_memory = limit
+            self._resize(self._max_nodes())
+        self._max_memory = limit
+
+    @property
+    def clipboard(self) -> int:
+        """A node (as returned by current_state) kept for the GUI, eg. a
+           copied selection; it survives garbage collection.  0 if none."""
+        return self._clipboard
+
+    @clipboard.setter
+    def clipboard(self, n: int) -> None:
+        self._clipboard = n
+
+    # timeline support
+
+    @property
+    def current_state(self) -> int:
+        self._flush()
+        return self._root
+
+    @current_state.setter
+    def current_state(self, n: int) -> None:
+        self._pending.clear()
+        self._pop_memo.clear()
+        self._root = n
+        self._root_level = int(self._nodes.lev[n])
+
+    # macrocell format
+
+    def read_macrocell(self, lines: typing.Iterable[str]) -> str | None:
+        """read a pattern in macrocell format; returns an error message or None"""
+        index = [0]               # node index of each line; 0 is the empty node
+        levels = [0]
+        root = root_level = 0
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith('[M2]'):
+                continue
+            if line.startswith('#'):
+                if line.startswith('#R'):
+                    err = self.set_rule(line[2:].strip())
+                    if err:
+                        return err
+                elif line.startswith('#G'):
+                    try:
+                        self._generation = int(line[2:].strip())
+                    except ValueError:
+                        return "Bad generation count in macrocell."
+                continue
+            if line[0] in '.*$':
+                leaves, x, y = [0, 0, 0, 0], 0, 0
+                for ch in line:
+                    if ch == '$':
+                        x, y = 0, y + 1
+                    elif ch in '.*':
+                        if x > 7 or y > 7:
+                            return "Illegal coordinates in readmacrocell."
+                        if ch == '*':
+                            leaves[(y >> 2) * 2 + (x >> 2)] |= 1 << ((y & 3) * 4 + (x & 3))
+                        x += 1
+                    else:
+                        return "Illegal character in readmacrocell."
+                root, root_level = self._find(*leaves, BASE_LEVEL), BASE_LEVEL
+            else:
+                try:
+                    k, *children = (int(v) for v in line.split())
+                except ValueError:
+                    return "Parse error in readmacrocell."
+                if len(children) != 4 or not BASE_LEVEL < k < 32767:
+                    return "Parse error in readmacrocell."
+                quad = []
+                for child in children:
+                    if child < 0 or child >= len(index) or (child and levels[child] != k - 1):
+                        return "Node out of range in readmacrocell."
+                    quad.append(index[child] if child else self._empty_node(k - 1))
+                root, root_level = self._find(*quad, k), k
+            index.append(root)
+            levels.append(root_level)
+        if not root:
+            return "No nodes in macrocell."
+        self._pending.clear()
+        self._pop_memo.clear()
+        self._root, self._root_level = root, root_level
+        return None
+
+    def write_native_format(self, os: io.StringIO, comments: str) -> str | None:
+        """write the universe in macrocell format"""
+        self._flush()
+        os.write("[M2] (pylife)\n")
+        os.write("#R " + self.get_rule() + "\n")
+        if self._generation:
+            os.write("#G " + str(self._generation) + "\n")
+        for line in (comments or "").splitlines():
+            os.write(line if line.startswith("#C") else "#C " + line)
+            os.write("\n")
+        written: dict[int, int] = {}
+
+        def write_leaf(n: int) -> str:
+            rows = []
+            for y in range(8):
+                row = "".join('*' if self._leaf_bit(n, x, y) else '.' for x in range(8)).rstrip('.')
+                rows.append(row)
+            while rows and not rows[-1]:
+                rows.pop()
+            return "$".join(rows) + "$"
+
+        def write_node(n: int, k: int) -> int:
+            if n == self._empty_node(k):
+                return 0
+            if n not in written:
+                if k == BASE_LEVEL:
+                    os.write(write_leaf(n) + "\n")
+                else:
+                    ids = [write_node(q, k - 1) for q in self._children(n)]
+                    os.write("{} {} {} {} {}\n".format(k, *ids))
+                written[n] = len(written) + 1
+            return written[n]
+
+        write_node(self._root, self._root_level)
+        return None
+
+    def _leaf_bit(self, n: int, x: int, y: int) -> int:
+        """cell (x, y) of a level 3 node"""
+        leaf = self._children(n)[(y >> 2) * 2 + (x >> 2)]
+        return (leaf >> ((y & 3) * 4 + (x & 3))) & 1
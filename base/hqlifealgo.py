@@ -1,53 +1,531 @@
-import numpy as np
+from __future__ import annotations
+
+
 import numba as nb
-import ctypes as ct
-from dataclasses import dataclass
-from numba.experimental import jitclass
-from lifealgo import *
-from lifepoll import LifePoll
-from cffi import FFI
+import numpy as np
 
+import base.liferules as liferules
+import base.rulekernels as rulekernels
+from base.lifealgo import *
 
 
-"""
-# @jitclass
-@dataclass()
-class Brick:  # 64 bytes
-    d = np.zeros(16, np.uint)
-
-
-# @jitclass
-@dataclass()
-class Tile:  # 32 bytes
-    b = np.array(4 * (Brick(),))
-    c = np.array(6 * (np.short(),))
-    flags = cint()
-    local_delta_forward = cint()
-
-
-@dataclass()
-class SuperTile:  # 44 bytes
-    d = np.array(8 * (Tile(),))
-    flags = cint()
-    pop = np.array((cint(), cint()))
-"""
+# The universe is held as a dense array of 32-bit words, 32 horizontally
+# adjacent cells per word; bit 0 is the leftmost cell of the word.  Rows of
+# words are grouped into bricks (8 rows of one word, 32x8 cells) and bricks
+# into tiles (4 bricks stacked vertically, 32x32 cells).  The array always
+# covers a whole number of tiles and keeps at least one empty tile of margin
+# around the pattern, so a generation can be computed over the whole array
+# at once with the cells beyond its edges taken as dead.
+#
+# The kernels are compiled with Numba to run their rows in parallel
+# (set_threads picks how many threads) and release the GIL, so stepping
+# can overlap with rendering or I/O in other threads.  Totalistic rules
+# are counted 64 cells at a time: two words make one 64-bit lane, and a
+# fixed network of full adders sums a lane's eight neighbor planes into
+# four count bits.  The hexagonal and von Neumann neighborhoods just leave
+# some planes out, and the triangular grid adds the cells two to either
+# side.  With a rule cache directory, each rule gets a kernel of its own
+# from rulekernels, cached on disk as machine code.
+WORD_BITS = 32
+BRICK_ROWS = 8
+TILE_ROWS = 4 * BRICK_ROWS
+
+CHANGED = 1          # tile flag: some cell of the tile changed in the last generation
+DENSE_FRACTION = 2   # step the whole array once 1/DENSE_FRACTION of the tiles are active
+
+
+def popcount(words: np.ndarray) -> int:
+    """number of set bits in an array of words"""
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(words).sum(dtype=np.int64))
+    return int(np.unpackbits(words.view(np.uint8)).sum(dtype=np.int64))
+
+
+def set_threads(threads: int) -> None:
+    """use this many threads in the step kernels (0 for one per core)"""
+    limit = nb.config.NUMBA_NUM_THREADS
+    nb.set_num_threads(min(threads, limit) if threads > 0 else limit)
+
+
+@nb.njit(inline="always")
+def full_add(a, b, c):
+    """bitwise full adder: the sum and carry bits of a + b + c"""
+    partial = a ^ b
+    return partial ^ c, (a & b) | (partial & c)
+
+
+@nb.njit(inline="always")
+def count_rule(b0, b1, b2, b3, center, birth, survival):
+    """the next state of 64 cells from the bits of their neighbor counts"""
+    born, kept = np.uint64(0), np.uint64(0)
+    for n in range(16):
+        if not ((birth | survival) >> n) & 1:
+            continue
+        m = b0 if n & 1 else ~b0
+        m &= b1 if n & 2 else ~b1
+        m &= b2 if n & 4 else ~b2
+        m &= b3 if n & 8 else ~b3
+        if (birth >> n) & 1:
+            born |= m
+        if (survival >> n) & 1:
+            kept |= m
+    return (born & ~center) | (kept & center)
+
+
+@nb.njit(inline="always")
+def lane_planes(line, w):
+    """Words w and w + 1 of a bordered row as a 64-bit lane (after an odd
+       last word, the border word fills the top half) and the lanes of
+       their west and east neighbors."""
+    one = np.uint64(1)
+    mid = np.uint64(line[w + 1]) | (np.uint64(line[w + 2]) << np.uint64(32))
+    west = (mid << one) | (np.uint64(line[w]) >> np.uint64(31))
+    east = mid >> one
+    if w + 3 < len(line):
+        east |= (np.uint64(line[w + 3]) & one) << np.uint64(63)
+    return west, mid, east
+
+
+@nb.njit(inline="always")
+def wide_planes(line, w):
+    """as lane_planes, the lanes of the cells two to the west and east"""
+    two = np.uint64(2)
+    mid = np.uint64(line[w + 1]) | (np.uint64(line[w + 2]) << np.uint64(32))
+    west = (mid << two) | (np.uint64(line[w]) >> np.uint64(30))
+    east = mid >> two
+    if w + 3 < len(line):
+        east |= (np.uint64(line[w + 3]) & np.uint64(3)) << np.uint64(62)
+    return west, east
+
+
+@nb.njit(inline="always")
+def plane_mask(neighbormask, p):
+    """all ones if position p of the 3x3 neighborhood is a neighbor"""
+    return np.uint64(0) - np.uint64((neighbormask >> p) & 1)
+
+
+@nb.njit(parallel=True, nogil=True, cache=True)
+def count_words(padded, birth, survival, neighbormask):
+    """Next generation of a batch of bordered blocks (blocks, rows + 2,
+       words + 2) under a totalistic rule.  Pairs of words are joined into
+       64-bit lanes, and the neighbor planes of a lane are added by a
+       network of full adders into the four bits of each cell's count; the
+       planes outside neighbormask (hexagonal or von Neumann) are cleared
+       first.  Bit n of birth and survival is set when a dead cell with n
+       neighbors is born, or a live one survives."""
+    blocks, rows, words = padded.shape[0], padded.shape[1] - 2, padded.shape[2] - 2
+    out = np.empty((blocks, rows, words), np.uint32)
+    keep = np.empty(9, np.uint64)
+    for p in range(9):
+        keep[p] = plane_mask(neighbormask, p)
+    for r in nb.prange(blocks * rows):
+        i, y = r // rows, r % rows
+        for w in range(0, words, 2):
+            nw, n, ne = lane_planes(padded[i, y], w)
+            west, center, east = lane_planes(padded[i, y + 1], w)
+            sw, s, se = lane_planes(padded[i, y + 2], w)
+            nw, n, ne = nw & keep[0], n & keep[1], ne & keep[2]
+            west, east = west & keep[3], east & keep[5]
+            sw, s, se = sw & keep[6], s & keep[7], se & keep[8]
+            s0, c0 = full_add(nw, n, ne)
+            s1, c1 = full_add(sw, s, se)
+            s2, c2 = west ^ east, west & east
+            b0, c3 = full_add(s0, s1, s2)
+            # c0 .. c3 each count two
+            t, d0 = full_add(c0, c1, c2)
+            b1, d1 = t ^ c3, t & c3
+            b2, b3 = d0 ^ d1, d0 & d1
+            lane = count_rule(b0, b1, b2, b3, center, birth, survival)
+            out[i, y, w] = np.uint32(lane & np.uint64(0xffffffff))
+            if w + 1 < words:
+                out[i, y, w + 1] = np.uint32(lane >> np.uint64(32))
+    return out
+
+
+@nb.njit(parallel=True, nogil=True, cache=True)
+def triangle_words(padded, birth, survival, parity):
+    """As count_words on the triangular grid, where parity is x + y & 1 of
+       the first inner cell.  Cells with even x + y count the two outer
+       cells of the row above and cells with odd x + y those of the row
+       below; a cell is only one of the two, so the pair of planes for
+       each side merges into one."""
+    blocks, rows, words = padded.shape[0], padded.shape[1] - 2, padded.shape[2] - 2
+    out = np.empty((blocks, rows, words), np.uint32)
+    for r in nb.prange(blocks * rows):
+        i, y = r // rows, r % rows
+        even = np.uint64(0x5555555555555555) if (y + parity) & 1 == 0 else np.uint64(0xaaaaaaaaaaaaaaaa)
+        odd = ~even
+        for w in range(0, words, 2):
+            nw, n, ne = lane_planes(padded[i, y], w)
+            nww, nee = wide_planes(padded[i, y], w)
+            west, center, east = lane_planes(padded[i, y + 1], w)
+            ww, ee = wide_planes(padded[i, y + 1], w)
+            sw, s, se = lane_planes(padded[i, y + 2], w)
+            sww, see = wide_planes(padded[i, y + 2], w)
+            far_west = (nww & even) | (sww & odd)
+            far_east = (nee & even) | (see & odd)
+            s0, c0 = full_add(nw, n, ne)
+            s1, c1 = full_add(sw, s, se)
+            s2, c2 = full_add(ww, west, east)
+            s3, c3 = full_add(ee, far_west, far_east)
+            t, k0 = full_add(s0, s1, s2)
+            b0, k1 = t ^ s3, t & s3
+            # c0 .. c3, k0 and k1 each count two
+            t0, u0 = full_add(c0, c1, c2)
+            t1, u1 = full_add(c3, k0, k1)
+            b1, u2 = t0 ^ t1, t0 & t1
+            # u0 .. u2 each count four
+            b2, b3 = full_add(u0, u1, u2)
+            lane = count_rule(b0, b1, b2, b3, center, birth, survival)
+            out[i, y, w] = np.uint32(lane & np.uint64(0xffffffff))
+            if w + 1 < words:
+                out[i, y, w + 1] = np.uint32(lane >> np.uint64(32))
+    return out
+
+
+@nb.njit(parallel=True, nogil=True, cache=True)
+def leaf_table_words(padded, table):
+    """Next generation of a batch of bordered blocks (blocks, rows + 2,
+       words + 2) by looking up each 2x2 group of cells, with its ring of
+       neighbors, in the rule's 4x4 -> 2x2 leaf table.  rows must be even."""
+    blocks, rows, words = padded.shape[0], padded.shape[1] - 2, padded.shape[2] - 2
+    out = np.empty((blocks, rows, words), np.uint32)
+    pairs = rows // 2
+    for p in nb.prange(blocks * pairs):
+        i, y = p // pairs, 2 * (p % pairs)
+        ext = np.empty(4, np.uint64)
+        for w in range(words):
+            # 34 cells of each of the four rows: the word and one cell either side
+            for r in range(4):
+                ext[r] = (np.uint64(padded[i, y + r, w]) >> np.uint64(31)) | \
+                    (np.uint64(padded[i, y + r, w + 1]) << np.uint64(1)) | \
+                    ((np.uint64(padded[i, y + r, w + 2]) & np.uint64(1)) << np.uint64(33))
+            top, bottom = np.uint32(0), np.uint32(0)
+            for b in range(16):
+                shift = np.uint64(2 * b)
+                leaf = ((ext[0] >> shift) & np.uint64(15)) | (((ext[1] >> shift) & np.uint64(15)) << np.uint64(4)) | \
+                    (((ext[2] >> shift) & np.uint64(15)) << np.uint64(8)) | \
+                    (((ext[3] >> shift) & np.uint64(15)) << np.uint64(12))
+                v = np.uint32(table[leaf])
+                top |= (v & np.uint32(3)) << np.uint32(2 * b)
+                bottom |= (v >> np.uint32(2)) << np.uint32(2 * b)
+            out[i, y, w] = top
+            out[i, y + 1, w] = bottom
+    return out
+
+
+def next_words(padded: np.ndarray, rules: liferules.LifeRules, parity: int = 0) -> np.ndarray:
+    """Compute the next generation of the inner part of a bordered block.
+       On the triangular grid parity is x + y & 1 of the first inner cell;
+       the engines keep their arrays on even coordinates, so it is 0."""
+    batch = np.ascontiguousarray(padded.reshape((-1,) + padded.shape[-2:]))
+    if not rules.totalistic:
+        # counting only works for totalistic rules; the table works for any
+        new = leaf_table_words(batch, rules.leaf_table)
+    else:
+        mask = rules.neighbormask
+        birth, survival = sum(1 << n for n in rules.birth), sum(1 << n for n in rules.survival)
+        kernel = rulekernels.rule_kernel(liferules.rule_cache.cache_dir, rules.birth, rules.survival, mask)
+        if mask == liferules.TRIANGULAR:
+            new = kernel(batch, parity) if kernel is not None else triangle_words(batch, birth, survival, parity)
+        else:
+            new = kernel(batch) if kernel is not None else count_words(batch, birth, survival, mask)
+    return new.reshape(padded.shape[:-2] + new.shape[-2:])
 
 
 class HQLifeAlgo(LifeAlgo):
+    """QuickLife: a bit-packed engine that computes generations with NumPy
+       bit operations over the brick array.
+
+       Like the C++ version it only recomputes tiles whose neighborhood
+       changed in the previous generation: a tile's flags record whether
+       it changed, local_delta_forward marks tiles edited by set_cell and
+       delta_forward forces a full recomputation (eg. after a rule change)."""
+    _cells: np.ndarray   # the universe plus a permanent border of empty words
+    _words: np.ndarray   # view of the universe; TILE_ROWS * n rows of m words
+    _x0: int             # universe coordinates of bit 0 of _words[0, 0]
+    _y0: int
+    _occupied: np.ndarray             # per tile: has live cells
+    _flags: np.ndarray                # per tile: CHANGED in the last generation
+    _local_delta_forward: np.ndarray  # per tile: edited since the last generation
+    _delta_forward: bool              # recompute every tile in the next generation
+    _population: int
+    _pop_valid: bool
+    _rules: liferules.LifeRules
+
     def __init__(self):
         super(HQLifeAlgo, self).__init__()
+        self._max_cell_states = cint(2)
+        self._increment = 1
+        self._rules = liferules.LifeRules()
+        self._x0 = -WORD_BITS
+        self._y0 = -TILE_ROWS
+        self._set_storage(np.zeros((3 * TILE_ROWS + 2, 3 + 2), np.uint32))
+        self._delta_forward = False
+        self._population = 0
+        self._pop_valid = True
+
+    # coordinates and storage management
+
+    def _set_storage(self, cells: np.ndarray) -> None:
+        """install a new bordered word array and reset the per tile data"""
+        self._cells = cells
+        self._words = cells[1:-1, 1:-1]
+        self._occupied = self._tile_view(self._words).any(axis=1)
+        self._flags = np.zeros(self._occupied.shape, np.uint8)
+        self._local_delta_forward = self._occupied.copy()
+
+    @staticmethod
+    def _tile_view(words: np.ndarray) -> np.ndarray:
+        """view words as (tile rows, TILE_ROWS, tile columns)"""
+        return words.reshape(words.shape[0] // TILE_ROWS, TILE_ROWS, words.shape[1])
+
+    def _locate(self, x: int, y: int) -> tuple[int, int, int]:
+        """return row, word column and bit of a cell (possibly out of range)"""
+        dx = x - self._x0
+        return y - self._y0, dx >> 5, dx & 31
+
+    def _tiles_shape(self) -> tuple[int, int]:
+        return self._occupied.shape
+
+    def _resize_tiles(self, top: int, left: int, bottom: int, right: int) -> None:
+        """add (or remove, if negative) whole tiles on each side of the array"""
+        ty, tx = self._tiles_shape()
+        new_ty, new_tx = ty + top + bottom, tx + left + right
+        cells = np.zeros((new_ty * TILE_ROWS + 2, new_tx + 2), np.uint32)
+        src_r0, dst_r0 = max(0, -top) * TILE_ROWS, max(0, top) * TILE_ROWS
+        src_c0, dst_c0 = max(0, -left), max(0, left)
+        rows = min(ty * TILE_ROWS - src_r0, new_ty * TILE_ROWS - dst_r0)
+        cols = min(tx - src_c0, new_tx - dst_c0)
+        cells[1 + dst_r0:1 + dst_r0 + rows, 1 + dst_c0:1 + dst_c0 + cols] = \
+            self._words[src_r0:src_r0 + rows, src_c0:src_c0 + cols]
+        flags, local_delta_forward = self._flags, self._local_delta_forward
+        self._set_storage(cells)
+        # carry the change flags over to the tiles' new positions
+        src_t0, dst_t0 = max(0, -top), max(0, top)
+        tile_rows = rows // TILE_ROWS
+        self._flags[dst_t0:dst_t0 + tile_rows, dst_c0:dst_c0 + cols] = \
+            flags[src_t0:src_t0 + tile_rows, src_c0:src_c0 + cols]
+        self._local_delta_forward[dst_t0:dst_t0 + tile_rows, dst_c0:dst_c0 + cols] = \
+            local_delta_forward[src_t0:src_t0 + tile_rows, src_c0:src_c0 + cols]
+        self._y0 -= top * TILE_ROWS
+        self._x0 -= left * WORD_BITS
+
+    def _ensure_cell(self, x: int, y: int) -> None:
+        """grow the array so the cell has a tile of margin on every side;
+           grow generously so that loading a pattern cell by cell stays cheap"""
+        ty, tx = self._tiles_shape()
+        row, col, _ = self._locate(x, y)
+        tile_row = row // TILE_ROWS
+        need = [max(0, 1 - tile_row), max(0, 1 - col),
+                max(0, tile_row + 2 - ty), max(0, col + 2 - tx)]
+        if any(need):
+            slack = [ty >> 1, tx >> 1, ty >> 1, tx >> 1]
+            self._resize_tiles(*(n + s if n else 0 for n, s in zip(need, slack)))
+
+    def _fit_margin(self) -> None:
+        """Keep one to two empty tiles around the pattern, so the next
+           generation fits in the array without wasting work on empty space."""
+        occupied = self._occupied
+        rows, cols = np.flatnonzero(occupied.any(axis=1)), np.flatnonzero(occupied.any(axis=0))
+        if not len(rows):
+            return
+        ty, tx = occupied.shape
+        margins = [int(rows[0]), int(cols[0]), int(ty - 1 - rows[-1]), int(tx - 1 - cols[-1])]
+        if all(1 <= m <= 2 for m in margins):
+            return
+        self._resize_tiles(*(0 if 1 <= m <= 2 else 1 - m for m in margins))
+
+    # cell access
 
     def set_cell(self, x: cint, y: cint, new_state: cint) -> cint:
-        pass
+        x, y = as_int(x), as_int(y)
+        new_state = as_int(new_state)
+        if new_state < 0 or new_state >= self._max_cell_states.value:
+            return cint(-1)
+        if new_state:
+            self._ensure_cell(x, y)
+        row, col, bit = self._locate(x, y)
+        if 0 <= row < self._words.shape[0] and 0 <= col < self._words.shape[1]:
+            mask = np.uint32(1 << bit)
+            tile_row = row // TILE_ROWS
+            if new_state:
+                self._words[row, col] |= mask
+                self._occupied[tile_row, col] = True
+            else:
+                self._words[row, col] &= ~mask
+                self._occupied[tile_row, col] = \
+                    self._words[tile_row * TILE_ROWS:(tile_row + 1) * TILE_ROWS, col].any()
+            self._local_delta_forward[tile_row, col] = True
+            self._pop_valid = False
+        return cint(0)
 
     def get_cell(self, x: cint, y: cint) -> cint:
-        pass
+        x, y = as_int(x), as_int(y)
+        row, col, bit = self._locate(x, y)
+        if 0 <= row < self._words.shape[0] and 0 <= col < self._words.shape[1]:
+            return cint(int(self._words[row, col] >> bit) & 1)
+        return cint(0)
 
     def next_cell(self, x: cint, y: cint, v: cint) -> cint:
-        pass
+        """return the distance to the next live cell at or to the right of
+           (x, y) and store its state in v, or return -1 if there is none"""
+        x, y = as_int(x), as_int(y)
+        row, col, bit = self._locate(x, y)
+        if not 0 <= row < self._words.shape[0] or col >= self._words.shape[1]:
+            return cint(-1)
+        if col < 0:
+            col, bit = 0, 0
+        line = self._words[row, col:]
+        first = int(line[0]) & ~((1 << bit) - 1)
+        if first:
+            found = col * WORD_BITS + ((first & -first).bit_length() - 1)
+        else:
+            rest = np.flatnonzero(line[1:])
+            if not len(rest):
+                return cint(-1)
+            w = int(line[rest[0] + 1])
+            found = (col + rest[0] + 1) * WORD_BITS + ((w & -w).bit_length() - 1)
+        if isinstance(v, cint):
+            v.value = 1
+        return cint(self._x0 + found - x)
+
+    def live_cells_in(self, top: int, left: int, bottom: int,
+                      right: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        rows, bits = self._words.shape[0], self._words.shape[1] * WORD_BITS
+        r0, r1 = max(top - self._y0, 0), min(bottom - self._y0 + 1, rows)
+        b0, b1 = max(left - self._x0, 0), min(right - self._x0 + 1, bits)
+        if r0 >= r1 or b0 >= b1:
+            return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.int64)
+        words = self._words[r0:r1, b0 >> 5:((b1 - 1) >> 5) + 1]
+        cells = np.unpackbits(words.astype("<u4").view(np.uint8), axis=1, bitorder="little")
+        ys, xs = np.nonzero(cells[:, b0 & 31:(b0 & 31) + b1 - b0])
+        return self._x0 + b0 + xs, self._y0 + r0 + ys, np.ones(len(xs), np.int64)
+
+    def set_cells(self, xs: np.ndarray, ys: np.ndarray, states: np.ndarray) -> cint:
+        if not self._valid_states(states):
+            return cint(-1)
+        born = states != 0
+        if born.any():
+            self._ensure_cell(int(xs[born].min()), int(ys[born].min()))
+            self._ensure_cell(int(xs[born].max()), int(ys[born].max()))
+        rows, cols = ys - self._y0, xs - self._x0
+        inside = (rows >= 0) & (rows < self._words.shape[0]) & (cols >= 0) & \
+            (cols < self._words.shape[1] * WORD_BITS)
+        # a cell given more than once takes its last state, as with set_cell
+        _, last = np.unique((rows * self._words.shape[1] * WORD_BITS + cols)[inside][::-1], return_index=True)
+        rows, cols, born = (a[inside][::-1][last] for a in (rows, cols, born))
+        masks = np.left_shift(np.uint32(1), (cols & 31).astype(np.uint32))
+        np.bitwise_and.at(self._words, (rows[~born], cols[~born] >> 5), ~masks[~born])
+        np.bitwise_or.at(self._words, (rows[born], cols[born] >> 5), masks[born])
+        tile_rows, tile_cols = rows // TILE_ROWS, cols >> 5
+        self._occupied[tile_rows, tile_cols] = self._tile_view(self._words)[tile_rows, :, tile_cols].any(axis=1)
+        self._local_delta_forward[tile_rows, tile_cols] = True
+        self._pop_valid = False
+        return cint(0)
 
     def end_of_pattern(self):
         """call after set_cell calls"""
+        self._poller.bail_if_calculating()
+        self._pop_valid = False
+        return cint(0)
+
+    @property
+    def population(self) -> int:
+        if not self._pop_valid:
+            self._population = popcount(self._words)
+            self._pop_valid = True
+        return self._population
+
+    def is_empty(self) -> cint:
+        return cint(not self._words.any())
+
+    def find_edges(self) -> tuple[int, int, int, int]:
+        rows = np.flatnonzero(self._words.any(axis=1))
+        if not len(rows):
+            return 0, 0, 0, 0
+        cols = np.flatnonzero(self._words.any(axis=0))
+        low = int(np.bitwise_or.reduce(self._words[:, cols[0]]))
+        high = int(np.bitwise_or.reduce(self._words[:, cols[-1]]))
+        top = self._y0 + int(rows[0])
+        bottom = self._y0 + int(rows[-1])
+        left = self._x0 + int(cols[0]) * WORD_BITS + (low & -low).bit_length() - 1
+        right = self._x0 + int(cols[-1]) * WORD_BITS + high.bit_length() - 1
+        return top, left, bottom, right
+
+    # rules and stepping
+
+    def set_rule(self, s: str) -> str | None:
+        err = self._rules.set_rule(s, self)
+        if err is None:
+            self._grid_type = TGridType[liferules.GRID_TYPES[self._rules.neighbormask]]
+            self._delta_forward = True
+        return err
+
+    def get_rule(self) -> str:
+        return self._rules.get_rule()
+
+    def triangular_capable(self) -> cint:
+        return cint(1)
+
+    def _active_tiles(self) -> np.ndarray:
+        """tiles that changed or were edited, plus their eight neighbors"""
+        if self._delta_forward:
+            return np.ones(self._occupied.shape, bool)
+        changed = ((self._flags & CHANGED) != 0) | self._local_delta_forward
+        active = changed.copy()
+        active[1:] |= changed[:-1]
+        active[:-1] |= changed[1:]
+        spread = active.copy()
+        active[:, 1:] |= spread[:, :-1]
+        active[:, :-1] |= spread[:, 1:]
+        return active
+
+    def _dogen(self) -> None:
+        """compute one generation, only touching tiles near last changes"""
+        self._fit_margin()
+        active = self._active_tiles()
+        total = active.size
+        count = int(np.count_nonzero(active))
+        tiles = self._tile_view(self._words)
+        if count * DENSE_FRACTION >= total:
+            new = next_words(self._cells, self._rules)
+            new_tiles = self._tile_view(new)
+            self._flags = np.where((new_tiles != tiles).any(axis=1), CHANGED, 0).astype(np.uint8)
+            self._occupied = new_tiles.any(axis=1)
+            self._words[...] = new
+        elif count:
+            tys, txs = np.nonzero(active)
+            # each active tile plus a border of one row and one word, taken
+            # from the bordered array (whose row 0 / column 0 is the border)
+            rows = tys[:, None] * TILE_ROWS + np.arange(TILE_ROWS + 2)
+            cols = txs[:, None] + np.arange(3)
+            new = next_words(self._cells[rows[:, :, None], cols[:, None, :]], self._rules)[..., 0]
+            self._flags[...] = 0
+            self._flags[tys, txs] = np.where((new != tiles[tys, :, txs]).any(axis=1), CHANGED, 0)
+            self._occupied[tys, txs] = new.any(axis=1)
+            tiles[tys, :, txs] = new
+        else:
+            self._flags[...] = 0
+        self._local_delta_forward[...] = False
+        self._delta_forward = False
+        self.running_hperf.tiles_calculated += count
+        self.running_hperf.tiles_skipped += total - count
+        self._generation += 1
+
+    def step(self) -> None:
+        """do inc gens"""
+        self._poller.bail_if_calculating()
+        for _ in range(self._increment):
+            if self._poller.poll():
+                break
+            self._dogen()
+        self._pop_valid = False
+        self.step_hperf, self.inc_hperf = self.running_hperf.report_step(
+            self.step_hperf, self.inc_hperf, float(self._generation), self._verbose)
+
+    def write_native_format(self, os: io.StringIO, comments: str) -> str:
+        return "No native format for qlifealgo yet."
 
 
 """    virtual void endofpattern() {
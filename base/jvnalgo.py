@@ -0,0 +1,512 @@
+from __future__ import annotations
+
+import functools
+
+import numba as nb
+import numpy as np
+
+import base.ghashbase as ghashbase
+import base.liferules as liferules
+import base.tilealgo as tilealgo
+from base.lifealgo import *
+
+
+# von Neumann's 29-state rule and its 32-state variants.  A cell's next
+# state depends on itself and its four orthogonal neighbors, so the whole
+# rule is a transition table with one entry per combination of the five
+# states: (((c * S + n) * S + s) * S + e) * S + w for S states, built once
+# per process by running Golly's transition function (ported below with
+# numba) over every combination.  A generation is then a handful of array
+# operations and a single lookup, over the tiles of TileAlgo whose von
+# Neumann neighborhood changed in the previous generation (JvN constructions
+# are mostly quiescent).  HJvNAlgo runs the same table under hashlife, for
+# the big constructions whose periods are only reachable with huge steps.
+RULE_NAMES = ("JvN29", "Nobili32", "Hutton32")
+OLD_NAMES = {"jvn-29": "JvN29", "jvn-32": "Nobili32", "modjvn-32": "Hutton32"}  # deprecated names
+NUM_STATES = {"JvN29": 29, "Nobili32": 32, "Hutton32": 32}
+JVN29, NOBILI32, HUTTON32 = range(3)
+
+# the internal states of JvN29 and Nobili32 are bit fields
+NORTH = 1
+SOUTH = 3
+EAST = 0
+WEST = 2
+FLIPDIR = 2
+DIRMASK = 3
+CONF = 0x10
+OTRANS = 0x20
+STRANS = 0x40
+TEXC = 0x80
+CDEXC = 0x80
+CROSSEXC = 6
+CEXC = 1
+BIT_ONEXC = 1
+BIT_OEXC_EW = 2
+BIT_OEXC_NS = 4
+BIT_OEXC = BIT_OEXC_NS | BIT_OEXC_EW
+BIT_SEXC = 8
+BIT_CEXC = 16
+BIT_NS_IN = 32
+BIT_EW_IN = 64
+BIT_NS_OUT = 128
+BIT_EW_OUT = 256
+BIT_CROSS = BIT_NS_IN | BIT_EW_IN | BIT_NS_OUT | BIT_EW_OUT
+BIT_ANY_OUT = BIT_NS_OUT | BIT_EW_OUT
+BIT_OEXC_OTHER = 512
+BIT_SEXC_OTHER = 1024
+
+# the legal internal states, in the order of the cell states
+UNCOMPRESS = np.array([
+    0,                       # dead
+    1, 2, 3, 4, 5, 6, 7, 8,  # construction states
+    32, 33, 34, 35,          # ordinary
+    160, 161, 162, 163,      # ordinary active
+    64, 65, 66, 67,          # special
+    192, 193, 194, 195,      # special active
+    16, 144,                 # confluent states
+    17, 145,                 # more confluent states
+    146, 148, 150,           # crossing confluent states
+], np.int64)
+COMPRESS = np.full(256, 255, np.int64)
+COMPRESS[UNCOMPRESS] = np.arange(len(UNCOMPRESS))
+CRES = np.array([0x22, 0x23, 0x40, 0x41, 0x42, 0x43, 0x10, 0x20, 0x21], np.int64)
+
+
+@nb.njit
+def bits(mcode, code, direction):
+    """what the neighbor in state code, on side direction, tells a cell in
+       state mcode (internal states)"""
+    if (code & (TEXC | OTRANS | STRANS | CONF | CEXC)) == 0:
+        return 0
+    if code & CONF:
+        if (mcode & (OTRANS | STRANS)) and ((mcode & DIRMASK) ^ FLIPDIR) == direction:
+            return 0
+        if (code & 2) and not (direction & 1):
+            return BIT_CEXC
+        if (code & 4) and (direction & 1):
+            return BIT_CEXC
+        if code & 1:
+            return BIT_CEXC
+        return 0
+    if (code & (OTRANS | STRANS)) == 0:
+        return 0
+    r = 0
+    if (code & DIRMASK) == direction:
+        if code & OTRANS:
+            if direction & 1:
+                r |= BIT_NS_IN
+                r |= BIT_OEXC_NS if code & TEXC else BIT_ONEXC
+            else:
+                r |= BIT_EW_IN
+                r |= BIT_OEXC_EW if code & TEXC else BIT_ONEXC
+        elif (code & (STRANS | TEXC)) == (STRANS | TEXC):
+            r |= BIT_SEXC
+        if not ((mcode & (OTRANS | STRANS)) and (direction ^ (mcode & DIRMASK)) == 2):
+            # (head to head, these bits don't propagate)
+            if r & BIT_OEXC:
+                r |= BIT_OEXC_OTHER
+            if r & BIT_SEXC:
+                r |= BIT_SEXC_OTHER
+    elif direction & 1:
+        r |= BIT_NS_OUT
+    else:
+        r |= BIT_EW_OUT
+    return r
+
+
+@nb.njit
+def jvn_calc(rule, c, n, s, e, w):
+    """the JvN29 or Nobili32 transition function (cell states)"""
+    c = UNCOMPRESS[c]
+    mbits = (bits(c, UNCOMPRESS[n], SOUTH) | bits(c, UNCOMPRESS[w], EAST) |
+             bits(c, UNCOMPRESS[e], WEST) | bits(c, UNCOMPRESS[s], NORTH))
+    if c < CONF:
+        c = 2 * c + 1 if mbits & (BIT_OEXC | BIT_SEXC) else 2 * c
+        if c > 8:
+            c = CRES[c - 9]
+    elif c & CONF:
+        if mbits & BIT_SEXC:
+            c = 0
+        elif rule == NOBILI32 and (mbits & BIT_CROSS) == BIT_CROSS:
+            c = (mbits & BIT_OEXC) + CONF + 0x80 if mbits & BIT_OEXC else CONF
+        else:
+            if c & CROSSEXC:
+                # was a cross, is no more
+                c = c & ~(CROSSEXC | CDEXC) & 255
+            if (mbits & BIT_OEXC) and not (mbits & BIT_ONEXC):
+                c = ((c & CDEXC) >> 7) + (CDEXC | CONF)
+            elif (mbits & BIT_ANY_OUT) or rule == JVN29:
+                c = ((c & CDEXC) >> 7) + CONF
+    elif ((c & OTRANS) and (mbits & BIT_SEXC)) or ((c & STRANS) and (mbits & BIT_OEXC)):
+        c = 0
+    elif mbits & (BIT_SEXC_OTHER | BIT_OEXC_OTHER | BIT_CEXC):
+        c |= 128
+    else:
+        c &= 127
+    return COMPRESS[c]
+
+
+# Hutton32 works on the cell states directly.  Its arithmetic is C's on
+# unsigned char states: remainders keep the sign of the dividend and
+# results wrap modulo 256.
+
+@nb.njit
+def c_mod(a, b):
+    r = abs(a) % b
+    return -r if a < 0 else r
+
+
+@nb.njit
+def is_ots(c):
+    return 9 <= c <= 16
+
+
+@nb.njit
+def is_sts(c):
+    return 17 <= c <= 24
+
+
+@nb.njit
+def is_ts(c):
+    return is_ots(c) or is_sts(c)
+
+
+@nb.njit
+def is_sensitized(c):
+    return 1 <= c <= 8
+
+
+@nb.njit
+def is_east(c):
+    return c == 9 or c == 13 or c == 17 or c == 21
+
+
+@nb.njit
+def is_north(c):
+    return c == 10 or c == 14 or c == 18 or c == 22
+
+
+@nb.njit
+def is_west(c):
+    return c == 11 or c == 15 or c == 19 or c == 23
+
+
+@nb.njit
+def is_south(c):
+    return c == 12 or c == 16 or c == 20 or c == 24
+
+
+@nb.njit
+def is_excited(c):
+    return 13 <= c <= 16 or 21 <= c <= 24
+
+
+@nb.njit
+def direction_of(c):
+    """0, 1, 2, 3 for right, up, left, down"""
+    return c_mod(c - 9, 4) & 255
+
+
+@nb.njit
+def output(c, n, s, e, w):
+    """the state of the cell c points to"""
+    if is_east(c):
+        return e
+    if is_north(c):
+        return n
+    if is_west(c):
+        return w
+    if is_south(c):
+        return s
+    return 0
+
+
+@nb.njit
+def input_of(n, s, e, w):
+    """the state of the excited cell pointing at us"""
+    if is_east(w) and is_excited(w):
+        return w
+    if is_north(s) and is_excited(s):
+        return s
+    if is_west(e) and is_excited(e):
+        return e
+    if is_south(n) and is_excited(n):
+        return n
+    return 0
+
+
+@nb.njit
+def output_will_become_ots(c, n, s, e, w):
+    out = output(c, n, s, e, w)
+    return out == 8 or (out == 4 and is_excited(c)) or (out == 5 and not is_excited(c))
+
+
+@nb.njit
+def output_will_become_confluent(c, n, s, e, w):
+    return output(c, n, s, e, w) == 7 and is_excited(c)
+
+
+@nb.njit
+def output_will_become_sensitized(c, n, s, e, w):
+    out = output(c, n, s, e, w)
+    return (out == 0 and is_excited(c)) or out == 1 or out == 2 or out == 3 or (out == 4 and not is_ots(c))
+
+
+@nb.njit
+def excited_ots_to_us(c, n, s, e, w):
+    """is there an excited OTS state that will hit us next?"""
+    return (((n == 16 or n == 27 or n == 28 or n == 30 or n == 31) and not (c == 14 or c == 10)) or
+            ((s == 14 or s == 27 or s == 28 or s == 30 or s == 31) and not (c == 16 or c == 12)) or
+            ((e == 15 or e == 27 or e == 28 or e == 29 or e == 31) and not (c == 13 or c == 9)) or
+            ((w == 13 or w == 27 or w == 28 or w == 29 or w == 31) and not (c == 15 or c == 11)))
+
+
+@nb.njit
+def excited_ots_arrow_to_us(c, n, s, e, w):
+    """is there an excited OTS arrow pointing at us?"""
+    return ((n == 16 and not (c == 14 or c == 10)) or (s == 14 and not (c == 16 or c == 12)) or
+            (e == 15 and not (c == 13 or c == 9)) or (w == 13 and not (c == 15 or c == 11)))
+
+
+@nb.njit
+def ots_arrow_to_us(n, s, e, w):
+    """is there an OTS arrow pointing at us?"""
+    return ((is_ots(n) and is_south(n)) or (is_ots(s) and is_north(s)) or
+            (is_ots(e) and is_west(e)) or (is_ots(w) and is_east(w)))
+
+
+@nb.njit
+def excited_sts_to_us(c, n, s, e, w):
+    """is there an excited STS state that will hit us next?"""
+    return (((n == 24 or n == 27 or n == 28 or n == 30 or n == 31) and not (c == 22 or c == 18)) or
+            ((s == 22 or s == 27 or s == 28 or s == 30 or s == 31) and not (c == 24 or c == 20)) or
+            ((e == 23 or e == 27 or e == 28 or e == 29 or e == 31) and not (c == 21 or c == 17)) or
+            ((w == 21 or w == 27 or w == 28 or w == 29 or w == 31) and not (c == 23 or c == 19)))
+
+
+@nb.njit
+def excited_sts_arrow_to_us(c, n, s, e, w):
+    """is there an excited STS arrow pointing at us?"""
+    return ((n == 24 and not (c == 22 or c == 18)) or (s == 22 and not (c == 24 or c == 20)) or
+            (e == 23 and not (c == 21 or c == 17)) or (w == 21 and not (c == 23 or c == 19)))
+
+
+@nb.njit
+def all_inputs_on(n, s, e, w):
+    return (not (n == 12 or s == 10 or e == 11 or w == 9)) and (n == 16 or s == 14 or e == 15 or w == 13)
+
+
+@nb.njit
+def is_crossing(n, s, e, w):
+    inputs = int(is_south(n)) + int(is_east(w)) + int(is_west(e)) + int(is_north(s))
+    outputs = (int(is_ts(n) and not is_south(n)) + int(is_ts(w) and not is_east(w)) +
+               int(is_ts(e) and not is_west(e)) + int(is_ts(s) and not is_north(s)))
+    return inputs == 2 and outputs == 2
+
+
+@nb.njit
+def quiesce(c):
+    if 13 <= c <= 16 or 21 <= c <= 24:
+        return c - 4
+    if 26 <= c <= 31:
+        return 25
+    return c
+
+
+@nb.njit
+def crossing(n, s, e, w):
+    """the confluent state for the signals crossing it"""
+    if (n == 16 or s == 14) and (e == 15 or w == 13):
+        return 31  # double crossing
+    if n == 16 or s == 14:
+        return 30  # vertical crossing
+    if e == 15 or w == 13:
+        return 29  # horizontal crossing
+    return 25
+
+
+@nb.njit
+def hutton_calc(c, n, s, e, w):
+    """the Hutton32 transition function"""
+    if is_ots(c):
+        if excited_sts_arrow_to_us(c, n, s, e, w):
+            return 0  # destroyed by the incoming excited STS
+        if excited_ots_to_us(c, n, s, e, w):
+            out = output(c, n, s, e, w)
+            if output_will_become_ots(c, n, s, e, w) or (is_sts(out) and not is_excited(out)):
+                return 0  # retraction
+            if output_will_become_confluent(c, n, s, e, w):
+                return 1  # sensitized by the next input (after retraction)
+            return quiesce(c) + 4  # usual OTS transmission
+        if output_will_become_confluent(c, n, s, e, w):
+            return 0  # retraction
+        if is_excited(c) and output_will_become_sensitized(c, n, s, e, w):
+            # excited STS marks the input of the sensitized cell at the end of a wire
+            return quiesce(c) + 12
+        return quiesce(c)
+    if is_sts(c):
+        if is_excited(c) and is_sensitized(output(c, n, s, e, w)) and ots_arrow_to_us(n, s, e, w):
+            # the special mark at the end of an OTS wire
+            if output_will_become_sensitized(c, n, s, e, w):
+                return c - 8 if excited_ots_arrow_to_us(c, n, s, e, w) else c
+            if excited_ots_arrow_to_us(c, n, s, e, w):
+                return 0  # write-and-retract
+            return (quiesce(c) - 8) & 255  # revert to quiescent OTS
+        if is_excited(c) and output(c, n, s, e, w) == 0:
+            return c if excited_sts_arrow_to_us(c, n, s, e, w) else quiesce(c)
+        if excited_ots_arrow_to_us(c, n, s, e, w):
+            return 0  # destroyed by the incoming excited OTS
+        if excited_sts_to_us(c, n, s, e, w):
+            return quiesce(c) + 4  # usual STS transmission
+        return quiesce(c)
+    if c == 0:
+        if excited_ots_arrow_to_us(c, n, s, e, w):
+            return 1
+        if excited_sts_arrow_to_us(c, n, s, e, w):
+            return (quiesce(input_of(n, s, e, w)) - 8) & 255  # directly become forward OTS
+        return c
+    excited = excited_ots_arrow_to_us(c, n, s, e, w)
+    incoming = quiesce(input_of(n, s, e, w))
+    if c == 1:
+        return 3 if excited else 2
+    if c == 2:
+        return 5 if excited else 4
+    if c == 3:
+        return 7 if excited else 6
+    if c == 4:
+        return (c_mod(incoming - 9 + 2, 4) + 9) & 255 if excited else 8  # 1001: reverse
+    if c == 5:
+        if excited:
+            return incoming + 8  # 1011: STS forward
+        return (c_mod(incoming - 9 + 3, 4) + 9) & 255  # 1010: turn right
+    if c == 6:
+        return (c_mod(incoming - 9 + (2 if excited else 1), 4) + 17) & 255  # STS reverse or turn left
+    if c == 7:
+        return 25 if excited else (c_mod(incoming - 9 + 3, 4) + 17) & 255
+    if c == 8:
+        incoming = input_of(n, s, e, w)
+        return (9 + direction_of(incoming + 1 if excited else incoming)) & 255
+    if c == 25:
+        if excited_sts_arrow_to_us(c, n, s, e, w):
+            return 0
+        if is_crossing(n, s, e, w):
+            return crossing(n, s, e, w)
+        return 26 if all_inputs_on(n, s, e, w) else 25
+    if c == 26 or c == 28:
+        if excited_sts_arrow_to_us(c, n, s, e, w):
+            return 0
+        return 28 if all_inputs_on(n, s, e, w) else 27
+    if c == 27:
+        if excited_sts_arrow_to_us(c, n, s, e, w):
+            return 0
+        return 26 if all_inputs_on(n, s, e, w) else 25
+    if c == 29 or c == 30 or c == 31:
+        if excited_sts_arrow_to_us(c, n, s, e, w):
+            return 0
+        return crossing(n, s, e, w)
+    return c
+
+
+@nb.njit
+def fill_table(table, rule, num_states):
+    i = 0
+    for c in range(num_states):
+        for n in range(num_states):
+            for s in range(num_states):
+                for e in range(num_states):
+                    for w in range(num_states):
+                        if rule == HUTTON32:
+                            table[i] = hutton_calc(c, n, s, e, w)
+                        else:
+                            table[i] = jvn_calc(rule, c, n, s, e, w)
+                        i += 1
+
+
+@functools.lru_cache(maxsize=None)
+def transition_table(rule_name: str) -> np.ndarray:
+    """the next state for every (c, n, s, e, w), indexed as described above"""
+    num_states = NUM_STATES[rule_name]
+    table = np.empty(num_states ** 5, np.uint8)
+    fill_table(table, RULE_NAMES.index(rule_name), num_states)
+    table.flags.writeable = False
+    return table
+
+
+def next_states(padded: np.ndarray, table: np.ndarray, num_states: int) -> np.ndarray:
+    """the next generation of the cells inside padded (the last two axes
+       have a border of one cell)"""
+    index = padded[..., 1:-1, 1:-1].astype(np.int32)
+    for side in (padded[..., :-2, 1:-1], padded[..., 2:, 1:-1], padded[..., 1:-1, 2:], padded[..., 1:-1, :-2]):
+        index *= num_states
+        index += side
+    return table[index]
+
+
+def transition(rule_name: str) -> ghashbase.Transition:
+    """the transition table as a Transition for hashlife"""
+    num_states = NUM_STATES[rule_name]
+    order = (4, 1, 7, 5, 3)  # c, n, s, e, w
+    weights = np.zeros((9, num_states), np.int64)
+    for digit, p in enumerate(order):
+        weights[p] = np.arange(num_states) * num_states ** (len(order) - 1 - digit)
+    return ghashbase.flat_transition(num_states, order, weights, transition_table(rule_name))
+
+
+class JvNRules(object):
+    """The rule handling of the JvN engines; set_rule ends by calling the
+       engine's _rule_changed."""
+    _rule_name: str
+    _canon_rule: str
+
+    @property
+    def default_rule(self) -> str:
+        return RULE_NAMES[JVN29]
+
+    def set_rule(self, s: str) -> str | None:
+        if len(s) > liferules.MAX_RULE_SIZE:
+            return "Rule name is too long."
+        rule, colon, suffix = s.partition(':')
+        names = {name.lower(): name for name in RULE_NAMES}
+        names.update(OLD_NAMES)
+        name = names.get(rule.lower())
+        if name is None:
+            return "This algorithm only supports these rules:\nJvN29, Nobili32, Hutton32."
+        err = self.set_grid_size(colon + suffix if colon else ":")
+        if err != chr(0):
+            return err
+        self._rule_name = name
+        self._max_cell_states = cint(NUM_STATES[name])
+        self._canon_rule = name + self.canonical_suffix().rstrip(chr(0))
+        self._rule_changed()
+        return None
+
+    def get_rule(self) -> str:
+        return self._canon_rule
+
+
+class JvNAlgo(JvNRules, tilealgo.TileAlgo):
+    """von Neumann's 29-state cellular automaton (JvN29) and the Nobili32
+       and Hutton32 variants, stepped by table lookup."""
+    _moore = False
+
+    def __init__(self):
+        super(JvNAlgo, self).__init__()
+        self.set_rule(self.default_rule)
+
+    def _next_states(self, padded: np.ndarray) -> np.ndarray:
+        return next_states(padded, transition_table(self._rule_name), self._max_cell_states.value)
+
+    def write_native_format(self, os: io.StringIO, comments: str) -> str:
+        return "No native format for jvnalgo yet."
+
+
+class HJvNAlgo(JvNRules, ghashbase.GHashBase):
+    """The JvN rules under hashlife, for the large constructions that are
+       only practical with exponential steps."""
+
+    def __init__(self):
+        super(HJvNAlgo, self).__init__()
+        self.set_rule(self.default_rule)
+
+    def _rule_transition(self) -> ghashbase.Transition:
+        return transition(self._rule_name)
@@ -1,5 +1,6 @@
 from __future__ import annotations
 import abc
+import copy
 import ctypes
 import enum
 import io
@@ -14,6 +15,7 @@ from overloading import overload
 import base.liferender as liferender
 import base.viewport as viewport
 import base.lifepoll as lifepoll
+import base.util as util
 
 cint = ctypes.c_int
 uchar = numpy.ubyte
@@ -24,9 +26,17 @@ point = ctypes.byref
 # multiply that only supports multiplicands up to that size.
 MAX_FRAME_COUNT = cint(32000)
 
+# cells outside these coordinates can't be edited
+MIN_COORD, MAX_COORD = -1000000000, 1000000000
+
 TGridType = enum.Enum("TGridType", ["SQUARE_GRID", "TRI_GRID", "HEX_GRID", "VN_GRID"])
 
 
+def as_int(v: int | cint) -> int:
+    """accept either a plain int or a cint wherever a cint is expected"""
+    return v.value if isinstance(v, cint) else int(v)
+
+
 class TimeLine:
     """Timeline support is pretty generic."""
     recording: cint
@@ -41,9 +51,10 @@ class TimeLine:
     frames: list
 
     def __init__(self):
-        recording, frame_count, save_timeline = cint(0), cint(0), cint(1)
-        start, inc, next_, end = 0, 0, 0, 0
-        frames: list = []
+        self.recording, self.frame_count, self.save_timeline = cint(0), cint(0), cint(1)
+        self.base, self.expo = cint(0), cint(0)
+        self.start, self.inc, self.next_, self.end = 0, 0, 0, 0
+        self.frames: list = []
 
 
 class LifeAlgo(object, metaclass=abc.ABCMeta):
@@ -54,6 +65,9 @@ class LifeAlgo(object, metaclass=abc.ABCMeta):
     _increment: int
     _timeline: TimeLine
     _grid_type: enum.Enum
+    running_hperf: util.HPerf   # performance counters, reported by step
+    step_hperf: util.HPerf
+    inc_hperf: util.HPerf
 
     # support for a bounded universe with various topologies:
     # plane, cylinder, torus, Klein bottle, cross-surface, sphere
@@ -84,12 +98,23 @@ class LifeAlgo(object, metaclass=abc.ABCMeta):
     def __init__(self):
         self._generation = 0
         self._increment = 0
+        self._max_cell_states = cint(2)
         self._timeline = TimeLine()
         self._grid_type = TGridType["SQUARE_GRID"]
 
         self._poller = lifepoll.default_poller
-        self.grid["wd"] = self.grid["ht"] = 0   # default is an unbounded universe
+        self._verbose = cint(0)
+        # each universe has its own grid, not the class-level defaults above
+        self.grid = dict(wd=0, ht=0, left=0, right=0, top=0, bottom=0)  # default is an unbounded universe
+        self.twist = dict(v=False, h=False)
+        self.shift = dict(v=0, h=0)
+        self.bounded_plane = self.sphere = False
         self.unbounded = True                   # most algorithms use an unbounded universe
+        self.clipped_cells = []
+        self.running_hperf = util.HPerf()
+        self.running_hperf.clear()
+        self.step_hperf = copy.copy(self.running_hperf)
+        self.inc_hperf = copy.copy(self.running_hperf)
 
     def __del__(self):
         self._poller = lifepoll.LifePoll()
@@ -114,6 +139,35 @@ class LifeAlgo(object, metaclass=abc.ABCMeta):
         buf = "0" * w.value * h.value
         self.draw(vp, hsr)
 
+    def live_cells_in(self, top: int, left: int, bottom: int,
+                      right: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """The x and y coordinates and states of the non-dead cells in a
+           rectangle.  This walks it with next_cell; engines that hold their
+           cells in arrays read the rectangle in one go."""
+        xs, ys, states = [], [], []
+        state = cint(0)
+        for y in range(top, bottom + 1):
+            x = left
+            while (dx := self.next_cell(cint(x), cint(y), state).value) >= 0 and x + dx <= right:
+                x += dx
+                xs.append(x)
+                ys.append(y)
+                states.append(state.value)
+                x += 1
+        return np.array(xs, np.int64), np.array(ys, np.int64), np.array(states, np.int64)
+
+    def set_cells(self, xs: np.ndarray, ys: np.ndarray, states: np.ndarray) -> cint:
+        """set_cell for many cells at once; if any state is out of range
+           nothing is set and -1 is returned.  Call end_of_pattern afterwards."""
+        if not self._valid_states(states):
+            return cint(-1)
+        for x, y, state in zip(xs.tolist(), ys.tolist(), states.tolist()):
+            self.set_cell(cint(x), cint(y), cint(state))
+        return cint(0)
+
+    def _valid_states(self, states: np.ndarray) -> bool:
+        return not len(states) or (int(states.min()) >= 0 and int(states.max()) < self._max_cell_states.value)
+
     def end_of_pattern(self):
         """call after set_cell calls"""
         return cint(0)
@@ -124,15 +178,15 @@ class LifeAlgo(object, metaclass=abc.ABCMeta):
 
     @increment.setter
     def increment(self, inc: int | cint) -> None:
-        pass
+        self._increment = as_int(inc)
 
     @property
     def generation(self) -> int:
         return self._generation
 
     @generation.setter
-    def generation(self, gen):
-        pass
+    def generation(self, gen: int | cint) -> None:
+        self._generation = as_int(gen)
 
     @property
     def population(self) -> int:
@@ -145,6 +199,10 @@ class LifeAlgo(object, metaclass=abc.ABCMeta):
         """can we do the gen count doubling? only hashlife"""
         return cint(0)
 
+    def triangular_capable(self) -> cint:
+        """can we run rules on the triangular grid? only the counting engines"""
+        return cint(0)
+
     @property
     def max_memory(self) -> cint:
         """never alloc more than this"""
@@ -155,14 +213,23 @@ class LifeAlgo(object, metaclass=abc.ABCMeta):
         pass
 
     @property
-    def rule(self):
+    def rule(self) -> str:
         """get current rule set"""
-        return
+        return self.get_rule()
 
     @rule.setter
-    def rule(self, value):
-        """new rules; returns err msg"""
-        pass
+    def rule(self, value: str) -> None:
+        """new rules; raises ValueError with the err msg"""
+        err = self.set_rule(value)
+        if err:
+            raise ValueError(err)
+
+    def set_rule(self, s: str) -> str | None:
+        """override to parse new rules; returns err msg or None"""
+        return "This algorithm does not support rules."
+
+    def get_rule(self) -> str:
+        return self.default_rule
 
     def step(self) -> None:
         """do inc gens"""
@@ -174,7 +241,8 @@ class LifeAlgo(object, metaclass=abc.ABCMeta):
     def fit(self, view: viewport.Viewport, force: cint) -> None:
         ...
 
-    def find_edges(self, tt: int, ll: int, bb: int, rr: int) -> None:
+    def find_edges(self) -> tuple[int, int, int, int]:
+        """return the bounding box of the pattern as (top, left, bottom, right)"""
         ...
 
     def lower_right_pixel(self, x: int, y: int, mag: cint) -> None:
@@ -211,7 +279,7 @@ class LifeAlgo(object, metaclass=abc.ABCMeta):
     @property
     def num_cell_states(self) -> cint:
         """return number of cell states in this universe (2..256)"""
-        return cint(2)
+        return self._max_cell_states
 
     @property
     def num_randomized_cell_states(self):
@@ -263,9 +331,9 @@ class LifeAlgo(object, metaclass=abc.ABCMeta):
     def extended_timeline(self) -> None:
         if self._timeline.recording and self._generation == self._timeline.next_:
             now = self.current_state
-            if now and self._timeline.frame_count < MAX_FRAME_COUNT:
+            if now and self._timeline.frame_count.value < MAX_FRAME_COUNT.value:
                 self._timeline.frames.append(now)
-                self._timeline.frame_count += 1
+                self._timeline.frame_count = cint(self._timeline.frame_count.value + 1)
                 self._timeline.end = self._timeline.next_
                 self._timeline.next_ += self._timeline.inc
 
@@ -419,7 +487,7 @@ class LifeAlgo(object, metaclass=abc.ABCMeta):
         if d == ',' and topology != 'S':
             p += 1
             d = suffix[p]
-        elif d:
+        elif d != chr(0):
             return "Unexpected stuff after grid width."
         # grid[wd] has been set
         if (topology in ('K', "C", 'S')) and not self.grid['wd']:
@@ -467,7 +535,7 @@ class LifeAlgo(object, metaclass=abc.ABCMeta):
                 if self.shift['v'] >= self.grid['ht']:
                     self.shift['v'] = self.shift['v'] % self.grid['ht']
                 self.shift['v'] *= sign
-            if d:
+            if d != chr(0):
                 return "Unexpected stuff after grid height."
         # grid[ht] has been set
         if topology in ('K', 'C') and not self.grid['ht']:
@@ -482,7 +550,7 @@ class LifeAlgo(object, metaclass=abc.ABCMeta):
 
         # now ok to set grid edges
         if self.grid['wd'] > 0:
-            self.grid['left']= -self.grid['wd'] // 2
+            self.grid['left'] = -(self.grid['wd'] // 2)
             self.grid['right'] = self.grid['wd'] - 1
             self.grid['right'] += self.grid['left']
         else:
@@ -490,7 +558,7 @@ class LifeAlgo(object, metaclass=abc.ABCMeta):
             self.grid['left'] = 0
             self.grid['right'] = 0
         if self.grid['ht'] > 0:
-            self.grid['top'] = -self.grid['ht'] // 2
+            self.grid['top'] = -(self.grid['ht'] // 2)
             self.grid['bottom'] = self.grid['ht'] - 1
             self.grid['bottom'] += self.grid['top']
         else:
@@ -550,37 +618,170 @@ class LifeAlgo(object, metaclass=abc.ABCMeta):
             # unbounded universe
             return chr(0)
 
+    def border_index(self, h: int, w: int, r: int) -> np.ndarray:
+        """For each cell of an h x w array with a border of r cells, the flat
+           index of the array cell it shows (-1 for dead), following the
+           grid's topology the way join_*_edges join a one cell border.  On
+           a bounded axis the array covers the grid exactly.  Engines that
+           fill their border from this map inside the step don't need the
+           border cells below, and can step more than one generation."""
+        ys, xs = np.mgrid[-r:h + r, -r:w + r]
+        return self.wrap_cells(ys, xs, h, w)
+
+    def ring_cells(self, h: int, w: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """the row and column offsets of the one cell border around an h x w
+           array (top row, bottom row, left column, right column), and the
+           flat index of the array cell each one shows, as border_index"""
+        rows, cols = np.arange(h), np.arange(-1, w + 1)
+        ys = np.concatenate((np.full(w + 2, -1), np.full(w + 2, h), rows, rows))
+        xs = np.concatenate((cols, cols, np.full(h, -1), np.full(h, w)))
+        return ys, xs, self.wrap_cells(ys.copy(), xs.copy(), h, w)
+
+    def wrap_cells(self, ys: np.ndarray, xs: np.ndarray, h: int, w: int) -> np.ndarray:
+        """the flat index of the h x w array cell that each (possibly
+           outside) cell shows, or -1; ys and xs are overwritten"""
+        g, twist, shift = self.grid, self.twist, self.shift
+        bw, bh = g["wd"], g["ht"]
+        if self.bounded_plane:
+            pass
+        elif self.sphere:
+            # join the top edge to the left edge and the bottom edge to the right
+            for _ in range(3):
+                out = xs < 0
+                ys[out], xs[out] = -xs[out] - 1, ys[out]
+                out = ys < 0
+                ys[out], xs[out] = xs[out], -ys[out] - 1
+                out = xs >= w
+                ys[out], xs[out] = w + h - 1 - xs[out], ys[out]
+                out = ys >= h
+                ys[out], xs[out] = xs[out], w + h - 1 - ys[out]
+        else:
+            if bw:
+                crossed = np.floor_divide(xs, w)
+                xs -= crossed * w
+                odd = crossed % 2 == 1
+                if twist["v"]:
+                    # left and right edges joined with a twist (and maybe a shift of 1)
+                    ys[odd] = h - 1 - ys[odd] - (1 if shift["v"] and not h & 1 else 0)
+                elif shift["v"]:
+                    ys += crossed * shift["v"]
+            if bh:
+                crossed = np.floor_divide(ys, h)
+                ys -= crossed * h
+                odd = crossed % 2 == 1
+                if twist["h"]:
+                    xs[odd] = w - 1 - xs[odd] - (1 if shift["h"] and not w & 1 else 0)
+                elif shift["h"]:
+                    xs += crossed * shift["h"]
+                if bw:
+                    xs %= w
+        return np.where((ys >= 0) & (ys < h) & (xs >= 0) & (xs < w), ys * w + xs, -1)
+
     # the above routines can be called around step() to create the
     # illusion of a bounded universe (note that increment must be 1);
     # they return false if the pattern exceeds the editing limits
 
     def create_border_cells(self) -> bool:
-        ...
+        # no need to do anything if there is no pattern or if the grid is a bounded plane
+        if self.is_empty().value or self.bounded_plane:
+            return True
+        g = self.grid
+        top, left, bottom, right = self.find_edges()
+        # no need to do anything if pattern is completely inside grid edges
+        if ((g["wd"] == 0 or (g["left"] < left and g["right"] > right)) and
+                (g["ht"] == 0 or (g["top"] < top and g["bottom"] > bottom))):
+            return True
+        # if grid has infinite width or height then pattern might have
+        # expanded beyond the editing limits
+        if (g["wd"] == 0 or g["ht"] == 0) and (top < MIN_COORD or left < MIN_COORD or
+                                               bottom > MAX_COORD or right > MAX_COORD):
+            return False
+        # set pattern edges to grid edges if grid is bounded
+        if g["wd"] > 0:
+            left, right = g["left"], g["right"]
+        if g["ht"] > 0:
+            top, bottom = g["top"], g["bottom"]
+        if self.sphere:
+            self.join_adjacent_edges(cint(top), cint(left), cint(bottom), cint(right))
+        elif self.twist["h"] or self.twist["v"]:
+            if self.shift["h"] or self.shift["v"]:
+                self.join_twisted_and_shifted_edges()
+            else:
+                self.join_twisted_edges()
+        elif self.shift["h"] or self.shift["v"]:
+            self.join_shifted_edges()
+        else:
+            self.join_edges(cint(top), cint(left), cint(bottom), cint(right))
+        self.end_of_pattern()
+        return True
 
     def delete_border_cells(self) -> bool:
-        ...
-
-    # following are called by create_border_cells() to join edges in various ways
+        # no need to do anything if there is no pattern
+        if self.is_empty().value:
+            return True
+        # the pattern may have expanded beyond the grid (typically by 2
+        # cells, but could be more if the rule allows births in empty space)
+        g = self.grid
+        top, left, bottom, right = self.find_edges()
+        # no need to do anything if grid encloses entire pattern
+        if ((g["wd"] == 0 or (g["left"] <= left and g["right"] >= right)) and
+                (g["ht"] == 0 or (g["top"] <= top and g["bottom"] >= bottom))):
+            return True
+        # clear the live cells outside the grid, one strip per side
+        if g["ht"] > 0 and top < g["top"]:
+            self.clear_rect(cint(top), cint(left), cint(g["top"] - 1), cint(right))
+            top = g["top"]
+        if g["ht"] > 0 and bottom > g["bottom"]:
+            self.clear_rect(cint(g["bottom"] + 1), cint(left), cint(bottom), cint(right))
+            bottom = g["bottom"]
+        if g["wd"] > 0 and left < g["left"]:
+            self.clear_rect(cint(top), cint(left), cint(bottom), cint(g["left"] - 1))
+        if g["wd"] > 0 and right > g["right"]:
+            self.clear_rect(cint(top), cint(g["right"] + 1), cint(bottom), cint(right))
+        self.end_of_pattern()
+        return True
+
+    # following are called by create_border_cells() to join edges in various ways;
+    # wrap_cells knows every topology, so they all copy the border the same way
+
+    def _copy_border(self, top: int, left: int, bottom: int, right: int) -> None:
+        """Fill the one cell border around a rectangle from its edges: the
+           live cells of the four edge strips are read in bulk and written
+           to the border cells that show them."""
+        h, w = bottom - top + 1, right - left + 1
+        ry, rx, src = self.ring_cells(h, w)
+        shown = src >= 0
+        ry, rx, src = ry[shown], rx[shown], src[shown]
+        # on an unbounded axis (a tube) the ends are not joined
+        edges = [(top, left, top, right), (bottom, left, bottom, right)] if self.grid["ht"] else []
+        if self.grid["wd"]:
+            edges += [(top, left, bottom, left), (top, right, bottom, right)]
+        strips = [self.live_cells_in(*edge) for edge in edges]
+        xs, ys, states = (np.concatenate(column) for column in zip(*strips))
+        live, first = np.unique((ys - top) * w + (xs - left), return_index=True)
+        if not len(live):
+            return
+        at = np.minimum(np.searchsorted(live, src), len(live) - 1)
+        found = live[at] == src
+        self.set_cells(left + rx[found], top + ry[found], states[first[at[found]]])
 
     def join_twisted_edges(self) -> None:
-        ...
+        g = self.grid
+        self._copy_border(g["top"], g["left"], g["bottom"], g["right"])
 
-    def join_twisted_and_shifted_edges(self) -> None:
-        ...
-
-    def join_shifted_edges(self) -> None:
-        ...
-
-    def join_adjacent_edges(self, pt: cint, pl: cint, pb: cint, pr: cint) -> None:
-        ...
+    join_twisted_and_shifted_edges = join_shifted_edges = join_twisted_edges
 
     def join_edges(self, pt: cint, pl: cint, pb: cint, pr: cint) -> None:
-        ...
+        self._copy_border(as_int(pt), as_int(pl), as_int(pb), as_int(pr))
+
+    join_adjacent_edges = join_edges
 
     # following is called by delete_border_cells()
 
     def clear_rect(self,  top: cint,  left: cint,  bottom: cint,  right: cint):
-        ...
+        xs, ys, states = self.live_cells_in(as_int(top), as_int(left), as_int(bottom), as_int(right))
+        if len(xs):
+            self.set_cells(xs, ys, np.zeros_like(states))
 
 
 class StaticAlgoInfo(object):
@@ -1,6 +1,6 @@
 import abc
 from ctypes import c_int as cint
-import base.util
+import base.util as util
 
 POLL_INTERVAL = cint(1000)
 
@@ -50,16 +50,16 @@ class LifePoll:
            significantly impacting event response time.  Even so, the
            poll positions should be carefully selected to be *not*
            millions of times a second."""
-        self.__countdown -= cint(1)
-        return self.__interrupted if self.__countdown > cint(0) else self.inner_poll()
+        self.__countdown = cint(self.__countdown.value - 1)
+        return self.__interrupted if self.__countdown.value > 0 else self.inner_poll()
 
     def inner_poll(self) -> cint:
         self.bail_if_calculating()
         self.__countdown = POLL_INTERVAL
-        self.__calculating += cint(1)
+        self.__calculating = cint(self.__calculating.value + 1)
         if not self.__interrupted:
             self.__interrupted = self.check_events()
-        self.__calculating -= cint(1)
+        self.__calculating = cint(self.__calculating.value - 1)
         return self.__interrupted
 
     def bail_if_calculating(self) -> None:
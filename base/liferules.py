@@ -0,0 +1,548 @@
+from __future__ import annotations
+
+import collections
+import dataclasses
+import hashlib
+import io
+import os
+import threading
+import typing
+
+import numpy as np
+
+import base.util as util
+
+MAX_RULE_SIZE = 2000  # maximum number of characters in a rule
+RULE_CACHE_SIZE = 64  # compiled rules kept by the process-wide cache
+
+# Like liferules.cpp, a rule is compiled into lookup tables.  rule3x3 has
+# an entry for each of the 512 3x3 neighborhoods (bit y * 3 + x, so bit 4
+# is the cell itself) giving the cell's next state.  leaf_table has an
+# entry for each of the 65536 4x4 blocks (bit y * 4 + x, the layout of a
+# hashlife leaf) giving the next state of the block's center 2x2 as bit
+# (y - 1) * 2 + (x - 1).  Every kind of rule (totalistic, isotropic
+# non-totalistic, MAP) ends up as the same pair of tables.
+LEAF_CELLS = np.arange(1 << 16, dtype=np.int32)
+ALL3X3 = np.arange(512, dtype=np.int32)
+CENTER = 0x10
+
+# neighborhoods as masks over the 3x3 bits; the hexagonal neighborhood is
+# emulated on the square grid by ignoring the NE and SW neighbors
+MOORE = 0x1ff
+HEXAGONAL = 0x1bb
+VON_NEUMANN = 0x0ba
+# The triangular grid's neighborhood doesn't fit in 3x3: a cell with even
+# x + y points down and has the 5 cells above it, 2 either side and the 3
+# below it as neighbors (as Larger than Life's NL at range 1), and a cell
+# with odd x + y is the same upside down.  Its rules are counted directly,
+# so they have no leaf table, and their rule3x3 is instead indexed by the
+# neighbor count, plus TRIANGLE_NEIGHBORS + 1 for a live cell.  Counts of
+# 10 or more can't be written as single digits, so triangular rules may
+# separate their counts with commas instead, as in B4,10/S2,3,11L.
+TRIANGULAR = 0x200
+TRIANGLE_NEIGHBORS = 12
+NEIGHBORHOOD_SUFFIX = {MOORE: "", HEXAGONAL: "H", VON_NEUMANN: "V", TRIANGULAR: "L"}
+GRID_TYPES = {MOORE: "SQUARE_GRID", HEXAGONAL: "HEX_GRID", VON_NEUMANN: "VN_GRID", TRIANGULAR: "TRI_GRID"}
+
+BASE64_CHARACTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+MAP_LENGTHS = {86: MOORE, 22: HEXAGONAL, 6: VON_NEUMANN}  # base64 characters per neighborhood
+
+# Hensel's isotropic non-totalistic notation: the letters valid for each
+# neighbor count and, for counts 1 to 4, one neighborhood of each letter
+# (counts 5 to 7 use the complements of counts 3 to 1)
+HENSEL_LETTERS = "ceaiknjqrytwz"
+RULE_LETTERS = ("ce", "ceaikn", "ceaiknjqry", "ceaiknjqrytwz")
+RULE_NEIGHBORHOODS = ((1, 2), (5, 10, 3, 40, 33, 68), (69, 42, 11, 7, 98, 13, 14, 70, 41, 97),
+                      (325, 170, 15, 45, 99, 71, 106, 102, 43, 101, 105, 78, 108))
+
+
+def mirror_bits(x: int) -> int:
+    """swap the left and right columns of a 3x3 neighborhood"""
+    return (x & 0o222) | ((x & 0o111) << 2) | ((x & 0o444) >> 2)
+
+
+def rotate_bits(x: int) -> int:
+    """rotate a 3x3 neighborhood 90 degrees clockwise"""
+    r = 0
+    for y in range(3):
+        for c in range(3):
+            if (x >> (y * 3 + c)) & 1:
+                r |= 1 << (c * 3 + 2 - y)
+    return r
+
+
+def symmetries(x: int) -> set[int]:
+    """the rotations and reflections of a 3x3 neighborhood"""
+    found = set()
+    for y in (x, mirror_bits(x)):
+        for _ in range(4):
+            found.add(y)
+            y = rotate_bits(y)
+    return found
+
+
+def letter_neighborhoods(count: int, letter: str) -> set[int]:
+    """the 3x3 neighborhoods (center dead) described by a count and a Hensel letter"""
+    nindex = count - 1
+    if nindex > 3:
+        return {x ^ (MOORE & ~CENTER) for x in letter_neighborhoods(8 - count, letter)}
+    # the C++ tables are in Golly's mirrored bit order
+    return symmetries(mirror_bits(RULE_NEIGHBORHOODS[nindex][RULE_LETTERS[nindex].index(letter)]))
+
+
+def letters_for(count: int) -> str:
+    return "" if count in (0, 8) else RULE_LETTERS[min(count, 8 - count) - 1]
+
+
+def neighbors(mask: int) -> int:
+    """the number of neighbors in a neighborhood"""
+    return TRIANGLE_NEIGHBORS if mask == TRIANGULAR else bin(mask).count("1") - 1
+
+
+def count_list(counts: typing.Iterable[int]) -> str:
+    """counts as digits, or separated by commas if some need two digits"""
+    counts = sorted(counts)
+    return ("," if any(n > 9 for n in counts) else "").join(map(str, counts))
+
+
+def parse_counts(part: str) -> list[int] | str:
+    """the counts of a birth or survival part of a triangular rule, or an error"""
+    if ',' not in part:
+        return [int(c) for c in part]
+    if not all(part.split(',')):
+        return "Commas must separate counts."
+    counts = [int(n) for n in part.split(',')]
+    if max(counts) > TRIANGLE_NEIGHBORS:
+        return "Digit greater than neighborhood allows."
+    return counts
+
+
+def neighbor_count(index: np.ndarray, mask: int) -> np.ndarray:
+    return sum((index >> i) & 1 for i in range(9) if i != 4 and (mask >> i) & 1)
+
+
+def make_rule3x3(birth: frozenset[int], survival: frozenset[int], mask: int = MOORE) -> np.ndarray:
+    """tabulate a totalistic rule over all 3x3 neighborhoods"""
+    alive = (ALL3X3 >> 4) & 1
+    count = neighbor_count(ALL3X3, mask)
+    born = np.isin(count, sorted(birth))
+    kept = np.isin(count, sorted(survival))
+    return np.where(alive == 1, kept, born).astype(np.uint8)
+
+
+def make_leaf_table(rule3x3: np.ndarray) -> np.ndarray:
+    """build the 4x4 -> 2x2 table from the 3x3 table"""
+    table = np.zeros(1 << 16, np.uint8)
+    for cy in (1, 2):
+        for cx in (1, 2):
+            index = np.zeros(1 << 16, np.int32)
+            for dy in range(3):
+                for dx in range(3):
+                    index |= ((LEAF_CELLS >> ((cy - 1 + dy) * 4 + cx - 1 + dx)) & 1) << (dy * 3 + dx)
+            table |= rule3x3[index] << ((cy - 1) * 2 + cx - 1)
+    return table
+
+
+def decode_map(base64: str, mask: int) -> np.ndarray:
+    """Build the 3x3 table from a MAP rule.  The MAP bits are indexed by the
+       neighborhood's cells in Golly's bit order, restricted to mask."""
+    neighbors = bin(mask).count("1") - 1
+    bits = []
+    for c in base64:
+        v = BASE64_CHARACTERS.index(c)
+        bits.extend((v >> b) & 1 for b in range(5, -1, -1))
+    rule3x3 = np.zeros(512, np.uint8)
+    golly_mask = mirror_bits(mask)
+    for i in range(512):
+        g, k, m = mirror_bits(i), 0, neighbors
+        for j in range(8, -1, -1):
+            if (golly_mask >> j) & 1:
+                if (g >> j) & 1:
+                    k |= 1 << m
+                m -= 1
+        rule3x3[i] = bits[k]
+    return rule3x3
+
+
+@dataclasses.dataclass(frozen=True)
+class CompiledRule(object):
+    """A parsed rule with its lookup tables.  Instances are shared between
+       all the universes using the rule, so the tables are read-only.
+       birth and survival are the neighbor counts for which some
+       neighborhood gives a birth or survival; totalistic is set when they
+       describe the rule completely."""
+    birth: frozenset[int]
+    survival: frozenset[int]
+    totalistic: bool
+    neighbormask: int
+    rule3x3: np.ndarray
+    leaf_table: np.ndarray
+
+    @staticmethod
+    def compile(rule3x3: np.ndarray, totalistic: bool, mask: int = MOORE) -> CompiledRule:
+        if mask == TRIANGULAR:
+            counts = rule3x3.reshape(2, TRIANGLE_NEIGHBORS + 1)
+            rule3x3 = rule3x3.copy()
+            leaf_table = np.zeros(0, np.uint8)
+            rule3x3.flags.writeable = leaf_table.flags.writeable = False
+            return CompiledRule(frozenset(np.flatnonzero(counts[0]).tolist()),
+                                frozenset(np.flatnonzero(counts[1]).tolist()), True, mask, rule3x3, leaf_table)
+        count = neighbor_count(ALL3X3, mask)
+        alive = (ALL3X3 & CENTER) != 0
+        on = rule3x3 != 0
+        birth = frozenset(int(n) for n in np.unique(count[on & ~alive]))
+        survival = frozenset(int(n) for n in np.unique(count[on & alive]))
+        rule3x3 = rule3x3.copy()
+        leaf_table = make_leaf_table(rule3x3)
+        rule3x3.flags.writeable = leaf_table.flags.writeable = False
+        return CompiledRule(birth, survival, totalistic, mask, rule3x3, leaf_table)
+
+
+class RuleCache(object):
+    """Process-wide LRU cache of compiled rules, keyed by the canonical rule
+       plus the algorithm's canonical suffix.  If a cache directory is set,
+       compiled rules are also saved there and reloaded by later processes."""
+    __entries: collections.OrderedDict[str, CompiledRule]
+    __lock: threading.Lock
+    size: int
+    cache_dir: str | None
+    hits: int
+    misses: int
+
+    def __init__(self, size: int = RULE_CACHE_SIZE):
+        self.__entries = collections.OrderedDict()
+        self.__lock = threading.Lock()
+        self.size = size
+        self.cache_dir = None
+        self.hits = self.misses = 0
+
+    def get(self, key: str, build: typing.Callable[[], CompiledRule]) -> CompiledRule:
+        """return the compiled rule for key, calling build() on a miss"""
+        with self.__lock:
+            compiled = self.__entries.get(key)
+            if compiled is not None:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                return compiled
+            self.misses += 1
+        compiled = self.__load(key)
+        if compiled is None:
+            compiled = build()
+            self.__save(key, compiled)
+        with self.__lock:
+            self.__entries[key] = compiled
+            while len(self.__entries) > self.size:
+                self.__entries.popitem(last=False)
+        return compiled
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".npz")
+
+    def __load(self, key: str) -> CompiledRule | None:
+        if not self.cache_dir:
+            return None
+        try:
+            with np.load(self.__path(key)) as saved:
+                if str(saved["key"]) != key:
+                    return None
+                rule3x3, leaf_table = saved["rule3x3"], saved["leaf_table"]
+                birth = frozenset(int(n) for n in saved["birth"])
+                survival = frozenset(int(n) for n in saved["survival"])
+                totalistic, mask = bool(saved["totalistic"]), int(saved["neighbormask"])
+        except (OSError, KeyError, ValueError):
+            return None
+        rule3x3.flags.writeable = leaf_table.flags.writeable = False
+        return CompiledRule(birth, survival, totalistic, mask, rule3x3, leaf_table)
+
+    def __save(self, key: str, compiled: CompiledRule) -> None:
+        if not self.cache_dir:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            data = io.BytesIO()
+            np.savez(data, key=key, birth=sorted(compiled.birth), survival=sorted(compiled.survival),
+                     totalistic=compiled.totalistic, neighbormask=compiled.neighbormask,
+                     rule3x3=compiled.rule3x3, leaf_table=compiled.leaf_table)
+            util.atomic_write(self.__path(key), data.getvalue())
+        except OSError:
+            pass
+
+
+rule_cache: RuleCache = RuleCache()
+
+
+class LifeRules(object):
+    """This class implements the rules supported by QuickLife and HashLife:
+       totalistic rules in the Moore, hexagonal ("H") and von Neumann ("V")
+       neighborhoods, isotropic non-totalistic rules in Hensel's notation
+       (eg. "B2-a/S12") and MAP rules.  Whatever the notation, the parsed
+       rule is kept as lookup tables shared through the rule cache.
+       Totalistic rules on the triangular grid ("L", counts up to 9) are
+       only accepted for algorithms whose triangular_capable is set."""
+    birth: frozenset[int]
+    survival: frozenset[int]
+    totalistic: bool
+    neighbormask: int
+    rule3x3: np.ndarray
+    leaf_table: np.ndarray
+    __canon_rule: str
+
+    def __init__(self):
+        self.init_rule()
+
+    def init_rule(self) -> None:
+        """default to Conway's Life"""
+        self.__canon_rule = "B3/S23"
+        self._use(rule_cache.get(self.__canon_rule, lambda: CompiledRule.compile(
+            make_rule3x3(frozenset((3,)), frozenset((2, 3))), True)))
+
+    def _use(self, compiled: CompiledRule) -> None:
+        self.birth, self.survival = compiled.birth, compiled.survival
+        self.totalistic, self.neighbormask = compiled.totalistic, compiled.neighbormask
+        self.rule3x3, self.leaf_table = compiled.rule3x3, compiled.leaf_table
+
+    def set_rule(self, rule_string: str, algo=None) -> str | None:
+        """parse a rule like "B3/S23", "b3s23", "23/3", "B2-a/S12", "B2/S34H"
+           or "MAP..." (optionally followed by a bounded grid suffix like
+           ":T100,200"); returns an error message, or None if the rule is valid"""
+        if len(rule_string) > MAX_RULE_SIZE:
+            return "Rule length too long"
+        rule, colon, suffix = rule_string.strip().partition(':')
+        parsed = self.parse(rule)
+        if isinstance(parsed, str):
+            return parsed
+        canon, rule3x3, totalistic, mask = parsed
+        if rule3x3[0]:
+            return "B0 rules are not supported."
+        err = self.check_neighborhood(mask, algo)
+        if err is not None:
+            return err
+
+        if colon:
+            if algo is None:
+                return "Bounded grids are not supported here."
+            err = algo.set_grid_size(colon + suffix)
+            if err != chr(0):
+                return err
+        elif algo is not None:
+            algo.set_grid_size(":")
+
+        if algo is not None:
+            canon += algo.canonical_suffix().rstrip(chr(0))
+        self._use(rule_cache.get(canon, lambda: CompiledRule.compile(rule3x3, totalistic, mask)))
+        self.__canon_rule = canon
+        return None
+
+    def get_rule(self) -> str:
+        return self.__canon_rule
+
+    @staticmethod
+    def check_neighborhood(mask: int, algo) -> str | None:
+        """an error if the algorithm can't run rules on the neighborhood's grid"""
+        if mask == TRIANGULAR and (algo is None or not algo.triangular_capable().value):
+            return "Triangular rules are not supported by this algorithm."
+        return None
+
+    def is_regular_life(self) -> bool:
+        """is this B3/S23?"""
+        return self.totalistic and self.birth == {3} and self.survival == {2, 3}
+
+    @staticmethod
+    def parse(rule: str) -> tuple[str, np.ndarray, bool, int] | str:
+        """Parse a rule without its bounded grid suffix.  Returns the
+           canonical name, the 3x3 table (a count table on the triangular
+           grid), whether the rule is totalistic and the neighborhood mask,
+           or an error."""
+        rule = rule.strip()
+        if rule[:3].lower() == "map":
+            return LifeRules.parse_map(rule[3:])
+
+        # tidy the rule: lower case, no spaces, and note where b, s, / and _ are
+        tidy, mask, totalistic, maxdigit = "", MOORE, True, 0
+        found: dict[str, int] = {}
+        for c in rule.lower():
+            if c == ' ':
+                continue
+            if c in "bs/_":
+                if c in found:
+                    return {'b': "Only one B allowed.", 's': "Only one S allowed.",
+                            '/': "Only one slash allowed.", '_': "Only one underscore allowed."}[c]
+                found[c] = len(tidy)
+            elif c in "hvl":
+                if mask != MOORE:
+                    return "Only one neighborhood allowed."
+                mask = {'h': HEXAGONAL, 'v': VON_NEUMANN, 'l': TRIANGULAR}[c]
+            elif c == ',':
+                found.setdefault(',', len(tidy))
+            elif c == '-':
+                if not tidy or tidy[-1] not in "012345678":
+                    return "Minus can only follow a digit."
+                totalistic = False
+            elif c in "0123456789":
+                maxdigit = max(maxdigit, int(c))
+            elif c == 'w' and not tidy:
+                return "Wolfram rules are not supported."
+            elif c in HENSEL_LETTERS:
+                totalistic = False
+            else:
+                return "Bad character found."
+            tidy += c
+
+        if not tidy:
+            return "Rule cannot be empty string."
+        if '_' in found and '/' in found:
+            return "Can't have slash and underscore."
+        if '_' in found and totalistic:
+            return "Underscore not valid for totalistic rules, use slash."
+        slash = found.get('/', found.get('_'))
+        bpos, spos = found.get('b'), found.get('s')
+        if mask != MOORE:
+            if tidy[-1] not in "hvl":
+                return "Neighborhood must be at end of rule."
+            tidy = tidy[:-1]
+        if slash is None and bpos is None and spos is None:
+            return "Rule must contain a slash or B or S."
+        if maxdigit > neighbors(mask):
+            return "Digit greater than neighborhood allows."
+        if ',' in found and mask != TRIANGULAR:
+            return "Commas are only allowed in triangular rules."
+
+        if slash is None:
+            if bpos is not None and spos is not None:
+                if bpos < spos:
+                    birth, survival = tidy[bpos + 1:spos], tidy[spos + 1:]
+                else:
+                    survival, birth = tidy[spos + 1:bpos], tidy[bpos + 1:]
+            elif bpos is not None:
+                birth, survival = tidy.replace('b', ''), ""
+            else:
+                birth, survival = "", tidy.replace('s', '')
+        else:
+            if bpos is not None and spos is not None and (bpos < slash) == (spos < slash):
+                return "B and S must be either side of slash."
+            left, right = tidy[:slash], tidy[slash + 1:]
+            if (bpos is not None and bpos < slash) or (spos is not None and spos > slash):
+                birth, survival = left, right
+            else:
+                # old style rules like 23/3 put survival first
+                birth, survival = right, left
+            birth, survival = birth.replace('b', '').replace('s', ''), survival.replace('s', '').replace('b', '')
+
+        if not totalistic:
+            if birth and birth[0] not in "012345678":
+                return "Non-totalistic birth must start with a digit."
+            if survival and survival[0] not in "012345678":
+                return "Non-totalistic survival must start with a digit."
+            if mask != MOORE:
+                return "Non-totalistic only supported with Moore neighborhood."
+        if mask == TRIANGULAR:
+            counts = np.zeros((2, TRIANGLE_NEIGHBORS + 1), np.uint8)
+            for i, part in enumerate((birth, survival)):
+                listed = parse_counts(part)
+                if isinstance(listed, str):
+                    return listed
+                counts[i, listed] = 1
+            canon = "B{}/S{}L".format(*(count_list(np.flatnonzero(part).tolist()) for part in counts))
+            return canon, counts.ravel(), True, mask
+        if not LifeRules.letters_valid(birth):
+            return "Letter not valid for birth neighbor count."
+        if not LifeRules.letters_valid(survival):
+            return "Letter not valid for survival neighbor count."
+
+        rule3x3 = np.zeros(512, np.uint8)
+        LifeRules.apply_part(rule3x3, birth, False, mask)
+        LifeRules.apply_part(rule3x3, survival, True, mask)
+        canon, totalistic = LifeRules.canonical_name(rule3x3, mask)
+        return canon, rule3x3, totalistic, mask
+
+    @staticmethod
+    def parse_map(base64: str) -> tuple[str, np.ndarray, bool, int] | str:
+        """parse the base64 part of a MAP rule"""
+        if len(base64) > 2 and base64.endswith("=="):
+            base64 = base64[:-2]
+        if len(base64) not in MAP_LENGTHS:
+            return "MAP rule needs 6, 22 or 86 base64 characters."
+        if any(c not in BASE64_CHARACTERS for c in base64):
+            return "MAP contains illegal base64 character."
+        mask = MAP_LENGTHS[len(base64)]
+        # only the leading bits of the last character are used
+        remain = (1 << bin(mask).count("1")) % 6
+        last = BASE64_CHARACTERS.index(base64[-1]) & (0x3f << (6 - remain) & 0x3f)
+        base64 = base64[:-1] + BASE64_CHARACTERS[last]
+        return "MAP" + base64, decode_map(base64, mask), False, mask
+
+    @staticmethod
+    def letters_valid(part: str) -> bool:
+        """are the letters after each neighbor count valid for that count?"""
+        count = -1
+        for c in part:
+            if c in "012345678":
+                count = int(c)
+            elif c != '-' and c not in letters_for(count):
+                return False
+        return True
+
+    @staticmethod
+    def apply_part(rule3x3: np.ndarray, part: str, survival: bool, mask: int) -> None:
+        """Set the 3x3 entries for the birth or survival part of a rule.  A
+           count alone turns on all its neighborhoods, a count followed by
+           letters turns on just those, and a count followed by a minus and
+           letters turns on all but those."""
+        center = CENTER if survival else 0
+        counts = neighbor_count(ALL3X3, mask)
+        alive = (ALL3X3 & CENTER) != 0
+        i = 0
+        while i < len(part):
+            if part[i] not in "012345678":
+                i += 1
+                continue
+            count = int(part[i])
+            negative = part[i + 1:i + 2] == '-'
+            i += 1 + negative
+            letters = ""
+            while i < len(part) and part[i] in HENSEL_LETTERS:
+                letters += part[i]
+                i += 1
+            if negative or not letters:
+                rule3x3[(counts == count) & (alive == survival)] = 1
+            for letter in letters:
+                for x in letter_neighborhoods(count, letter):
+                    rule3x3[x | center] = not negative
+
+    @staticmethod
+    def canonical_name(rule3x3: np.ndarray, mask: int) -> tuple[str, bool]:
+        """Name a rule from its 3x3 table, using letters only where needed;
+           also returns whether the rule turned out to be totalistic."""
+        counts = neighbor_count(ALL3X3, mask)
+        alive = (ALL3X3 & CENTER) != 0
+        totalistic = True
+        parts = []
+        for center in (0, CENTER):
+            part = ""
+            for count in range(bin(mask).count("1")):
+                letters = letters_for(count) if mask == MOORE else ""
+                if not letters:
+                    if rule3x3[(counts == count) & (alive == bool(center))].any():
+                        part += str(count)
+                    continue
+                on = [c for c in letters if rule3x3[min(letter_neighborhoods(count, c)) | center]]
+                if not on:
+                    continue
+                part += str(count)
+                if len(on) == len(letters):
+                    continue
+                totalistic = False
+                # like Golly, use whichever of the letters and their complement is shorter
+                if len(on) <= len(letters) // 2 or (len(on) == 7 and len(letters) == 13):
+                    part += "".join(sorted(on))
+                else:
+                    part += "-" + "".join(sorted(set(letters) - set(on)))
+            parts.append(part)
+        return "B" + parts[0] + "/S" + parts[1] + NEIGHBORHOOD_SUFFIX[mask], totalistic
@@ -0,0 +1,677 @@
+from __future__ import annotations
+
+import dataclasses
+import re
+
+import numpy as np
+
+import base.generationsalgo as generationsalgo
+import base.liferules as liferules
+import base.util as util
+from base.lifealgo import *
+
+
+# Larger than Life counts the live cells (state 1) within range R of each
+# cell, the cell itself included.  The universe is a dense array of cell
+# states like Generations.  Counting the neighborhood cell by cell would
+# cost O(R^2) per cell, so the counts come from summed-area tables instead:
+# a Moore neighborhood is a box, four lookups in the 2D cumulative sum, and
+# a von Neumann neighborhood is a diamond, whose rows are runs of a row
+# prefix sum that line up along the two diagonals, so it takes two lookups
+# in each of the diagonal cumulative sums of the row prefix sums.  Either
+# way the cost per cell does not depend on R.
+#
+# Each axis of the array is either bounded (it then covers the grid set by
+# the rule's suffix exactly, and the cells beyond it come from the other
+# side of the grid according to the topology) or unbounded (it grows and
+# shrinks to keep R to 2R + MARGIN dead cells around the pattern).
+MAX_RANGE = 500
+MARGIN = 32                   # extra dead cells kept around a growing pattern
+MAX_CELLS = 100000000         # so that population and the tables fit in 32 bits
+NEIGHBORHOODS = "MNC+X*2HB#@3ALGW"  # Golly's neighborhoods; LtLAlgo counts M and N
+HEX_DIGITS = "0123456789ABCDEF"
+
+LTL_RULE = re.compile(r"R(-?\d+),C(-?\d+),M(-?\d+),S(-?\d+)\.\.(-?\d+),B(-?\d+)\.\.(-?\d+),N(.)")
+KELLIE_EVANS_RULE = re.compile(r"(-?\d+),(-?\d+),(-?\d+),(-?\d+),(-?\d+)")
+RANGE_AND_STATES = re.compile(r"R(-?\d+),C(-?\d+)")
+COUNT_RANGE = re.compile(r"(-?\d+)-(-?\d+)|(-?\d+)")
+
+
+@dataclasses.dataclass(frozen=True)
+class LtLRule(object):
+    """A parsed Larger than Life rule.  births and survivals are indexed by
+       the number of live cells in the neighborhood including the cell
+       itself.  A B0 rule without Smax is emulated by alternating between
+       two rules: alt_births and alt_survivals apply in odd generations.
+       Neighborhoods other than NM and NN come with kernel, the weight of
+       each cell within range R (the middle one included); on a triangular
+       grid it applies to cells with even x + y and is flipped upside down
+       for the others.  A weighted (NW) count can be negative, which the
+       last entry of its flags (always clear) stands for."""
+    canon: str
+    range: int
+    states: int
+    ntype: str
+    births: np.ndarray
+    survivals: np.ndarray
+    alt_births: np.ndarray | None = None
+    alt_survivals: np.ndarray | None = None
+    kernel: np.ndarray | None = None
+    state_weights: np.ndarray | None = None  # NW: what a cell in each state counts for
+    grid_type: str = "SQUARE_GRID"
+
+
+def max_neighbors(r: int, ntype: str) -> int:
+    """neighborhood size without the middle cell"""
+    return (2 * r + 1) * (2 * r + 1) - 1 if ntype == 'M' else 2 * r * (r + 1)
+
+
+def shape_kernel(r: int, ntype: str) -> np.ndarray:
+    """The weights of the cells within range r (the middle one included) in
+       one of Golly's fixed neighborhoods, as its fast_* counting loops have
+       them; for the triangular neighborhood (L) r is already doubled."""
+    dy, dx = np.mgrid[-r:r + 1, -r:r + 1]
+    ady, adx = np.abs(dy), np.abs(dx)
+    middle = (dy == 0) & (dx == 0)
+    if ntype == 'M':
+        cells = np.ones(dy.shape, bool)
+    elif ntype == 'N':
+        cells = adx + ady <= r
+    elif ntype == 'C':
+        cells = dx * dx + dy * dy <= r * r + r
+    elif ntype == '2':
+        cells = dx * dx + dy * dy <= r * r
+    elif ntype == '+':
+        cells = (dx == 0) | (dy == 0)
+    elif ntype == 'X':
+        cells = adx == ady
+    elif ntype == '*':
+        cells = (dx == 0) | (dy == 0) | (adx == ady)
+    elif ntype == 'H':
+        cells = np.abs(dx - dy) <= r
+    elif ntype == 'B':
+        cells = ((dx + dy) & 1 == 1) | middle
+    elif ntype == '#':
+        cells = (ady == 1) | (adx == 1) | middle
+    elif ntype == '3':
+        cells = ((dx == 0) & (dy <= 0)) | ((dy == 0) & (dx <= 0)) | ((dx == dy) & (dy > 0))
+    elif ntype == 'A':
+        cells = (dx == 0) | (dy == 0) | (dx == dy)
+    elif ntype == 'L':
+        # rows -r/2 .. r/2 narrowing downwards from 2r+1 cells just above the middle
+        cells = (ady <= r >> 1) & (adx <= np.where(dy < 0, r + 1 + dy, r - dy))
+    elif ntype == 'G':
+        # Golly also counts a middle cell in any state but dead once more
+        return (r + 1 - ady) * (r + 1 - adx) + middle
+    else:
+        raise ValueError(ntype)
+    return cells.astype(np.int64)
+
+
+def read_grid_type(spec: str, pos: int) -> tuple[str, int]:
+    """read the optional H (hexagonal) or L (triangular) after a custom or
+       weighted neighborhood"""
+    if spec[pos:pos + 1] == 'H':
+        return "HEX_GRID", pos + 1
+    if spec[pos:pos + 1] == 'L':
+        return "TRI_GRID", pos + 1
+    return "SQUARE_GRID", pos
+
+
+def read_custom(spec: str, r: int) -> tuple[np.ndarray, str, int] | str:
+    """Read a custom neighborhood (what follows N@): a hex digit for every 4
+       cells within range r but the middle one, the first bit being the
+       bottom right cell.  Returns the kernel, the grid type and the number
+       of characters read, or an error."""
+    length = ((2 * r + 1) * (2 * r + 1) - 1) // 4
+    if len(spec) < length:
+        return "custom neighborhood is too short"
+    if any(d not in HEX_DIGITS for d in spec[:length]):
+        return "invalid custom neighborhood"
+    nibbles = np.array([HEX_DIGITS.index(d) for d in spec[:length]], np.uint8)
+    bits = np.unpackbits(nibbles[:, None], axis=1)[:, 4:].ravel()
+    cells = np.insert(bits, len(bits) // 2, 1)[::-1]
+    grid_type, pos = read_grid_type(spec, length)
+    return cells.reshape(2 * r + 1, 2 * r + 1).astype(np.int64), grid_type, pos
+
+
+def read_weighted(spec: str, r: int, states: int) -> tuple[np.ndarray, np.ndarray | None, int, str, int] | str:
+    """Read a weighted neighborhood (what follows NW): a weight for every cell
+       within range r, row by row, as one hex digit (-7 .. 7, 8 is the sign)
+       or two (-127 .. 127), then optionally a comma and one hex digit per
+       state weighting the cells by state.  Returns the kernel, the state
+       weights, the largest count, the grid type and the number of
+       characters read, or an error."""
+    cells = (2 * r + 1) * (2 * r + 1)
+    if len(spec) < cells:
+        return "weighted neighborhood is too short"
+    run = 0
+    while run < 2 * cells and run < len(spec) and spec[run] in HEX_DIGITS:
+        run += 1
+    digits = np.array([HEX_DIGITS.index(d) for d in spec[:run]], np.int64)
+    if run == cells:
+        weights = np.where(digits & 8, -(digits & 7), digits)
+    elif run == 2 * cells:
+        digits = digits[0::2] << 4 | digits[1::2]
+        weights = np.where(digits & 128, -(digits & 127), digits)
+    else:
+        return "weighted neighborhood is too short"
+    pos, state_weights, most = run, None, 1
+    if spec[pos:pos + 1] == ',':
+        end = pos = pos + 1
+        while end < len(spec) and spec[end] in HEX_DIGITS:
+            end += 1
+        if end - pos != max(states, 2):
+            return "weighted states do not match states in rule"
+        state_weights = np.array([HEX_DIGITS.index(d) for d in spec[pos:end]], np.int64)
+        most, pos = int(state_weights.max()), end
+    grid_type, pos = read_grid_type(spec, pos)
+    maxn = int(weights[weights > 0].sum()) * most
+    return weights.reshape(2 * r + 1, 2 * r + 1), state_weights, maxn, grid_type, pos
+
+
+def flags_string(flags: np.ndarray) -> str:
+    """list the set flags as comma separated counts and ranges like 2-5"""
+    runs, start = [], -1
+    for i, f in enumerate(list(flags) + [0]):
+        if f and start < 0:
+            start = i
+        elif not f and start >= 0:
+            runs.append(str(start) if i - 1 == start else "{}-{}".format(start, i - 1))
+            start = -1
+    return ",".join(runs)
+
+
+def read_counts(rule: str, pos: int, low: int, high: int, name: str) -> tuple[np.ndarray, int, bool] | str:
+    """Read a list of counts and ranges like "2-3,5" up to the first
+       character that is not part of one.  Returns the flags, the new
+       position and whether any count was found, or an error."""
+    flags = np.zeros(high + 1, bool)
+    found = False
+    while True:
+        m = COUNT_RANGE.match(rule, pos)
+        if m is None:
+            return flags, pos, found
+        found = True
+        lo, hi = (int(m.group(1)), int(m.group(2))) if m.group(1) else (int(m.group(3)),) * 2
+        if lo > hi:
+            return name + " range min must be less than max"
+        if lo < low or lo > high or hi < low or hi > high:
+            return name + " value out of range"
+        flags[lo:hi + 1] = True
+        pos = m.end()
+        if rule[pos:pos + 1] != ',':
+            return flags, pos, found
+        pos += 1
+
+
+def parse_rule(rule: str) -> LtLRule | str:
+    """Parse a rule in Larger than Life ("R2,C0,M1,S2..3,B3..3,NM"), Kellie
+       Evans ("5,34,45,34,58") or HROT ("R2,C0,S2-3,B3,NN") syntax, without
+       its bounded grid suffix.  Returns the rule or an error message."""
+    rule = rule.strip().upper()
+    ltl = LTL_RULE.match(rule) if ".." in rule else None
+    kellie_evans = None if ltl else KELLIE_EVANS_RULE.match(rule)
+    if ltl:
+        r, c, m, s1, s2, b1, b2 = (int(g) for g in ltl.groups()[:7])
+        # convert to HROT format
+        rule = "R{},C{},S{}-{},B{}-{},N{}{}".format(r, c, s1, s2, b1, b2, ltl.group(8), rule[ltl.end():])
+    elif kellie_evans:
+        # eg. 5,34,45,34,58 is R5,C0,M1,S34..58,B34..45,NM
+        r, b1, b2, s1, s2 = (int(g) for g in kellie_evans.groups())
+        c, m = 0, 1
+        rule = "R{},C0,S{}-{},B{}-{},NM{}".format(r, s1, s2, b1, b2, rule[kellie_evans.end():])
+    else:
+        m = 0
+    was_ltl = bool(ltl or kellie_evans)
+
+    header = RANGE_AND_STATES.match(rule)
+    if header is None:
+        return "could not find R"
+    r, c = int(header.group(1)), int(header.group(2))
+    if r < 1:
+        return "R value is too small"
+    if r > MAX_RANGE:
+        return "R value is too big"
+    if c < 0 or c > 256:
+        return "C value must be from 0 to 256"
+
+    nbrhd = rule.find(",N")
+    kernel = state_weights = None
+    grid_type = "SQUARE_GRID"
+    if nbrhd < 0:
+        if was_ltl:
+            return "neighborhood not found"
+        ntype = 'M'
+    else:
+        ntype = rule[nbrhd + 2:nbrhd + 3]
+        if not ntype or ntype not in NEIGHBORHOODS:
+            return "invalid neighborhood specificed"
+        nbrend = nbrhd + 3
+        if ntype == '@':
+            custom = read_custom(rule[nbrend:], r)
+            if isinstance(custom, str):
+                return custom
+            kernel, grid_type, used = custom
+            nbrend += used
+        elif ntype == 'W':
+            weighted = read_weighted(rule[nbrend:], r, c)
+            if isinstance(weighted, str):
+                return weighted
+            kernel, state_weights, maxn, grid_type, used = weighted
+            nbrend += used
+    if ntype in "MN":
+        maxn = max_neighbors(r, ntype)
+    elif ntype != 'W':
+        if kernel is None:
+            kernel = shape_kernel(2 * r if ntype == 'L' else r, ntype)
+        maxn = int(kernel.sum()) - 1
+    canon_r = r
+    if ntype == 'L':
+        # the triangular neighborhood reaches twice as far across as down
+        r += r
+        if r > MAX_RANGE:
+            return "R value is too big"
+    if ntype == 'N':
+        grid_type = "VN_GRID"
+    elif ntype in "HA":
+        grid_type = "HEX_GRID"
+    elif ntype == 'L':
+        grid_type = "TRI_GRID"
+
+    pos = header.end()
+    if rule[pos:pos + 1] != ',':
+        return "missing , before S"
+    if rule[pos + 1:pos + 2] != 'S':
+        return "missing S"
+    counts = read_counts(rule, pos + 2, m, maxn + m, "S")
+    if isinstance(counts, str):
+        return counts
+    survivals, pos, found = counts
+    if not found:
+        if rule[pos:pos + 1] != ',':
+            return "missing , before B"
+        pos += 1
+    elif rule[pos - 1] != ',':
+        return "missing , before B"
+    if rule[pos:pos + 1] != 'B':
+        return "missing B"
+    counts = read_counts(rule, pos + 1, 0, maxn + m, "B")
+    if isinstance(counts, str):
+        return counts
+    births, pos, found = counts
+    if nbrhd >= 0:
+        if not found and rule[pos:pos + 1] == ',':
+            pos += 1
+        if pos != nbrhd + 1:
+            return "bad characters before N"
+        pos = nbrend
+    if pos != len(rule):
+        return "bad suffix"
+    if births[0] and c > 2:
+        return "B0 is not allowed with more than 2 states"
+
+    scount = c if c > 2 else 0
+    # custom and weighted neighborhoods keep their digits in the name
+    nbrhd_name = ntype + (rule[nbrhd + 3:nbrend] if ntype in "@W" else "")
+    if was_ltl:
+        canon = "R{},C{},M{},S{}..{},B{}..{},N{}".format(canon_r, scount, m, s1, s2, b1, b2, nbrhd_name)
+    else:
+        canon = "R{},C{},S{},B{}".format(canon_r, scount, flags_string(survivals), flags_string(births))
+        if ntype != 'M':
+            canon += ",N" + nbrhd_name
+
+    alt_births = alt_survivals = None
+    if births[0]:
+        births, survivals = births[:maxn + 1], survivals[:maxn + 1]
+        if survivals[maxn]:
+            # B0 with Smax: the rule becomes NOT(reverse(bits))
+            births, survivals = ~survivals[::-1], ~births[::-1]
+        else:
+            # B0 without Smax alternates between reverse(bits) in odd
+            # generations and NOT(bits) in even generations
+            alt_births, alt_survivals = survivals[::-1].copy(), births[::-1].copy()
+            births, survivals = ~births, ~survivals
+    if m == 0 and ntype != 'W':
+        # the counts include the middle cell, so survivals move up by one
+        # (a weighted neighborhood gives the middle cell its own weight)
+        survivals = np.concatenate(([False], survivals))
+        if alt_survivals is not None:
+            alt_survivals = np.concatenate(([False], alt_survivals))
+    if ntype == 'W':
+        # one more count for the negative ones
+        maxn += 1
+    for a in (kernel, state_weights):
+        if a is not None:
+            a.flags.writeable = False
+    return LtLRule(canon, r, max(c, 2), ntype, *(pad_flags(f, maxn) for f in (births, survivals)),
+                   *(None if f is None else pad_flags(f, maxn) for f in (alt_births, alt_survivals)),
+                   kernel, state_weights, grid_type)
+
+
+def pad_flags(flags: np.ndarray, maxn: int) -> np.ndarray:
+    """extend flags to every possible count 0 .. maxn + 1"""
+    padded = np.zeros(maxn + 2, bool)
+    padded[:len(flags)] = flags[:maxn + 2]
+    padded.flags.writeable = False
+    return padded
+
+
+def diagonal_cumsum(a: np.ndarray, down_right: bool) -> np.ndarray:
+    """Cumulative sums of a along its down-right (or down-left) diagonals:
+       each cell gets the sum of itself and the cells up-left (up-right)
+       of it.  The diagonals are skewed into columns and summed at once."""
+    h, w = a.shape
+    rows = np.arange(h)[:, None]
+    cols = np.arange(w)[None, :] + (h - 1 - rows if down_right else rows)
+    skewed = np.zeros((h, w + h), a.dtype)
+    skewed[rows, cols] = a
+    np.cumsum(skewed, axis=0, out=skewed)
+    return skewed[rows, cols]
+
+
+def moore_counts(live: np.ndarray, r: int) -> np.ndarray:
+    """Live cells in each (2r+1) x (2r+1) box of live, which has a border of
+       r cells; returns the counts for the inner cells."""
+    h, w = live.shape
+    table = np.zeros((h + 1, w + 1), np.int32)
+    np.cumsum(np.cumsum(live, axis=0, dtype=np.int32), axis=1, out=table[1:, 1:])
+    k = 2 * r + 1
+    return table[k:, k:] - table[:-k, k:] - table[k:, :-k] + table[:-k, :-k]
+
+
+def neumann_counts(live: np.ndarray, r: int) -> np.ndarray:
+    """Live cells within distance |dx| + |dy| <= r in live, which has a border
+       of r cells; returns the counts for the inner cells."""
+    h, w = live.shape
+    if h > w:
+        # the skewed diagonal tables cost h * (w + h), so keep h small
+        return neumann_counts(live.T, r).T
+    # a further border of r + 1 dead cells keeps every lookup in range
+    pad = r + 1
+    prefix = np.zeros((h + 2 * pad, w + 2 * pad + 1), np.int32)
+    np.cumsum(live, axis=1, dtype=np.int32, out=prefix[pad:-pad, pad + 1:-pad])
+    prefix[pad:-pad, -pad:] = prefix[pad:-pad, -pad - 1:-pad]
+    down_right = diagonal_cumsum(prefix, True)
+    down_left = diagonal_cumsum(prefix, False)
+    # row y0 + dy of the diamond is the run of x0 - (r - |dy|) .. x0 + r - |dy|,
+    # ie. prefix[y0 + dy, x0 + r + 1 - |dy|] - prefix[y0 + dy, x0 - r + |dy|];
+    # for dy <= 0 and dy > 0 each of the two terms lies along one diagonal
+    ih, iw = h - 2 * r, w - 2 * r
+
+    def at(table: np.ndarray, dy: int, dx: int) -> np.ndarray:
+        y, x = pad + r + dy, pad + r + dx
+        return table[y:y + ih, x:x + iw]
+
+    return (at(down_right, 0, r + 1) - at(down_right, -r - 1, 0) +
+            at(down_left, r, 1) - at(down_left, 0, r + 1) -
+            at(down_left, 0, -r) + at(down_left, -r - 1, 1) -
+            at(down_right, r, 0) + at(down_right, 0, -r))
+
+
+class LtLAlgo(LifeAlgo):
+    """Larger than Life: range R totalistic rules with any number of dying
+       states, in the Moore or von Neumann neighborhood, on an unbounded
+       universe or on any of the bounded grids LifeAlgo.set_grid_size
+       accepts (plane, torus, shifted torus, Klein bottle, cross-surface,
+       sphere, infinite tube)."""
+    _states: np.ndarray  # cell states; a bounded axis covers the grid exactly
+    _x0: int             # universe coordinates of _states[0, 0]
+    _y0: int
+    _population: int
+    _pop_valid: bool
+    _rule: LtLRule
+    _border: tuple | None  # cached (key, index) map of the bordered array
+    _neighborhoods = "MN"  # the neighborhoods the engine can count
+
+    def __init__(self):
+        super(LtLAlgo, self).__init__()
+        self._increment = 1
+        self._x0 = self._y0 = 0
+        self._states = np.zeros((0, 0), np.uint8)
+        self._population = 0
+        self._pop_valid = True
+        self._border = None
+        self.set_rule(self.default_rule)
+
+    # coordinates and storage management
+
+    def _locate(self, x: int, y: int) -> tuple[int, int]:
+        """return the row and column of a cell (possibly out of range)"""
+        return y - self._y0, x - self._x0
+
+    def _reframe(self, y0: int, x0: int, h: int, w: int) -> None:
+        """move the array to cover h rows and w columns from (x0, y0),
+           keeping the cells that stay inside it"""
+        if h * w > MAX_CELLS:
+            util.life_warning("Sorry, but the universe can't be expanded that far.")
+            return
+        states = np.zeros((h, w), np.uint8)
+        oy, ox = max(y0, self._y0), max(x0, self._x0)
+        ey = min(y0 + h, self._y0 + self._states.shape[0])
+        ex = min(x0 + w, self._x0 + self._states.shape[1])
+        if oy < ey and ox < ex:
+            states[oy - y0:ey - y0, ox - x0:ex - x0] = \
+                self._states[oy - self._y0:ey - self._y0, ox - self._x0:ex - self._x0]
+        if self._states.any() and np.count_nonzero(states) != np.count_nonzero(self._states):
+            self._clip()
+        self._states, self._y0, self._x0 = states, y0, x0
+        self._pop_valid = False
+
+    def _clip(self) -> None:
+        """save the cells that are about to fall outside a shrinking grid"""
+        g = self.grid
+        rows, cols = np.nonzero(self._states)
+        ys, xs = rows + self._y0, cols + self._x0
+        outside = np.zeros(len(ys), bool)
+        if g["wd"] > 0:
+            outside |= (xs < g["left"]) | (xs > g["right"])
+        if g["ht"] > 0:
+            outside |= (ys < g["top"]) | (ys > g["bottom"])
+        self.clipped_cells = [(int(x), int(y), int(self._states[r, c]))
+                              for x, y, r, c in zip(xs[outside], ys[outside], rows[outside], cols[outside])]
+
+    def _axis_frame(self, lo: int, hi: int, origin: int, size: int,
+                    bounded: int, edge: int, grow: bool) -> tuple[int, int]:
+        """Choose the origin and size of one axis of the array.  A bounded
+           axis covers the grid; an unbounded axis covers the live cells
+           lo .. hi (universe coordinates) with R to 2R + MARGIN cells to
+           spare, or more when grow is set (so loading a pattern stays cheap)."""
+        if bounded:
+            return edge, bounded
+        r = self._rule.range
+        if lo > hi:
+            return origin, size
+        if origin + r <= lo and hi < origin + size - r and \
+                (grow or (lo - origin <= 4 * r + 2 * MARGIN and origin + size - 1 - hi <= 4 * r + 2 * MARGIN)):
+            return origin, size
+        spare = 2 * r + MARGIN + ((hi - lo) >> 1 if grow else 0)
+        return lo - spare, hi - lo + 1 + 2 * spare
+
+    def _fit(self, x: int | None = None, y: int | None = None) -> None:
+        """make the array fit the grid and the pattern (plus cell x, y)"""
+        rows, cols = np.flatnonzero(self._states.any(axis=1)), np.flatnonzero(self._states.any(axis=0))
+        top, bottom = (self._y0 + int(rows[0]), self._y0 + int(rows[-1])) if len(rows) else (0, -1)
+        left, right = (self._x0 + int(cols[0]), self._x0 + int(cols[-1])) if len(cols) else (0, -1)
+        if y is not None:
+            top, bottom, left, right = min(top, y), max(bottom, y), min(left, x), max(right, x)
+            if not len(rows):
+                top, bottom, left, right = y, y, x, x
+        grow = y is not None
+        y0, h = self._axis_frame(top, bottom, self._y0, self._states.shape[0],
+                                 self.grid["ht"], self.grid["top"], grow)
+        x0, w = self._axis_frame(left, right, self._x0, self._states.shape[1],
+                                 self.grid["wd"], self.grid["left"], grow)
+        if (y0, x0, h, w) != (self._y0, self._x0) + self._states.shape:
+            self._reframe(y0, x0, h, w)
+
+    def _border_index(self) -> np.ndarray:
+        """border_index for the array with a border of R cells, cached
+           until the array or the grid changes"""
+        h, w = self._states.shape
+        r = self._rule.range
+        g, twist, shift = self.grid, self.twist, self.shift
+        key = (h, w, r, g["wd"], g["ht"], self.bounded_plane, self.sphere,
+               twist["h"], twist["v"], shift["h"], shift["v"])
+        if self._border is not None and self._border[0] == key:
+            return self._border[1]
+        index = self.border_index(h, w, r)
+        self._border = (key, index)
+        return index
+
+    # cell access
+
+    def _in_grid(self, x: int, y: int) -> bool:
+        g = self.grid
+        return (not g["wd"] or g["left"] <= x <= g["right"]) and (not g["ht"] or g["top"] <= y <= g["bottom"])
+
+    def set_cell(self, x: cint, y: cint, new_state: cint) -> cint:
+        x, y = as_int(x), as_int(y)
+        new_state = as_int(new_state)
+        if new_state < 0 or new_state >= self._max_cell_states.value or not self._in_grid(x, y):
+            return cint(-1)
+        row, col = self._locate(x, y)
+        if new_state and not (0 <= row < self._states.shape[0] and 0 <= col < self._states.shape[1]):
+            self._fit(x, y)
+            row, col = self._locate(x, y)
+        if 0 <= row < self._states.shape[0] and 0 <= col < self._states.shape[1]:
+            self._states[row, col] = new_state
+            self._pop_valid = False
+        elif new_state:
+            return cint(-1)
+        return cint(0)
+
+    def get_cell(self, x: cint, y: cint) -> cint:
+        x, y = as_int(x), as_int(y)
+        if not self._in_grid(x, y):
+            return cint(-1)
+        row, col = self._locate(x, y)
+        if 0 <= row < self._states.shape[0] and 0 <= col < self._states.shape[1]:
+            return cint(int(self._states[row, col]))
+        return cint(0)
+
+    def next_cell(self, x: cint, y: cint, v: cint) -> cint:
+        """return the distance to the next non-dead cell at or to the right
+           of (x, y) and store its state in v, or return -1 if there is none"""
+        x, y = as_int(x), as_int(y)
+        row, col = self._locate(x, y)
+        if not 0 <= row < self._states.shape[0] or col >= self._states.shape[1]:
+            return cint(-1)
+        col = max(col, 0)
+        found = np.flatnonzero(self._states[row, col:])
+        if not len(found):
+            return cint(-1)
+        col += int(found[0])
+        if isinstance(v, cint):
+            v.value = int(self._states[row, col])
+        return cint(self._x0 + col - x)
+
+    def end_of_pattern(self):
+        """call after set_cell calls"""
+        self._poller.bail_if_calculating()
+        self._pop_valid = False
+        return cint(0)
+
+    @property
+    def population(self) -> int:
+        """the number of cells in any state but dead, as in Golly"""
+        if not self._pop_valid:
+            self._population = int(np.count_nonzero(self._states))
+            self._pop_valid = True
+        return self._population
+
+    def is_empty(self) -> cint:
+        return cint(not self._states.any())
+
+    def find_edges(self) -> tuple[int, int, int, int]:
+        rows = np.flatnonzero(self._states.any(axis=1))
+        if not len(rows):
+            return 0, 0, 0, 0
+        cols = np.flatnonzero(self._states.any(axis=0))
+        return (self._y0 + int(rows[0]), self._x0 + int(cols[0]),
+                self._y0 + int(rows[-1]), self._x0 + int(cols[-1]))
+
+    # rules and stepping
+
+    @property
+    def default_rule(self) -> str:
+        return "R1,C0,M0,S2..3,B3..3,NM"
+
+    def set_rule(self, s: str) -> str | None:
+        if len(s) > liferules.MAX_RULE_SIZE:
+            return "Rule name is too long."
+        rule, colon, suffix = s.partition(':')
+        parsed = parse_rule(rule)
+        if isinstance(parsed, str):
+            return parsed
+        if parsed.ntype not in self._neighborhoods:
+            return "Only the Moore (NM) and von Neumann (NN) neighborhoods are supported."
+        err = self.set_grid_size(colon + suffix if colon else ":")
+        if err != chr(0):
+            return err
+        g = self.grid
+        if 0 < g["wd"] < 2 * parsed.range or 0 < g["ht"] < 2 * parsed.range:
+            # like Golly, a grid must be at least twice the range wide
+            g["wd"], g["ht"] = (max(g[k], 2 * parsed.range) if g[k] else 0 for k in ("wd", "ht"))
+            g["left"], g["top"] = -(g["wd"] // 2), -(g["ht"] // 2)
+            g["right"], g["bottom"] = g["left"] + g["wd"] - 1, g["top"] + g["ht"] - 1
+        self.unbounded = not (g["wd"] or g["ht"])
+        self._rule = parsed
+        self._max_cell_states = cint(parsed.states)
+        self._grid_type = TGridType[parsed.grid_type]
+        self._canon_rule = parsed.canon + self.canonical_suffix().rstrip(chr(0))
+        # drop states the rule does not have, then fit the array to the grid
+        self._states[self._states >= parsed.states] = 0
+        self.clipped_cells = []
+        self._fit()
+        self._pop_valid = False
+        return None
+
+    def get_rule(self) -> str:
+        return self._canon_rule
+
+    def _bordered(self, cells: np.ndarray, dead=0) -> np.ndarray:
+        """cells (an array shaped like the states) with a border of R cells
+           that follows the grid's topology; cells beyond the grid are dead"""
+        if self.unbounded:
+            return np.pad(cells, self._rule.range, constant_values=dead)
+        index = self._border_index()
+        return np.where(index >= 0, cells.ravel()[index], cells.dtype.type(dead))
+
+    def _counts(self, live: np.ndarray) -> np.ndarray:
+        """the number of live cells in the neighborhood of every cell"""
+        bordered = self._bordered(live)
+        if self._rule.ntype == 'M':
+            return moore_counts(bordered, self._rule.range)
+        return neumann_counts(bordered, self._rule.range)
+
+    def _dogen(self) -> None:
+        self._fit()
+        rule = self._rule
+        births, survivals = rule.births, rule.survivals
+        if rule.alt_births is not None and self._generation & 1:
+            births, survivals = rule.alt_births, rule.alt_survivals
+        live = self._states == 1
+        counts = self._counts(live)
+        states = self._states
+        alive = np.where(live, survivals[counts], births[counts] & (states == 0))
+        self._states = generationsalgo.advance(states, alive, rule.states)
+        self._generation += 1
+
+    def step(self) -> None:
+        """do inc gens"""
+        self._poller.bail_if_calculating()
+        for _ in range(self._increment):
+            if self._poller.poll():
+                break
+            if self._states.any():
+                self._dogen()
+            else:
+                # B0 is emulated, so an empty universe stays empty
+                self._generation += 1
+        self._pop_valid = False
+        self.step_hperf, self.inc_hperf = self.running_hperf.report_step(
+            self.step_hperf, self.inc_hperf, float(self._generation), self._verbose)
+
+    def write_native_format(self, os: io.StringIO, comments: str) -> str:
+        return "No native format for ltlalgo yet."
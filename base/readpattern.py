@@ -0,0 +1,318 @@
+from __future__ import annotations
+
+import gzip
+import itertools
+import re
+import typing
+
+import numpy as np
+
+import base.lifealgo as lifealgo
+
+
+# A port of Golly's readpattern.cpp.  The format is told from the first
+# non-blank line as Golly does: Life 1.05/1.06, RLE (with the #CXRLE and #r
+# extensions, or headerless), David Bell's dblife, macrocell, which the
+# hashlife engines read themselves, and otherwise a text pattern like
+# "...ooo$$$ooo".  MCell files are not read yet.
+#
+# The readers gather runs of cells and write them with one set_cells call
+# instead of a set_cell per cell.  As in Golly, a rule the universe rejects
+# is returned as the error, so a caller can try the next algorithm.
+SET_CELL_ERROR = "Impossible; set cell error for state 1"
+STATE_ERROR = "Cell state out of range for this algorithm"
+
+
+class Runs:
+    """runs of cells in one state along a row, written with set_cells"""
+
+    def __init__(self):
+        self.xs: list[int] = []
+        self.ys: list[int] = []
+        self.lengths: list[int] = []
+        self.states: list[int] = []
+
+    def add(self, x: int, y: int, n: int, state: int) -> None:
+        if n > 0:
+            self.xs.append(x)
+            self.ys.append(y)
+            self.lengths.append(n)
+            self.states.append(state)
+
+    def write(self, imp: lifealgo.LifeAlgo, err: str) -> str | None:
+        if not self.lengths:
+            return None
+        lengths = np.array(self.lengths, np.int64)
+        # the offset of each cell within its run
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        xs = np.repeat(np.array(self.xs, np.int64), lengths) + offsets
+        ys = np.repeat(np.array(self.ys, np.int64), lengths)
+        states = np.repeat(np.array(self.states, np.int64), lengths)
+        if imp.set_cells(xs, ys, states).value < 0:
+            return err
+        return None
+
+
+def leading_ints(s: str, count: int) -> list[int]:
+    """the first count whitespace separated ints of s, like sscanf("%d %d");
+       missing ones are 0"""
+    values = []
+    for word in s.split()[:count]:
+        m = re.match(r"[-+]?\d+", word)
+        if m is None:
+            break
+        values.append(int(m.group()))
+    return values + [0] * (count - len(values))
+
+
+def rule_word(s: str) -> str:
+    """the rule at the start of s, up to any whitespace"""
+    words = s.split(None, 1)
+    return words[0] if words else ""
+
+
+def read_text_pattern(imp: lifealgo.LifeAlgo, lines: typing.Iterable[str]) -> str | None:
+    """read a text pattern like "...ooo$$$ooo" where '.', ',' and chars <= ' '
+       are dead cells, '$' is 10 dead cells and anything else a live cell"""
+    runs = Runs()
+    for y, line in enumerate(lines):
+        x = 0
+        for c in line:
+            if c in '.,' or c <= ' ':
+                x += 1
+            elif c == '$':
+                x += 10
+            else:
+                runs.add(x, y, 1, 1)
+                x += 1
+    return runs.write(imp, SET_CELL_ERROR)
+
+
+def parse_xrle(line: str, imp: lifealgo.LifeAlgo) -> tuple[int, int] | None:
+    """apply the Gen=n of a "#CXRLE key=value ..." line and return its Pos=x,y"""
+    pos = None
+    for key, value in re.findall(r"(\w+)=(\S*)", line):
+        if key.startswith("Pos"):
+            m = re.match(r"([-+]?\d+),([-+]?\d+)", value)
+            if m:
+                pos = int(m.group(1)), int(m.group(2))
+        elif key.startswith("Gen"):
+            m = re.match(r"\d+", value)
+            if m:
+                imp.generation = int(m.group())
+    return pos
+
+
+def read_rle(imp: lifealgo.LifeAlgo, lines: typing.Iterator[str], line: str) -> str | None:
+    """read an RLE pattern, with states above 1 as 'A'..'X' or a 'p'..'y'
+       prefix and 'A'..'X' as in Golly's extended RLE"""
+    xoff = yoff = 0
+    pos = None
+    sawrule = False
+    while line.startswith("#CXRLE"):
+        pos = parse_xrle(line, imp) or pos
+        line = next(lines, None)
+        if line is None:
+            return None
+    if pos is not None:
+        xoff, yoff = pos
+    runs = Runs()
+    n = x = y = 0
+    gwd = ght = 0
+    for line in itertools.chain([line], lines):
+        if line.startswith('#'):
+            if line[1:2] == 'r':
+                err = imp.set_rule(rule_word(line[2:]))
+                if err:
+                    return err
+                sawrule = True
+        # a line starting with 'x' is only a header if 'x' is followed by
+        # whitespace or '=', since in extended RLE it is otherwise a state
+        elif line[:1] == 'x' and (line[1:2] <= ' ' or line[1:2] == '='):
+            fields = line.split('=')
+            wd = leading_ints(fields[1], 1)[0] if len(fields) > 1 else 0
+            ht = leading_ints(fields[2], 1)[0] if len(fields) > 2 else 0
+            m = re.search(r"rule[\s=]*(\S*)", line)
+            if m:
+                err = imp.set_rule(m.group(1).rstrip(','))
+                if err:
+                    return err
+                sawrule = True
+            if not sawrule:
+                # without a rule try Conway's Life; if the universe rejects it
+                # the error lets the caller look for an algorithm that doesn't
+                err = imp.set_rule("B3/S23")
+                if err:
+                    return err
+            gwd, ght = imp.grid["wd"], imp.grid["ht"]
+            if pos is None and (gwd > 0 or ght > 0):
+                if 0 < wd and (wd <= gwd or gwd == 0) and 0 < ht and (ht <= ght or ght == 0):
+                    # the pattern fits the bounded grid, so centre it
+                    xoff, yoff = -(wd // 2), -(ht // 2)
+                else:
+                    # start at the grid's top left corner to fit as much as we can
+                    xoff, yoff = -(gwd // 2), -(ght // 2)
+        else:
+            i = 0
+            while i < len(line):
+                c = line[i]
+                if '0' <= c <= '9':
+                    n = n * 10 + ord(c) - ord('0')
+                    i += 1
+                    continue
+                n = n or 1
+                if c in 'b.':
+                    x += n
+                elif c == '$':
+                    x = 0
+                    y += n
+                elif c == '!':
+                    return runs.write(imp, STATE_ERROR)
+                elif 'o' <= c <= 'y' or 'A' <= c <= 'X':
+                    if c == 'o':
+                        state = 1
+                    elif c < 'o':
+                        state = ord(c) - ord('A') + 1
+                    elif i + 1 < len(line) and 'A' <= line[i + 1] <= 'X':
+                        i += 1
+                        state = 24 * (ord(c) - ord('p') + 1) + ord(line[i]) - ord('A') + 1
+                    else:
+                        # be forgiving of non-standard files with a bare prefix
+                        state = 1
+                    # keep the run within any bounded grid
+                    if ght == 0 or y < ght:
+                        runs.add(xoff + x, yoff + y, min(n, gwd - x) if gwd else n, state)
+                    x += n
+                n = 0
+                i += 1
+    return runs.write(imp, STATE_ERROR)
+
+
+def read_pc_life(imp: lifealgo.LifeAlgo, lines: typing.Iterable[str]) -> str | None:
+    """read Alan Hensel's PC Life format, either 1.05 or 1.06"""
+    x = y = leftx = 0
+    sawrule = False
+    runs = Runs()
+    for line in lines:
+        if line.startswith('#'):
+            if line[1:2] == 'P':
+                if not sawrule:
+                    # without a rule try Conway's Life (once, for the many #P lines)
+                    err = imp.set_rule("B3/S23")
+                    if err:
+                        return err
+                    sawrule = True
+                x, y = leading_ints(line[2:], 2)
+                leftx = x
+            elif line[1:2] == 'N':
+                err = imp.set_rule("B3/S23")
+                if err:
+                    return err
+                sawrule = True
+            elif line[1:2] == 'R':
+                err = imp.set_rule(rule_word(line[2:]))
+                if err:
+                    return err
+                sawrule = True
+        elif line[:1] == '-' or '0' <= line[:1] <= '9':
+            runs.add(*leading_ints(line, 2), 1, 1)
+        elif line[:1] in ('.', '*'):
+            for c in line:
+                if c == '*':
+                    runs.add(x, y, 1, 1)
+                x += 1
+            x = leftx
+            y += 1
+    return runs.write(imp, SET_CELL_ERROR)
+
+
+def read_dblife(imp: lifealgo.LifeAlgo, lines: typing.Iterable[str]) -> str | None:
+    """read David Bell's dblife format, rows like "23.O15.3O15.3O15.O4.4O" """
+    runs = Runs()
+    y = 0
+    for line in lines:
+        if line.startswith('!'):
+            continue
+        n = x = 0
+        for c in line:
+            if '0' <= c <= '9':
+                n = n * 10 + ord(c) - ord('0')
+                continue
+            n = n or 1
+            if c == '.':
+                x += n
+            elif c == 'O':
+                runs.add(x, y, n, 1)
+                x += n
+            # other chars are dblife commands like "5k10h@"
+            n = 0
+        y += 1
+    return runs.write(imp, SET_CELL_ERROR)
+
+
+def is_plain_rle(line: str) -> bool:
+    """guess whether the line starts a headerless RLE pattern rather than
+       a text pattern"""
+    end = line.find('!')
+    if end >= 0:
+        # '!' must be the last printable char
+        if any(c > ' ' for c in line[end + 1:]):
+            return False
+    else:
+        end = len(line)
+    prev_digit = have_digit = False
+    for c in line[:end]:
+        if c <= ' ':
+            if prev_digit:
+                return False      # space inside a token
+        elif '0' <= c <= '9':
+            prev_digit = have_digit = True
+        elif c in 'bo$':
+            prev_digit = False
+        else:
+            return False
+    if prev_digit:
+        return False              # the line ends inside a token
+    # digits or a closing '!' are unlikely in a text pattern
+    return have_digit or end < len(line)
+
+
+def load_pattern(imp: lifealgo.LifeAlgo, lines: typing.Iterator[str]) -> str | None:
+    """read the lines of a pattern file into the universe"""
+    # Conway's Life unless the pattern gives a rule, as text patterns can't
+    if imp.set_rule("B3/S23") and imp.set_rule("Life"):
+        # eg. RuleLoader without a Life.rule file
+        imp.set_rule(imp.default_rule)
+    line = next((line for line in lines if line), "")
+    if line.startswith("#Li") or line.startswith("#P "):
+        # #Li is for the #LLAB comment of LifeLab files; #P without a header
+        # comes from WinLifeSearch
+        err = read_pc_life(imp, itertools.chain([line], lines))
+    elif line.startswith("#MCell"):
+        err = "MCell files are not supported."
+    elif line.startswith('#') or line.startswith('x'):
+        err = read_rle(imp, lines, line)
+    elif line.startswith('!'):
+        err = read_dblife(imp, itertools.chain([line], lines))
+    elif line.startswith('['):
+        err = imp.read_macrocell(itertools.chain([line], lines))
+    elif is_plain_rle(line):
+        err = read_rle(imp, lines, line)
+    else:
+        err = read_text_pattern(imp, itertools.chain([line], lines))
+    if err is None:
+        imp.end_of_pattern()
+    return err
+
+
+def read_pattern(filename: str, imp: lifealgo.LifeAlgo) -> str | None:
+    """read a pattern file, which may be gzipped, into the universe;
+       returns an error message or None"""
+    try:
+        with open(filename, "rb") as f:
+            data = f.read()
+        if data[:2] == b"\x1f\x8b":
+            data = gzip.decompress(data)
+    except (OSError, EOFError):
+        return "Can't open pattern file:\n" + filename
+    return load_pattern(imp, iter(data.decode("latin-1").splitlines()))
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import importlib.util
+import os
+import sys
+import typing
+
+import numpy as np
+
+import base.liferules as liferules
+import base.util as util
+
+
+# QuickLife's generic counting kernels read the rule from birth and survival
+# masks as they run.  Here each totalistic rule gets a kernel of its own:
+# the rule is minimised into a sum of products over the four count bits and
+# the center cell (counts above the neighborhood's size can't happen, so
+# they are free to cover), and that expression is written into the source
+# of a Numba kernel.  Life, B3/S23, becomes (b0 & b1 & ~b2) |
+# (b1 & ~b2 & center), with b3 dropped.  The hexagonal and von Neumann
+# kernels leave out the planes of the cells outside the neighborhood.
+#
+# Numba can only cache a compiled function on disk when its source is in a
+# file, so the source goes into a module in the rule cache's directory,
+# named by a hash of the canonical rule, and is compiled with cache=True.  Later
+# processes import the module and load its machine code instead of
+# compiling it again.  Without a rule cache directory there are no
+# specialised kernels and QuickLife uses its generic one.
+KERNEL_FORMAT = 2           # bump when the generated source changes
+COUNT_BITS = ("b0", "b1", "b2", "b3", "center")
+# the planes of the 3x3 neighborhood, by bit
+PLANES = ("nw", "n", "ne", "west", "center", "east", "sw", "s", "se")
+
+KERNEL_HEADER = '''\
+# generated by base.rulekernels for {rule}
+import numba as nb
+import numpy as np
+
+
+@nb.njit(inline="always")
+def full_add(a, b, c):
+    partial = a ^ b
+    return partial ^ c, (a & b) | (partial & c)
+
+
+@nb.njit(inline="always")
+def lane_planes(line, w):
+    one = np.uint64(1)
+    mid = np.uint64(line[w + 1]) | (np.uint64(line[w + 2]) << np.uint64(32))
+    west = (mid << one) | (np.uint64(line[w]) >> np.uint64(31))
+    east = mid >> one
+    if w + 3 < len(line):
+        east |= (np.uint64(line[w + 3]) & one) << np.uint64(63)
+    return west, mid, east
+
+
+@nb.njit(inline="always")
+def wide_planes(line, w):
+    two = np.uint64(2)
+    mid = np.uint64(line[w + 1]) | (np.uint64(line[w + 2]) << np.uint64(32))
+    west = (mid << two) | (np.uint64(line[w]) >> np.uint64(30))
+    east = mid >> two
+    if w + 3 < len(line):
+        east |= (np.uint64(line[w + 3]) & np.uint64(3)) << np.uint64(62)
+    return west, east
+'''
+
+SQUARE_TEMPLATE = KERNEL_HEADER + '''
+
+@nb.njit(parallel=True, nogil=True, cache=True)
+def step(padded):
+    blocks, rows, words = padded.shape[0], padded.shape[1] - 2, padded.shape[2] - 2
+    out = np.empty((blocks, rows, words), np.uint32)
+    for r in nb.prange(blocks * rows):
+        i, y = r // rows, r % rows
+        for w in range(0, words, 2):
+            nw, n, ne = lane_planes(padded[i, y], w)
+            west, center, east = lane_planes(padded[i, y + 1], w)
+            sw, s, se = lane_planes(padded[i, y + 2], w)
+{dropped}            s0, c0 = full_add(nw, n, ne)
+            s1, c1 = full_add(sw, s, se)
+            s2, c2 = west ^ east, west & east
+            b0, c3 = full_add(s0, s1, s2)
+            t, d0 = full_add(c0, c1, c2)
+            b1, d1 = t ^ c3, t & c3
+            b2, b3 = d0 ^ d1, d0 & d1
+            lane = {expression}
+            out[i, y, w] = np.uint32(lane & np.uint64(0xffffffff))
+            if w + 1 < words:
+                out[i, y, w + 1] = np.uint32(lane >> np.uint64(32))
+    return out
+'''
+
+TRIANGLE_TEMPLATE = KERNEL_HEADER + '''
+
+@nb.njit(parallel=True, nogil=True, cache=True)
+def step(padded, parity):
+    blocks, rows, words = padded.shape[0], padded.shape[1] - 2, padded.shape[2] - 2
+    out = np.empty((blocks, rows, words), np.uint32)
+    for r in nb.prange(blocks * rows):
+        i, y = r // rows, r % rows
+        even = np.uint64(0x5555555555555555) if (y + parity) & 1 == 0 else np.uint64(0xaaaaaaaaaaaaaaaa)
+        odd = ~even
+        for w in range(0, words, 2):
+            nw, n, ne = lane_planes(padded[i, y], w)
+            nww, nee = wide_planes(padded[i, y], w)
+            west, center, east = lane_planes(padded[i, y + 1], w)
+            ww, ee = wide_planes(padded[i, y + 1], w)
+            sw, s, se = lane_planes(padded[i, y + 2], w)
+            sww, see = wide_planes(padded[i, y + 2], w)
+            far_west = (nww & even) | (sww & odd)
+            far_east = (nee & even) | (see & odd)
+            s0, c0 = full_add(nw, n, ne)
+            s1, c1 = full_add(sw, s, se)
+            s2, c2 = full_add(ww, west, east)
+            s3, c3 = full_add(ee, far_west, far_east)
+            t, k0 = full_add(s0, s1, s2)
+            b0, k1 = t ^ s3, t & s3
+            t0, u0 = full_add(c0, c1, c2)
+            t1, u1 = full_add(c3, k0, k1)
+            b1, u2 = t0 ^ t1, t0 & t1
+            b2, b3 = full_add(u0, u1, u2)
+            lane = {expression}
+            out[i, y, w] = np.uint32(lane & np.uint64(0xffffffff))
+            if w + 1 < words:
+                out[i, y, w + 1] = np.uint32(lane >> np.uint64(32))
+    return out
+'''
+
+
+def canonical_rule(birth: frozenset[int], survival: frozenset[int], neighbormask: int) -> str:
+    return "B{}/S{}{}".format(liferules.count_list(birth), liferules.count_list(survival),
+                              liferules.NEIGHBORHOOD_SUFFIX[neighbormask])
+
+
+def implicants(on: set[int], dont_care: set[int], bits: int) -> list[tuple[int, int]]:
+    """A small cover of the on set by cubes (value, care): the inputs n with
+       n & care == value.  Cubes may also cover the don't care set.  The
+       primes are found by trying every cube, which is cheap for five bits,
+       and picked greedily."""
+    allowed = on | dont_care
+    inputs = range(1 << bits)
+    cubes = []
+    for care in inputs:
+        for value in inputs:
+            if value & ~care:
+                continue
+            members = frozenset(n for n in inputs if n & care == value)
+            if members <= allowed and members & on:
+                cubes.append((value, care, members))
+    primes = [c for c in cubes if not any(c[2] < d[2] for d in cubes)]
+    cover, left = [], set(on)
+    while left:
+        value, care, members = max(primes, key=lambda c: (len(c[2] & left), -bin(c[1]).count("1")))
+        cover.append((value, care))
+        left -= members
+    return cover
+
+
+def rule_expression(birth: frozenset[int], survival: frozenset[int], neighbormask: int) -> str:
+    """the next state of a lane as an expression over COUNT_BITS"""
+    center = 1 << 4
+    on = {n for n in birth} | {n | center for n in survival}
+    dont_care = {n | c for n in range(liferules.neighbors(neighbormask) + 1, 16) for c in (0, center)}
+    terms = []
+    for value, care in implicants(on, dont_care, len(COUNT_BITS)):
+        literals = [name if value >> b & 1 else "~" + name
+                    for b, name in enumerate(COUNT_BITS) if care >> b & 1]
+        terms.append("(" + " & ".join(literals) + ")" if literals else "~np.uint64(0)")
+    return " | ".join(terms) or "np.uint64(0)"
+
+
+def kernel_source(birth: frozenset[int], survival: frozenset[int], neighbormask: int) -> str:
+    rule, expression = canonical_rule(birth, survival, neighbormask), rule_expression(birth, survival, neighbormask)
+    if neighbormask == liferules.TRIANGULAR:
+        return TRIANGLE_TEMPLATE.format(rule=rule, expression=expression)
+    dropped = [PLANES[p] for p in range(9) if p != 4 and not neighbormask >> p & 1]
+    return SQUARE_TEMPLATE.format(rule=rule, expression=expression, dropped="".join(
+        " " * 12 + "{} = np.uint64(0)\n".format(plane) for plane in dropped))
+
+
+@functools.lru_cache(maxsize=liferules.RULE_CACHE_SIZE)
+def rule_kernel(cache_dir: str | None, birth: frozenset[int], survival: frozenset[int],
+                neighbormask: int) -> typing.Callable[..., np.ndarray] | None:
+    """The kernel specialised to a totalistic rule, taking a batch of
+       bordered blocks like hqlifealgo.count_words (and the parity, like
+       triangle_words, on the triangular grid), or None if there is no
+       cache directory or its module can't be written."""
+    if not cache_dir:
+        return None
+    rule = canonical_rule(birth, survival, neighbormask)
+    name = "rule_" + hashlib.sha1("{}\n{}".format(KERNEL_FORMAT, rule).encode()).hexdigest()
+    path = os.path.join(cache_dir, "kernels", name + ".py")
+    try:
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            util.atomic_write(path, kernel_source(birth, survival, neighbormask), "w")
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        # Numba finds a cached kernel's globals through sys.modules
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    except (OSError, SyntaxError):
+        return None
+    return module.step
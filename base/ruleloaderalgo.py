@@ -0,0 +1,654 @@
+from __future__ import annotations
+
+import dataclasses
+import functools
+import hashlib
+import io
+import os
+import re
+import typing
+
+import numpy as np
+
+import base.ghashbase as ghashbase
+import base.liferules as liferules
+import base.tilealgo as tilealgo
+import base.util as util
+from base.lifealgo import *
+
+
+# RuleLoader runs the rules of .rule files (and of the older .table and
+# .tree files).  A @TREE section is already a lookup: starting from the
+# root, each node gives the next node for the state of one neighbor (nw, ne,
+# sw, se, n, w, e, s and then c, or n, w, e, s and c with 4 neighbors) and
+# the nodes of the last level give the new state.  A @TABLE section, where
+# the first matching transition wins, is compiled into the same form: each
+# node stands for the set of transitions (after symmetry expansion) that
+# still match the neighbors seen so far, so there is a node per distinct
+# set and the table is never searched while stepping.
+#
+# Stored as one flat array with num_states entries per node, a tree steps
+# a whole array of cells with one gather per neighbor.  When the table of
+# all neighborhoods has at most FLAT_ENTRIES entries, the tree is expanded
+# into it once, indexed by the states of the neighbors (in the order above)
+# as digits in base num_states, and a generation is a single gather.
+#
+# Compiling a table with many states and symmetries takes a while, so if
+# liferules.rule_cache has a cache directory the compiled arrays are saved
+# there as .npy files named after the hash of the section.  Later processes
+# map them into memory instead of compiling again, sharing the pages.
+#
+# HRuleLoaderAlgo steps the same lookups under hashlife (see ghashbase).
+FLAT_ENTRIES = 1 << 22
+CACHE_FORMAT = 1  # change when the saved arrays change meaning
+CACHE_HEADER = 4  # num_states, num_neighbors, grid type and whether flat was saved
+NO_TABLE_OR_TREE = "No @TABLE or @TREE section found in .rule file."
+
+# the neighbors in the order of tree levels, and where they are
+TREE_ORDER = {4: ("n", "w", "e", "s", "c"), 8: ("nw", "ne", "sw", "se", "n", "w", "e", "s", "c")}
+OFFSETS = {"nw": (-1, -1), "n": (-1, 0), "ne": (-1, 1), "w": (0, -1), "c": (0, 0), "e": (0, 1),
+           "sw": (1, -1), "s": (1, 0), "se": (1, 1)}
+
+# the inputs of a transition in each rule table neighborhood
+TABLE_INPUTS = {
+    "vonNeumann": ("c", "n", "e", "s", "w"),
+    "Moore": ("c", "n", "ne", "e", "se", "s", "sw", "w", "nw"),
+    "hexagonal": ("c", "n", "e", "se", "s", "w", "nw"),
+    "oneDimensional": ("c", "w", "e"),
+}
+TABLE_GRIDS = {"vonNeumann": "VN_GRID", "Moore": "SQUARE_GRID", "hexagonal": "HEX_GRID",
+               "oneDimensional": "SQUARE_GRID"}
+
+# how each symmetry reorders the inputs of a transition (permute is done
+# by permuting all the neighbors)
+SYMMETRIES: dict[str, dict[str, tuple[tuple[int, ...], ...]]] = {
+    "vonNeumann": {
+        "none": ((0, 1, 2, 3, 4),),
+        "rotate4": ((0, 1, 2, 3, 4), (0, 2, 3, 4, 1), (0, 3, 4, 1, 2), (0, 4, 1, 2, 3)),
+        "rotate4reflect": ((0, 1, 2, 3, 4), (0, 2, 3, 4, 1), (0, 3, 4, 1, 2), (0, 4, 1, 2, 3),
+                           (0, 4, 3, 2, 1), (0, 3, 2, 1, 4), (0, 2, 1, 4, 3), (0, 1, 4, 3, 2)),
+        "reflect_horizontal": ((0, 1, 2, 3, 4), (0, 1, 4, 3, 2)),
+        "permute": (),
+    },
+    "Moore": {
+        "none": ((0, 1, 2, 3, 4, 5, 6, 7, 8),),
+        "rotate4": ((0, 1, 2, 3, 4, 5, 6, 7, 8), (0, 3, 4, 5, 6, 7, 8, 1, 2),
+                    (0, 5, 6, 7, 8, 1, 2, 3, 4), (0, 7, 8, 1, 2, 3, 4, 5, 6)),
+        "rotate8": tuple((0,) + tuple((i + k) % 8 + 1 for i in range(8)) for k in range(8)),
+        "rotate4reflect": ((0, 1, 2, 3, 4, 5, 6, 7, 8), (0, 3, 4, 5, 6, 7, 8, 1, 2),
+                           (0, 5, 6, 7, 8, 1, 2, 3, 4), (0, 7, 8, 1, 2, 3, 4, 5, 6),
+                           (0, 1, 8, 7, 6, 5, 4, 3, 2), (0, 7, 6, 5, 4, 3, 2, 1, 8),
+                           (0, 5, 4, 3, 2, 1, 8, 7, 6), (0, 3, 2, 1, 8, 7, 6, 5, 4)),
+        "rotate8reflect": tuple((0,) + tuple((i + k) % 8 + 1 for i in range(8)) for k in range(8)) +
+                          tuple((0,) + tuple((k - i) % 8 + 1 for i in range(8)) for k in range(7, -1, -1)),
+        "reflect_horizontal": ((0, 1, 2, 3, 4, 5, 6, 7, 8), (0, 1, 8, 7, 6, 5, 4, 3, 2)),
+        "permute": (),
+    },
+    "hexagonal": {
+        "none": ((0, 1, 2, 3, 4, 5, 6),),
+        "rotate2": ((0, 1, 2, 3, 4, 5, 6), (0, 4, 5, 6, 1, 2, 3)),
+        "rotate3": ((0, 1, 2, 3, 4, 5, 6), (0, 3, 4, 5, 6, 1, 2), (0, 5, 6, 1, 2, 3, 4)),
+        "rotate6": tuple((0,) + tuple((i + k) % 6 + 1 for i in range(6)) for k in range(6)),
+        "rotate6reflect": tuple((0,) + tuple((i + k) % 6 + 1 for i in range(6)) for k in range(6)) +
+                          tuple((0,) + tuple((k - i) % 6 + 1 for i in range(6)) for k in range(5, -1, -1)),
+        "permute": (),
+    },
+    "oneDimensional": {
+        "none": ((0, 1, 2),),
+        "reflect": ((0, 1, 2), (0, 2, 1)),
+        "permute": (),
+    },
+}
+
+# the rules RuleTable and RuleTree have without a file
+LIFE_TREE = (
+    "num_states=2", "num_neighbors=8", "num_nodes=32", "1 0 0", "2 0 0", "1 0 1", "2 0 2", "3 1 3",
+    "1 1 1", "2 2 5", "3 3 6", "4 4 7", "2 5 0", "3 6 9", "4 7 10", "5 8 11", "3 9 1", "4 10 13",
+    "5 11 14", "6 12 15", "3 1 1", "4 13 17", "5 14 18", "6 15 19", "7 16 20", "4 17 17",
+    "5 18 22", "6 19 23", "7 20 24", "8 21 25", "5 22 22", "6 23 27", "7 24 28", "8 25 29",
+    "9 26 30")
+LANGTONS_LOOPS = (
+    "n_states:8", "neighborhood:vonNeumann", "symmetries:rotate4",
+    "000000", "000012", "000020", "000030", "000050", "000063", "000071", "000112", "000122",
+    "000132", "000212", "000220", "000230", "000262", "000272", "000320", "000525", "000622",
+    "000722", "001022", "001120", "002020", "002030", "002050", "002125", "002220", "002322",
+    "005222", "012321", "012421", "012525", "012621", "012721", "012751", "014221", "014321",
+    "014421", "014721", "016251", "017221", "017255", "017521", "017621", "017721", "025271",
+    "100011", "100061", "100077", "100111", "100121", "100211", "100244", "100277", "100511",
+    "101011", "101111", "101244", "101277", "102026", "102121", "102211", "102244", "102263",
+    "102277", "102327", "102424", "102626", "102644", "102677", "102710", "102727", "105427",
+    "111121", "111221", "111244", "111251", "111261", "111277", "111522", "112121", "112221",
+    "112244", "112251", "112277", "112321", "112424", "112621", "112727", "113221", "122244",
+    "122277", "122434", "122547", "123244", "123277", "124255", "124267", "125275", "200012",
+    "200022", "200042", "200071", "200122", "200152", "200212", "200222", "200232", "200242",
+    "200250", "200262", "200272", "200326", "200423", "200517", "200522", "200575", "200722",
+    "201022", "201122", "201222", "201422", "201722", "202022", "202032", "202052", "202073",
+    "202122", "202152", "202212", "202222", "202272", "202321", "202422", "202452", "202520",
+    "202552", "202622", "202722", "203122", "203216", "203226", "203422", "204222", "205122",
+    "205212", "205222", "205521", "205725", "206222", "206722", "207122", "207222", "207422",
+    "207722", "211222", "211261", "212222", "212242", "212262", "212272", "214222", "215222",
+    "216222", "217222", "222272", "222442", "222462", "222762", "222772", "300013", "300022",
+    "300041", "300076", "300123", "300421", "300622", "301021", "301220", "302511", "401120",
+    "401220", "401250", "402120", "402221", "402326", "402520", "403221", "500022", "500215",
+    "500225", "500232", "500272", "500520", "502022", "502122", "502152", "502220", "502244",
+    "502722", "512122", "512220", "512422", "512722", "600011", "600021", "602120", "612125",
+    "612131", "612225", "700077", "701120", "701220", "701250", "702120", "702221", "702251",
+    "702321", "702525", "702720")
+TREE_VALUE = re.compile(r"\s*(num_states|num_neighbors|num_nodes)\s*=\s*([-+]?\d+)")
+LEADING_NUMBER = re.compile(r"\s*([-+]?\d+)")
+
+
+@dataclasses.dataclass(frozen=True)
+class LoadedRule(object):
+    """A rule from a @TABLE or @TREE section.  tree holds num_states
+       entries per node, the root being the last node: the offset of the
+       next node for each state of the neighbor, or in the nodes of the last
+       level the new state.  flat is the same lookup for the whole
+       neighborhood, if it has at most FLAT_ENTRIES entries.  Instances are
+       shared between universes, so the arrays are read-only."""
+    num_states: int
+    num_neighbors: int  # 4 or 8
+    grid_type: str
+    tree: np.ndarray
+    flat: np.ndarray | None
+
+    @staticmethod
+    def from_tree(tree: np.ndarray, num_states: int, num_neighbors: int,
+                  grid_type: str = "SQUARE_GRID") -> LoadedRule:
+        levels = num_neighbors + 1
+        flat = None
+        if num_states ** levels <= FLAT_ENTRIES:
+            # run every neighborhood through the tree
+            codes = np.arange(num_states ** levels)
+            index = np.full(len(codes), len(tree) - num_states, np.int32)
+            for level in range(levels):
+                index = tree[index + codes // num_states ** (levels - 1 - level) % num_states]
+            flat = index.astype(np.uint8)
+            flat.flags.writeable = False
+        tree.flags.writeable = False
+        return LoadedRule(num_states, num_neighbors, grid_type, tree, flat)
+
+
+def neighbors(padded: np.ndarray, name: str) -> np.ndarray:
+    """the named neighbor of each cell inside padded (the last two axes have
+       a border of one cell)"""
+    dy, dx = OFFSETS[name]
+    h, w = padded.shape[-2] - 2, padded.shape[-1] - 2
+    return padded[..., 1 + dy:1 + dy + h, 1 + dx:1 + dx + w]
+
+
+def next_states(padded: np.ndarray, rule: LoadedRule) -> np.ndarray:
+    """the next generation of the cells inside padded"""
+    order = TREE_ORDER[rule.num_neighbors]
+    if rule.flat is not None:
+        index = neighbors(padded, order[0]).astype(np.int32)
+        for name in order[1:]:
+            index *= rule.num_states
+            index += neighbors(padded, name)
+        return rule.flat[index]
+    index = neighbors(padded, order[0]).astype(np.int32)
+    index += len(rule.tree) - rule.num_states
+    for name in order[1:]:
+        index = rule.tree[index]
+        index += neighbors(padded, name)
+    return rule.tree[index].astype(np.uint8)
+
+
+# loading @TREE sections
+
+def parse_tree(lines: typing.Iterable[str]) -> LoadedRule | str:
+    """the rule of a @TREE section or .tree file, or an error message"""
+    values = {"num_states": -1, "num_neighbors": -1, "num_nodes": -1}
+    nodes: list[list[int]] = []
+    levels: list[int] = []
+    lev = 1000
+    for line in lines:
+        if not line or line[0] == '#':
+            continue
+        match = TREE_VALUE.match(line)
+        if match:
+            values[match[1]] = int(match[2])
+            continue
+        num_states, num_neighbors, num_nodes = values["num_states"], values["num_neighbors"], values["num_nodes"]
+        if not 2 <= num_states <= 256 or num_neighbors not in (4, 8) or not num_neighbors <= num_nodes <= 100000000:
+            return "Bad basic values"
+        if not '1' <= line[0] <= chr(ord('0') + 1 + num_neighbors):
+            return "Bad line in tree data 1"
+        lev = ord(line[0]) - ord('0')
+        levels.append(lev)
+        node = []
+        for token in line[1:].split():
+            if not token.isascii() or not token.isdigit():
+                return "Bad line in tree data 2"
+            v = int(token)
+            if lev == 1:
+                if v >= num_states:
+                    return "Bad state value in tree data"
+                node.append(v)
+            else:
+                if v >= len(levels):
+                    return "Bad node value in tree data"
+                if levels[v] != lev - 1:
+                    return "Bad node pointer does not point to one level down"
+                node.append(v * num_states)
+        if len(node) != num_states:
+            return "Bad number of values on tree data line"
+        nodes.append(node)
+    num_states, num_neighbors, num_nodes = values["num_states"], values["num_neighbors"], values["num_nodes"]
+    if len(nodes) * num_states != num_nodes * num_states:
+        return "Bad count of values in tree data"
+    if lev != num_neighbors + 1:
+        return "Bad last node (wrong level)"
+    return LoadedRule.from_tree(np.array(nodes, np.int32).ravel(), num_states, num_neighbors)
+
+
+# loading @TABLE sections
+
+def tokenize(s: str, delimiters: str) -> list[str]:
+    return [token for token in re.split('[' + re.escape(delimiters) + ']', s) if token]
+
+
+def permutations_of(items: list) -> typing.Iterator[tuple]:
+    """the distinct orderings of the sorted items, as std::next_permutation
+       gives them"""
+    items = list(items)
+    while True:
+        yield tuple(items)
+        i = len(items) - 2
+        while i >= 0 and items[i] >= items[i + 1]:
+            i -= 1
+        if i < 0:
+            return
+        j = len(items) - 1
+        while items[j] <= items[i]:
+            j -= 1
+        items[i], items[j] = items[j], items[i]
+        items[i + 1:] = reversed(items[i + 1:])
+
+
+def parse_table(lines: typing.Iterable[str], filename: str, lineno: int) -> LoadedRule | str:
+    """the rule of a @TABLE section or .table file, or an error message;
+       lineno is the number of lines before the first one"""
+    symmetries = "rotate4"
+    neighborhood = "vonNeumann"
+    n_states = 8
+    n_inputs = 0
+    variables: dict[str, list[int]] = {}
+    transitions: list[tuple[tuple[tuple[int, ...], ...], int]] = []
+    n_states_parsed = neighborhood_parsed = symmetries_parsed = False
+
+    def error(message: str) -> str:
+        return "Error reading " + filename + " on line " + str(lineno) + ": " + message
+
+    def state_of(token: str) -> int | None:
+        match = LEADING_NUMBER.match(token)
+        return int(match[1]) if match else None
+
+    for line in lines:
+        lineno += 1
+        # snip off any trailing comment and whitespace
+        line = line.partition('#')[0].strip(" \t\r\n")
+        lower = line.lower()
+        if not line:
+            continue
+        elif lower.startswith("n_states:"):
+            value = state_of(line[9:])
+            if value is None:
+                return error(line)
+            if not 2 <= value <= 256:
+                return error("n_states out of range (min 2, max 256)")
+            n_states = value
+            n_states_parsed = True
+        elif lower.startswith("neighborhood:"):
+            neighborhood = line[13:].strip(" \t\r\n")
+            if neighborhood not in TABLE_INPUTS:
+                return error("unsupported neighborhood")
+            n_inputs = len(TABLE_INPUTS[neighborhood])
+            neighborhood_parsed = True
+        elif lower.startswith("symmetries:"):
+            if not neighborhood_parsed:
+                return "Error reading " + filename + ": neighborhood must be declared before symmetries"
+            symmetries = line[11:].strip(" \t\r\n")
+            if symmetries not in SYMMETRIES[neighborhood]:
+                return error("unsupported symmetries")
+            symmetries_parsed = True
+        elif lower.startswith("var "):
+            if not (n_states_parsed and neighborhood_parsed and symmetries_parsed):
+                return ("Error reading " + filename + ": one or more of n_states, neighborhood or symmetries missing"
+                        "\nbefore first variable")
+            tokens = tokenize(line, "= {,}")
+            if len(tokens) < 3:
+                return error(line)
+            states = []
+            for token in tokens[2:]:
+                if token in variables:
+                    # variables permitted inside later variables
+                    states += variables[token]
+                    continue
+                value = state_of(token)
+                if value is None:
+                    return error(line)
+                if not 0 <= value < n_states:
+                    return error(line + " - state value out of range")
+                states.append(value)
+            variables[tokens[1]] = states
+        else:
+            # must be a transition
+            if not (n_states_parsed and neighborhood_parsed and symmetries_parsed):
+                return ("Error reading " + filename + ": one or more of n_states, neighborhood or symmetries missing"
+                        "\nbefore first transition")
+            if n_states <= 10 and not variables and ',' not in line:
+                # single digit states without commas: e.g. 012345 for 0,1,2,3,4 -> 5
+                if len(line) < n_inputs + 1:
+                    return error(line + " - too few entries")
+                if not all('0' <= c <= '9' for c in line[:n_inputs + 1]):
+                    return error(line)
+                output = int(line[n_inputs])
+                if output >= n_states:
+                    return error(line + " - state out of range")
+                transitions.append((tuple((int(c),) for c in line[:n_inputs]), output))
+                continue
+            tokens = tokenize(line, ", #\t")
+            if len(tokens) < n_inputs + 1:
+                return error(line + " - too few entries")
+            # variables appearing more than once are bound: they take the
+            # same value everywhere, giving a transition for each value
+            bound = sorted(name for name in variables if tokens[:n_inputs + 1].count(name) > 1)
+            inputs = []
+            for token in tokens[:n_inputs]:
+                if token in variables:
+                    inputs.append(tuple(variables[token]))
+                    continue
+                value = state_of(token)
+                if value is None:
+                    return error(line)
+                if not 0 <= value < n_states:
+                    return error(line + " - state out of range")
+                inputs.append((value,))
+            token = tokens[n_inputs]
+            if token in bound:
+                output = None
+            elif token in variables and len(variables[token]) == 1:
+                # single-state variables are permitted as the output
+                output = variables[token][0]
+            else:
+                output = state_of(token)
+                if output is None:
+                    return error(line + " - output must be state, single-state variable or bound variable")
+                if not 0 <= output < n_states:
+                    return error(line + " - state out of range")
+            indices = [0] * len(bound)
+            while True:
+                values = {name: variables[name][i] for name, i in zip(bound, indices)}
+                transitions.append((tuple((values[t],) if t in values else inputs[i]
+                                          for i, t in enumerate(tokens[:n_inputs])),
+                                    values[token] if output is None else output))
+                # move on to the next values of the bound variables
+                for i, name in enumerate(bound):
+                    if indices[i] < len(variables[name]) - 1:
+                        indices[i] += 1
+                        break
+                    indices[i] = 0
+                else:
+                    break
+    if not (n_states_parsed and neighborhood_parsed and symmetries_parsed):
+        return "Error reading " + filename + ": one or more of n_states, neighborhood or symmetries missing"
+    return compile_table(n_states, neighborhood, expand_symmetries(transitions, neighborhood, symmetries))
+
+
+def expand_symmetries(transitions: list, neighborhood: str, symmetries: str) -> list:
+    """every transition in each of its orientations"""
+    expanded = []
+    for inputs, output in transitions:
+        if symmetries == "permute":
+            expanded += [((inputs[0],) + p, output) for p in permutations_of(sorted(inputs[1:]))]
+        else:
+            expanded += [(tuple(inputs[i] for i in remap), output) for remap in SYMMETRIES[neighborhood][symmetries]]
+    return expanded
+
+
+def compile_table(num_states: int, neighborhood: str, transitions: list) -> LoadedRule:
+    """Turn the transitions into a tree.  The candidates of a node are the
+       transitions that match the neighbors on the way to it, as a bit set;
+       the nodes of the last level pick the first candidate that matches c,
+       or keep c if there is none."""
+    inputs = TABLE_INPUTS[neighborhood]
+    num_neighbors = 4 if neighborhood == "vonNeumann" else 8
+    order = [inputs.index(name) if name in inputs else None for name in TREE_ORDER[num_neighbors]]
+    outputs = [output for _, output in transitions]
+    # matches[i][v]: the set of transitions allowing state v as input i
+    allowed = np.zeros((len(inputs), num_states, len(transitions)), bool)
+    for t, (states, _) in enumerate(transitions):
+        for i, s in enumerate(states):
+            allowed[i, list(s), t] = True
+    packed = np.packbits(allowed, axis=2, bitorder='little')
+    matches = [[int.from_bytes(packed[i, v].tobytes(), 'little') for v in range(num_states)]
+               for i in range(len(inputs))]
+    last = len(order) - 1
+    nodes: list[tuple[int, ...]] = []
+    unique: dict[tuple[int, tuple[int, ...]], int] = {}
+    built: dict[tuple[int, int], int] = {}
+
+    def build(level: int, candidates: int) -> int:
+        node = built.get((level, candidates))
+        if node is not None:
+            return node
+        i = order[level]
+        if level == last:
+            values = []
+            for c in range(num_states):
+                found = candidates & matches[i][c]
+                values.append(outputs[(found & -found).bit_length() - 1] if found else c)
+            values = tuple(values)
+        elif i is None:
+            # a neighbor the table doesn't look at
+            values = (build(level + 1, candidates) * num_states,) * num_states
+        else:
+            values = tuple(build(level + 1, candidates & matches[i][v]) * num_states for v in range(num_states))
+        node = unique.setdefault((level, values), len(nodes))
+        if node == len(nodes):
+            nodes.append(values)
+        built[level, candidates] = node
+        return node
+
+    build(0, (1 << len(transitions)) - 1)
+    tree = np.array(nodes, np.int32).ravel()
+    return LoadedRule.from_tree(tree, num_states, num_neighbors, TABLE_GRIDS[neighborhood])
+
+
+# finding rules
+
+def split_lines(text: str) -> list[str]:
+    return re.split(r"\r\n|\r|\n", text)
+
+
+def read_rule_file(rule: str, directory: str, extension: str) -> tuple[str, str | None]:
+    """the path of rule's file in directory and its contents (None if it
+       can't be read); slashes in the rule become underscores"""
+    path = directory + rule.replace('/', '_').replace('\\', '_') + extension
+    try:
+        with open(path, encoding="latin-1") as f:
+            return path, f.read()
+    except OSError:
+        return path, None
+
+
+def cache_path(kind: str, text: str) -> str | None:
+    """where a compiled section is saved, without the extensions (None if
+       there is no cache directory)"""
+    cache_dir = liferules.rule_cache.cache_dir
+    if not cache_dir:
+        return None
+    key = "{}\n{}\n{}".format(CACHE_FORMAT, kind, text)
+    return os.path.join(cache_dir, "rule-" + hashlib.sha1(key.encode()).hexdigest())
+
+
+def load_cached(path: str) -> LoadedRule | None:
+    """map a saved rule into memory (the arrays are read-only)"""
+    try:
+        saved = np.load(path + ".tree.npy", mmap_mode="r")
+        num_states, num_neighbors, grid, has_flat = (int(v) for v in saved[:CACHE_HEADER])
+        flat = np.load(path + ".flat.npy", mmap_mode="r") if has_flat else None
+    except (OSError, ValueError):
+        return None
+    tree = saved[CACHE_HEADER:]
+    if (num_neighbors not in TREE_ORDER or not 2 <= num_states <= 256 or len(tree) % num_states or
+            flat is not None and len(flat) != num_states ** (num_neighbors + 1)):
+        return None
+    return LoadedRule(num_states, num_neighbors, TGridType(grid).name, tree, flat)
+
+
+def save_cached(path: str, rule: LoadedRule) -> None:
+    def save(extension: str, array: np.ndarray) -> None:
+        data = io.BytesIO()
+        np.save(data, array)
+        util.atomic_write(path + extension, data.getvalue())
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if rule.flat is not None:
+            save(".flat.npy", rule.flat)
+        # the tree goes last: once it is there the rule is complete
+        header = [rule.num_states, rule.num_neighbors, TGridType[rule.grid_type].value, rule.flat is not None]
+        save(".tree.npy", np.concatenate((np.array(header, np.int32), rule.tree)))
+    except OSError:
+        pass
+
+
+@functools.lru_cache(maxsize=liferules.RULE_CACHE_SIZE)
+def compile_section(kind: str, text: str, filename: str, lineno: int) -> LoadedRule | str:
+    """the rule of a @TABLE or @TREE section, given the lines that follow
+       its line lineno (up to the next @ line), or an error message"""
+    path = cache_path(kind, text)
+    if path:
+        loaded = load_cached(path)
+        if loaded is not None:
+            return loaded
+    lines = split_lines(text)
+    if kind == "@TABLE":
+        loaded = parse_table(lines, filename, lineno)
+    else:
+        loaded = parse_tree(lines)
+    if path and isinstance(loaded, LoadedRule):
+        save_cached(path, loaded)
+    return loaded
+
+
+def load_table_or_tree(text: str, rule: str) -> LoadedRule | str:
+    """the rule of the first @TABLE or @TREE section of a .rule file"""
+    lines = split_lines(text)
+    for lineno, line in enumerate(lines, 1):
+        if line in ("@TABLE", "@TREE"):
+            section = []
+            for following in lines[lineno:]:
+                if following.startswith('@'):
+                    break
+                section.append(following)
+            return compile_section(line, "\n".join(section), rule + ".rule", lineno)
+    return NO_TABLE_OR_TREE
+
+
+def load_rule(rule: str) -> LoadedRule | str:
+    """Find rule (without any bounded grid suffix) the way Golly does: the
+       default rules of RuleTree and RuleTable, then a .rule file in the
+       user's rules directory and then in the supplied one, then .table and
+       .tree files in the same places."""
+    if rule.lower() in ("b3/s23", "b3s23") or rule == "23/3":
+        return compile_section("@TREE", "\n".join(LIFE_TREE), "", 0)
+    if rule == "Langtons-Loops":
+        return compile_section("@TABLE", "\n".join(LANGTONS_LOOPS), "", 0)
+    user_dir, rules_dir = util.life_get_user_rules(), util.life_get_rules_dir()
+    path, text = read_rule_file(rule, user_dir, ".rule")
+    in_user = text is not None
+    if not in_user:
+        path, text = read_rule_file(rule, rules_dir, ".rule")
+    if text is not None:
+        loaded = load_table_or_tree(text, rule)
+        if in_user and loaded == NO_TABLE_OR_TREE:
+            # a .rule file in the user's directory may only override the
+            # colors and icons of a supplied one
+            path, text = read_rule_file(rule, rules_dir, ".rule")
+            if text is not None:
+                loaded = load_table_or_tree(text, rule)
+        return loaded
+    for extension in (".table", ".tree"):
+        path, text = read_rule_file(rule, user_dir, extension)
+        if text is None:
+            path, text = read_rule_file(rule, rules_dir, extension)
+        if text is not None:
+            if extension == ".table":
+                return compile_section("@TABLE", text, path, 0)
+            return compile_section("@TREE", text, path, 0)
+    return "File not found"
+
+
+def transition(rule: LoadedRule) -> ghashbase.Transition:
+    """the rule as a Transition for hashlife, using the flat table if any"""
+    order = [(dy + 1) * 3 + dx + 1 for dy, dx in (OFFSETS[name] for name in TREE_ORDER[rule.num_neighbors])]
+    if rule.flat is None:
+        return ghashbase.tree_transition(rule.num_states, order, rule.tree)
+    weights = np.zeros((9, rule.num_states), np.int64)
+    for digit, p in enumerate(order):
+        weights[p] = np.arange(rule.num_states) * rule.num_states ** (len(order) - 1 - digit)
+    return ghashbase.flat_transition(rule.num_states, order, weights, rule.flat)
+
+
+class RuleLoaderRules(object):
+    """The rule handling of the RuleLoader engines; set_rule ends by
+       calling the engine's _rule_changed."""
+    _rule: LoadedRule
+    _canon_rule: str
+
+    @property
+    def default_rule(self) -> str:
+        return "B3/S23"
+
+    def set_rule(self, s: str) -> str | None:
+        if len(s) > liferules.MAX_RULE_SIZE:
+            return "Rule name is too long."
+        rule, colon, suffix = s.partition(':')
+        loaded = load_rule(rule)
+        if isinstance(loaded, str):
+            if loaded == "File not found":
+                # show the given rule in the final error message
+                return loaded + "\nGiven rule: " + s
+            return loaded
+        err = self.set_grid_size(colon + suffix if colon else ":")
+        if err != chr(0):
+            return err
+        self._rule = loaded
+        self._moore = loaded.num_neighbors == 8
+        self._grid_type = TGridType[loaded.grid_type]
+        self._max_cell_states = cint(loaded.num_states)
+        self._canon_rule = rule + self.canonical_suffix().rstrip(chr(0))
+        self._rule_changed()
+        return None
+
+    def get_rule(self) -> str:
+        return self._canon_rule
+
+
+class RuleLoaderAlgo(RuleLoaderRules, tilealgo.TileAlgo):
+    """Rules loaded from .rule files (or .table and .tree files), stepped by
+       table lookup."""
+
+    def __init__(self):
+        super(RuleLoaderAlgo, self).__init__()
+        self.set_rule(self.default_rule)
+
+    def _next_states(self, padded: np.ndarray) -> np.ndarray:
+        return next_states(padded, self._rule)
+
+    def write_native_format(self, os: io.StringIO, comments: str) -> str:
+        return "No native format for ruleloaderalgo yet."
+
+
+class HRuleLoaderAlgo(RuleLoaderRules, ghashbase.GHashBase):
+    """Rules loaded from .rule files under hashlife."""
+
+    def __init__(self):
+        super(HRuleLoaderAlgo, self).__init__()
+        self.set_rule(self.default_rule)
+
+    def _rule_transition(self) -> ghashbase.Transition:
+        return transition(self._rule)
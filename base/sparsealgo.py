@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+
+import numpy as np
+
+import base.liferules as liferules
+from base.lifealgo import *
+
+
+# The universe is held as a sorted array of the live cells' keys,
+# y * 2^32 + x + 2^31, so the keys sort by row and then by column and a
+# neighbor is a fixed offset away.  Memory and time only depend on the
+# number of live cells, not on how far apart they are, which suits a few
+# small objects scattered over a huge area.
+#
+# Each generation every live cell sends one bit to itself and each of its
+# neighbors: the bit of its position in that cell's 3x3 neighborhood, as in
+# rule3x3.  Sorting these by key and OR-ing each run gives the neighborhood
+# of every cell near a live cell, so one lookup in rule3x3 gives the next
+# generation for any rule LifeRules supports.  The bounding box is kept up
+# to date as the cells change, so population and find_edges are O(1).
+X_BIAS = 1 << 31
+ROW = 1 << 32
+COLUMN_MASK = ROW - 1
+
+NO_BOUNDS = (0, 0, 0, 0)
+
+
+def cell_key(x: int, y: int) -> int:
+    return y * ROW + x + X_BIAS
+
+
+def cell_x(keys: np.ndarray) -> np.ndarray:
+    return (keys & COLUMN_MASK) - X_BIAS
+
+
+def neighborhood(neighbormask: int) -> tuple[np.ndarray, np.ndarray]:
+    """the key offsets of a cell's neighborhood positions, with each
+       position's rule3x3 bit"""
+    positions = [p for p in range(9) if (neighbormask | liferules.CENTER) >> p & 1]
+    offsets = np.array([(p // 3 - 1) * ROW + p % 3 - 1 for p in positions], np.int64)
+    return offsets, np.array([1 << p for p in positions], np.int16)
+
+
+def next_keys(keys: np.ndarray, rules: liferules.LifeRules) -> np.ndarray:
+    """compute the sorted keys of the next generation"""
+    if not len(keys):
+        return keys
+    offsets, bits = neighborhood(rules.neighbormask)
+    # the live cell at key k is at position p of the cell at k - offsets[p]
+    targets = (keys[:, None] - offsets).ravel()
+    order = np.argsort(targets, kind="stable")
+    targets = targets[order]
+    starts = np.flatnonzero(np.concatenate(([True], targets[1:] != targets[:-1])))
+    index = np.bitwise_or.reduceat(np.tile(bits, len(keys))[order], starts)
+    return targets[starts][rules.rule3x3[index] != 0]
+
+
+class SparseAlgo(LifeAlgo):
+    """A two state engine over the sorted keys of the live cells, for
+       patterns that are very sparse or spread out.  It runs the same rules
+       as QuickLife and HashLife."""
+    _keys: np.ndarray                # sorted keys of the live cells
+    _pending: dict[int, bool]        # set_cell changes not yet merged into _keys
+    _bounds: tuple[int, int, int, int]
+    _bounds_valid: bool
+    _rules: liferules.LifeRules
+
+    def __init__(self):
+        super(SparseAlgo, self).__init__()
+        self._max_cell_states = cint(2)
+        self._increment = 1
+        self._rules = liferules.LifeRules()
+        self._keys = np.zeros(0, np.int64)
+        self._pending = {}
+        self._bounds = NO_BOUNDS
+        self._bounds_valid = True
+
+    # storage management
+
+    def _merge(self) -> None:
+        """apply the pending set_cell changes, so that loading a pattern
+           cell by cell costs one sort instead of one insertion per cell"""
+        if not self._pending:
+            return
+        changed = np.fromiter(self._pending.keys(), np.int64, len(self._pending))
+        born = np.fromiter(self._pending.values(), bool, len(self._pending))
+        self._pending = {}
+        self._keys = np.union1d(np.setdiff1d(self._keys, changed[~born]), changed[born])
+        self._bounds_valid = False
+
+    def _set_keys(self, keys: np.ndarray) -> None:
+        """install new keys and work out their bounding box"""
+        self._keys = keys
+        self._bounds_valid = False
+        self._update_bounds()
+
+    def _update_bounds(self) -> None:
+        if self._bounds_valid:
+            return
+        keys = self._keys
+        if len(keys):
+            x = cell_x(keys)
+            self._bounds = (int(keys[0] >> 32), int(x.min()), int(keys[-1] >> 32), int(x.max()))
+        else:
+            self._bounds = NO_BOUNDS
+        self._bounds_valid = True
+
+    # cell access
+
+    def set_cell(self, x: cint, y: cint, new_state: cint) -> cint:
+        x, y = as_int(x), as_int(y)
+        new_state = as_int(new_state)
+        if new_state < 0 or new_state >= self._max_cell_states.value:
+            return cint(-1)
+        self._pending[cell_key(x, y)] = bool(new_state)
+        return cint(0)
+
+    def get_cell(self, x: cint, y: cint) -> cint:
+        key = cell_key(as_int(x), as_int(y))
+        if key in self._pending:
+            return cint(int(self._pending[key]))
+        i = int(np.searchsorted(self._keys, key))
+        return cint(int(i < len(self._keys) and self._keys[i] == key))
+
+    def next_cell(self, x: cint, y: cint, v: cint) -> cint:
+        """return the distance to the next live cell at or to the right of
+           (x, y) and store its state in v, or return -1 if there is none"""
+        x, y = as_int(x), as_int(y)
+        self._merge()
+        i = int(np.searchsorted(self._keys, cell_key(x, y)))
+        if i == len(self._keys) or self._keys[i] >= (y + 1) * ROW:
+            return cint(-1)
+        if isinstance(v, cint):
+            v.value = 1
+        return cint(int(cell_x(self._keys[i])) - x)
+
+    def live_cells(self) -> tuple[np.ndarray, np.ndarray]:
+        """the x and y coordinates of every live cell, row by row"""
+        self._merge()
+        return cell_x(self._keys), self._keys >> 32
+
+    def live_cells_in(self, top: int, left: int, bottom: int,
+                      right: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        self._merge()
+        lo = int(np.searchsorted(self._keys, cell_key(left, top)))
+        hi = int(np.searchsorted(self._keys, cell_key(right, bottom), side="right"))
+        keys = self._keys[lo:hi]
+        xs = cell_x(keys)
+        inside = (xs >= left) & (xs <= right)
+        return xs[inside], keys[inside] >> 32, np.ones(int(inside.sum()), np.int64)
+
+    def set_cells(self, xs: np.ndarray, ys: np.ndarray, states: np.ndarray) -> cint:
+        if not self._valid_states(states):
+            return cint(-1)
+        self._merge()
+        # a cell given more than once takes its last state, as with set_cell
+        keys, last = np.unique((ys * ROW + xs + X_BIAS)[::-1], return_index=True)
+        born = states[::-1][last] != 0
+        self._keys = np.union1d(np.setdiff1d(self._keys, keys[~born]), keys[born])
+        self._bounds_valid = False
+        return cint(0)
+
+    def end_of_pattern(self):
+        """call after set_cell calls"""
+        self._poller.bail_if_calculating()
+        self._merge()
+        self._update_bounds()
+        return cint(0)
+
+    @property
+    def population(self) -> int:
+        self._merge()
+        return len(self._keys)
+
+    def is_empty(self) -> cint:
+        self._merge()
+        return cint(not len(self._keys))
+
+    def find_edges(self) -> tuple[int, int, int, int]:
+        self._merge()
+        self._update_bounds()
+        return self._bounds
+
+    # rules and stepping
+
+    @property
+    def default_rule(self) -> str:
+        return "B3/S23"
+
+    def set_rule(self, s: str) -> str | None:
+        err = self._rules.set_rule(s, self)
+        if err is None:
+            self._grid_type = TGridType[liferules.GRID_TYPES[self._rules.neighbormask]]
+        return err
+
+    def get_rule(self) -> str:
+        return self._rules.get_rule()
+
+    def _dogen(self) -> None:
+        self._merge()
+        self.running_hperf.tiles_calculated += len(self._keys)
+        self._set_keys(next_keys(self._keys, self._rules))
+        self._generation += 1
+
+    def step(self) -> None:
+        """do inc gens"""
+        self._poller.bail_if_calculating()
+        for _ in range(self._increment):
+            if self._poller.poll():
+                break
+            self._dogen()
+        self.step_hperf, self.inc_hperf = self.running_hperf.report_step(
+            self.step_hperf, self.inc_hperf, float(self._generation), self._verbose)
+
+    def write_native_format(self, os: io.StringIO, comments: str) -> str:
+        return "No native format for sparsealgo yet."
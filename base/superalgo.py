@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import numpy as np
+
+import base.generationsalgo as generationsalgo
+import base.hqlifealgo as hqlifealgo
+import base.liferules as liferules
+from base.lifealgo import *
+
+
+# The Super algorithm runs Life-like rules with extra states that record
+# what happened to each cell, as Golly's superalgo does.  LifeHistory has 7
+# states: odd states are alive, 2 marks cells that were once alive, 4 and 3
+# are a marked dead and live cell, 5 a live cell that stays marked and 6 a
+# boundary that kills live neighbors.  LifeSuper has 26 states and also
+# labels live cells by where their births came from.
+#
+# The universe is the same dense byte array as Generations.  A cell is alive
+# in the underlying Life rule when its state is odd, so each generation
+# steps the odd states as a live plane with QuickLife's bit-parallel kernel.
+# The extra states are then worked out for the whole array at once: every
+# cell gets a type mask with bit s set when some neighbor is in state s,
+# and Golly's per-cell cases become masks over the state, the live plane
+# and the type mask.
+HISTORY_STATES = 7
+SUPER_STATES = 26
+
+POSTFIXES = {"history": ("History", HISTORY_STATES), "super": ("Super", SUPER_STATES)}
+SHORTCUTS = {"life": liferules.MOORE, "lifeh": liferules.HEXAGONAL, "lifev": liferules.VON_NEUMANN}
+
+
+def state_bits(*states: int) -> int:
+    """the type mask bits of the given states"""
+    return sum(1 << s for s in set(states))
+
+
+ALIVE_WITH_14 = state_bits(1, 3, 5, 7, 9, 11, 13, 14, 15, 17, 19, 21, 23, 25)
+ALIVE_WITH_14_OR_18 = ALIVE_WITH_14 | state_bits(18)
+ALIVE_1_3_5_7 = state_bits(1, 3, 5, 7)
+ALIVE_9_TO_25 = state_bits(*range(9, 26, 2))
+ALIVE_13_TO_25 = state_bits(*range(13, 26, 2))
+ALIVE_9_11 = state_bits(9, 11)
+ALIVE_7_13_TO_25 = state_bits(7, *range(13, 26, 2))
+ALIVE_1_3_5_9_11 = state_bits(1, 3, 5, 9, 11)
+ALIVE_1_5_7_9_11 = state_bits(1, 5, 7, 9, 11)
+ALIVE_1_3_5_13_TO_25 = state_bits(1, 3, 5, *range(13, 26, 2))
+
+
+def type_mask(states: np.ndarray, neighbormask: int) -> np.ndarray:
+    """for every cell, the OR of 1 << state over its neighbors"""
+    rows, cols = states.shape
+    padded = np.zeros((rows + 2, cols + 2), np.uint32)
+    padded[1:-1, 1:-1] = np.left_shift(np.uint32(1), states, dtype=np.uint32)
+    mask = np.zeros((rows, cols), np.uint32)
+    for p in range(9):
+        if p != 4 and neighbormask >> p & 1:
+            dy, dx = p // 3, p % 3
+            mask |= padded[dy:dy + rows, dx:dx + cols]
+    return mask
+
+
+def single_state(calc: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """which type masks have exactly one bit set, and the state it stands for"""
+    single = (calc != 0) & (calc & (calc - np.uint32(1)) == 0)
+    return single, (np.frexp(calc.astype(np.float64))[1] - 1).astype(np.uint8)
+
+
+def next_states(states: np.ndarray, rules: SuperRules) -> np.ndarray:
+    """Compute the next generation of a state array, taking the cells
+       beyond its edges as dead."""
+    rows, cols = states.shape
+    padded = np.zeros((rows + 2, cols // generationsalgo.WORD_BITS + 2), np.uint32)
+    padded[1:-1, 1:-1] = generationsalgo.pack_live(states & 1)
+    alive = generationsalgo.unpack_live(hqlifealgo.next_words(padded, rules))
+    mask = type_mask(states, rules.neighbormask)
+    if rules.states == HISTORY_STATES:
+        return history_states(states, alive, mask)
+    return super_states(states, alive, mask)
+
+
+def history_states(c: np.ndarray, alive: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """LifeHistory: births clear the history mark (but keep a marked cell
+       marked), deaths leave one behind, and a boundary neighbor kills"""
+    even = (c & 1) == 0
+    born = np.select([c == 4, c == 6], [np.uint8(3), np.uint8(6)], np.uint8(1))
+    died = np.where(c == 5, np.uint8(4), c + np.uint8(1))
+    new = np.where(alive, np.where(even, born, c), np.where(even, c, died))
+    # boundary cells kill their live neighbors whatever the rule says
+    killed = (mask & state_bits(6)) != 0
+    new = np.where(killed & (c == 1), np.uint8(2), new)
+    return np.where(killed & ((c == 3) | (c == 5)), np.uint8(4), new)
+
+
+def super_states(c: np.ndarray, alive: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """LifeSuper: as LifeHistory, and births take on the label of the
+       neighbors that caused them"""
+    odd = (c & 1) != 0
+    has = {s: (mask & state_bits(s)) != 0 for s in (1, 3, 5, 7, 18, 20, 22)}
+
+    # births in the plain states are labelled from their neighbors
+    calc = mask & np.uint32(ALIVE_9_TO_25)
+    single, label = single_state(calc)
+    born = np.where(single & ((mask & np.uint32(ALIVE_1_3_5_7)) == 0), label, np.uint8(1))
+    plain = born == 1
+    calc = mask & np.uint32(ALIVE_13_TO_25)
+    single, label = single_state(calc)
+    take = plain & has[3] & single & ((mask & np.uint32(ALIVE_1_5_7_9_11)) == 0)
+    born, plain = np.where(take, label, born), plain & ~take
+    calc = mask & np.uint32(ALIVE_9_11)
+    single, label = single_state(calc)
+    take = plain & has[7] & single & ((mask & np.uint32(ALIVE_1_3_5_13_TO_25)) == 0)
+    born, plain = np.where(take, label, born), plain & ~take
+    take = plain & ((mask & np.uint32(ALIVE_7_13_TO_25)) != 0) & ((mask & np.uint32(ALIVE_1_3_5_9_11)) == 0)
+    born = np.where(take, np.uint8(13), born)
+    born = np.select([c == 4, c == 6, c == 8], [np.uint8(3), np.uint8(6), np.uint8(7)], born)
+
+    # deaths: the low states leave a mark behind, the labelled ones vanish
+    died = np.select([c == 5, c <= 11], [np.uint8(4), c + np.uint8(1)], np.uint8(0))
+    # dead cells in the high states follow their neighbors around
+    dead = np.select([c == 14,
+                      (c == 16) & ((mask & np.uint32(ALIVE_WITH_14)) != 0),
+                      (c == 18) & has[22],
+                      (c == 20) & has[18],
+                      (c == 22) & has[20],
+                      (c == 24) & ((mask & np.uint32(ALIVE_WITH_14_OR_18)) != 0)],
+                     [np.uint8(0), np.uint8(14), np.uint8(22), np.uint8(18), np.uint8(20), np.uint8(18)], c)
+    new = np.where(alive, np.where(odd, c, born), np.where(odd, died, dead))
+
+    # boundary cells kill their live neighbors whatever the rule says
+    killed = (mask & state_bits(6)) != 0
+    return np.select([killed & ((c == 7) | (c == 8) | (c >= 13)),
+                      killed & (c == 1),
+                      killed & ((c == 3) | (c == 5)),
+                      killed & (c == 9),
+                      killed & (c == 11)],
+                     [np.uint8(0), np.uint8(2), np.uint8(4), np.uint8(10), np.uint8(12)], new)
+
+
+class SuperRules(liferules.LifeRules):
+    """Rules like "LifeHistory", "LifeSuper", "B36/S23History" or
+       "MAP...Super": a rule LifeRules parses, or one of the shortcuts
+       Life, LifeH and LifeV for B3/S23, followed by History or Super.  B0
+       is only supported together with S8 (Smax), by running the inverted
+       rule on the inverted universe."""
+    states: int
+    __canon_rule: str
+
+    def init_rule(self) -> None:
+        """default to LifeSuper"""
+        super(SuperRules, self).init_rule()
+        self.set_rule("LifeSuper")
+
+    def set_rule(self, rule_string: str, algo=None) -> str | None:
+        """parse a Super or History rule (optionally followed by a bounded
+           grid suffix); returns an error message, or None if the rule is valid"""
+        if len(rule_string) > liferules.MAX_RULE_SIZE:
+            return "Rule name is too long."
+        rule, colon, suffix = rule_string.strip().partition(':')
+        rule = rule.strip()
+        for key, (postfix, states) in POSTFIXES.items():
+            if rule.lower().endswith(key):
+                rule = rule[:-len(key)]
+                break
+        else:
+            return "Missing Super or History postfix."
+
+        if rule.lower() in SHORTCUTS:
+            rule = "B3/S23" + liferules.NEIGHBORHOOD_SUFFIX[SHORTCUTS[rule.lower()]]
+        parsed = liferules.LifeRules.parse(rule)
+        if isinstance(parsed, str):
+            return parsed
+        life_canon, rule3x3, totalistic, mask = parsed
+        if mask == liferules.TRIANGULAR:
+            # the extra states follow neighbors in the 3x3 neighborhood
+            return liferules.LifeRules.check_neighborhood(mask, None)
+        key = life_canon
+        if rule3x3[0]:
+            if not rule3x3[-1]:
+                return postfix + " only supports B0 with Smax"
+            rule3x3 = 1 - rule3x3[::-1]
+            totalistic = False
+            key += ":inverted"
+
+        if colon:
+            if algo is None:
+                return "Bounded grids are not supported here."
+            err = algo.set_grid_size(colon + suffix)
+            if err != chr(0):
+                return err
+        elif algo is not None:
+            algo.set_grid_size(":")
+
+        if life_canon == "B3/S23" + liferules.NEIGHBORHOOD_SUFFIX[mask]:
+            canon = "Life" + liferules.NEIGHBORHOOD_SUFFIX[mask] + postfix
+        else:
+            canon = life_canon + postfix
+        if algo is not None:
+            canon += algo.canonical_suffix().rstrip(chr(0))
+        self._use(liferules.rule_cache.get(key, lambda: liferules.CompiledRule.compile(
+            rule3x3, totalistic, mask)))
+        self.states = states
+        self.__canon_rule = canon
+        return None
+
+    def get_rule(self) -> str:
+        return self.__canon_rule
+
+
+class SuperAlgo(generationsalgo.GenerationsAlgo):
+    """LifeHistory and LifeSuper over the Generations engine's dense state
+       array.  The Life part of each generation is the bit-parallel step of
+       the odd states; the extra states follow from vectorised masks."""
+    _rules: SuperRules
+
+    def __init__(self):
+        super(SuperAlgo, self).__init__()
+        self._rules = SuperRules()
+        self._max_cell_states = cint(self._rules.states)
+
+    @property
+    def default_rule(self) -> str:
+        return "LifeSuper"
+
+    def triangular_capable(self) -> cint:
+        return cint(0)
+
+    def _dogen(self) -> None:
+        self._fit_margin()
+        self._states = next_states(self._states, self._rules)
+        self.running_hperf.tiles_calculated += self._states.size // (generationsalgo.TILE * generationsalgo.TILE)
+        self._generation += 1
+
+    def write_native_format(self, os: io.StringIO, comments: str) -> str:
+        return "No native format for superalgo yet."
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+
+import numpy as np
+
+import base.hqlifealgo as hqlifealgo
+from base.lifealgo import *
+
+
+# Shared by the algorithms whose rules map a cell and its neighbors to the
+# cell's next state with a lookup (JvN and RuleLoader).  The universe is a
+# dense uint8 array of states covering whole 32x32 tiles, with one or two
+# empty tiles around the pattern and a permanent border of one dead cell.
+#
+# Like QuickLife, only tiles whose neighborhood changed in the previous
+# generation are recomputed.  That is exact for any such rule: a cell's
+# state is the rule applied to its neighborhood one generation ago, so when
+# the neighborhood stays the same the cell does too.  Cells edited since the
+# last generation, and every cell after a change of rule, are the exception.
+TILE = hqlifealgo.TILE_ROWS
+
+
+class TileAlgo(LifeAlgo):
+    """A multi-state universe stepped by _next_states over the tiles whose
+       neighborhood changed in the previous generation."""
+    _moore: bool = True  # the neighborhood includes the diagonal neighbors
+
+    _cells: np.ndarray   # the universe plus a permanent border of dead cells
+    _states: np.ndarray  # view of the universe; TILE * n rows of TILE * m cells
+    _x0: int             # universe coordinates of _states[0, 0]
+    _y0: int
+    _occupied: np.ndarray             # per tile: has cells that aren't dead
+    _flags: np.ndarray                # per tile: CHANGED in the last generation
+    _local_delta_forward: np.ndarray  # per tile: edited since the last generation
+    _delta_forward: bool              # recompute every tile in the next generation
+    _population: int
+    _pop_valid: bool
+
+    def __init__(self):
+        super(TileAlgo, self).__init__()
+        self._increment = 1
+        self._x0 = self._y0 = -TILE
+        self._set_storage(np.zeros((3 * TILE + 2, 3 * TILE + 2), np.uint8))
+        self._delta_forward = False
+        self._population = 0
+        self._pop_valid = True
+
+    # coordinates and storage management
+
+    def _set_storage(self, cells: np.ndarray) -> None:
+        """install a new bordered state array and reset the per tile data"""
+        self._cells = cells
+        self._states = cells[1:-1, 1:-1]
+        self._occupied = self._tile_view(self._states).any(axis=(1, 3))
+        self._flags = np.zeros(self._occupied.shape, np.uint8)
+        self._local_delta_forward = self._occupied.copy()
+
+    @staticmethod
+    def _tile_view(states: np.ndarray) -> np.ndarray:
+        """view states as (tile rows, TILE, tile columns, TILE)"""
+        return states.reshape(states.shape[0] // TILE, TILE, states.shape[1] // TILE, TILE)
+
+    def _locate(self, x: int, y: int) -> tuple[int, int]:
+        """return the row and column of a cell (possibly out of range)"""
+        return y - self._y0, x - self._x0
+
+    def _resize_tiles(self, top: int, left: int, bottom: int, right: int) -> None:
+        """add (or remove, if negative) whole tiles on each side of the array"""
+        ty, tx = self._occupied.shape
+        new_ty, new_tx = ty + top + bottom, tx + left + right
+        cells = np.zeros((new_ty * TILE + 2, new_tx * TILE + 2), np.uint8)
+        src_t0, dst_t0 = max(0, -top), max(0, top)
+        src_c0, dst_c0 = max(0, -left), max(0, left)
+        tile_rows, tile_cols = min(ty - src_t0, new_ty - dst_t0), min(tx - src_c0, new_tx - dst_c0)
+        cells[1 + dst_t0 * TILE:1 + (dst_t0 + tile_rows) * TILE, 1 + dst_c0 * TILE:1 + (dst_c0 + tile_cols) * TILE] = \
+            self._states[src_t0 * TILE:(src_t0 + tile_rows) * TILE, src_c0 * TILE:(src_c0 + tile_cols) * TILE]
+        flags, local_delta_forward = self._flags, self._local_delta_forward
+        self._set_storage(cells)
+        # carry the change flags over to the tiles' new positions
+        self._flags[dst_t0:dst_t0 + tile_rows, dst_c0:dst_c0 + tile_cols] = \
+            flags[src_t0:src_t0 + tile_rows, src_c0:src_c0 + tile_cols]
+        self._local_delta_forward[dst_t0:dst_t0 + tile_rows, dst_c0:dst_c0 + tile_cols] = \
+            local_delta_forward[src_t0:src_t0 + tile_rows, src_c0:src_c0 + tile_cols]
+        self._y0 -= top * TILE
+        self._x0 -= left * TILE
+
+    def _ensure_cell(self, x: int, y: int) -> None:
+        """grow the array so the cell has a tile of margin on every side;
+           grow generously so that loading a pattern cell by cell stays cheap"""
+        ty, tx = self._occupied.shape
+        row, col = self._locate(x, y)
+        tile_row, tile_col = row // TILE, col // TILE
+        need = [max(0, 1 - tile_row), max(0, 1 - tile_col),
+                max(0, tile_row + 2 - ty), max(0, tile_col + 2 - tx)]
+        if any(need):
+            slack = [ty >> 1, tx >> 1, ty >> 1, tx >> 1]
+            self._resize_tiles(*(n + s if n else 0 for n, s in zip(need, slack)))
+
+    def _fit_margin(self) -> None:
+        """Keep one to two empty tiles around the pattern, so the next
+           generation fits in the array without wasting work on empty space."""
+        occupied = self._occupied
+        rows, cols = np.flatnonzero(occupied.any(axis=1)), np.flatnonzero(occupied.any(axis=0))
+        if not len(rows):
+            return
+        ty, tx = occupied.shape
+        margins = [int(rows[0]), int(cols[0]), int(ty - 1 - rows[-1]), int(tx - 1 - cols[-1])]
+        if all(1 <= m <= 2 for m in margins):
+            return
+        self._resize_tiles(*(0 if 1 <= m <= 2 else 1 - m for m in margins))
+
+    # cell access
+
+    def set_cell(self, x: cint, y: cint, new_state: cint) -> cint:
+        x, y = as_int(x), as_int(y)
+        new_state = as_int(new_state)
+        if new_state < 0 or new_state >= self._max_cell_states.value:
+            return cint(-1)
+        if new_state:
+            self._ensure_cell(x, y)
+        row, col = self._locate(x, y)
+        if 0 <= row < self._states.shape[0] and 0 <= col < self._states.shape[1]:
+            self._states[row, col] = new_state
+            tile_row, tile_col = row // TILE, col // TILE
+            self._occupied[tile_row, tile_col] = new_state or \
+                self._states[tile_row * TILE:(tile_row + 1) * TILE, tile_col * TILE:(tile_col + 1) * TILE].any()
+            self._local_delta_forward[tile_row, tile_col] = True
+            self._pop_valid = False
+        return cint(0)
+
+    def get_cell(self, x: cint, y: cint) -> cint:
+        x, y = as_int(x), as_int(y)
+        row, col = self._locate(x, y)
+        if 0 <= row < self._states.shape[0] and 0 <= col < self._states.shape[1]:
+            return cint(int(self._states[row, col]))
+        return cint(0)
+
+    def next_cell(self, x: cint, y: cint, v: cint) -> cint:
+        """return the distance to the next non-dead cell at or to the right
+           of (x, y) and store its state in v, or return -1 if there is none"""
+        x, y = as_int(x), as_int(y)
+        row, col = self._locate(x, y)
+        if not 0 <= row < self._states.shape[0] or col >= self._states.shape[1]:
+            return cint(-1)
+        col = max(col, 0)
+        found = np.flatnonzero(self._states[row, col:])
+        if not len(found):
+            return cint(-1)
+        col += int(found[0])
+        if isinstance(v, cint):
+            v.value = int(self._states[row, col])
+        return cint(self._x0 + col - x)
+
+    def end_of_pattern(self):
+        """call after set_cell calls"""
+        self._poller.bail_if_calculating()
+        self._pop_valid = False
+        return cint(0)
+
+    @property
+    def population(self) -> int:
+        """the number of cells in any state but dead, as in Golly"""
+        if not self._pop_valid:
+            self._population = int(np.count_nonzero(self._states))
+            self._pop_valid = True
+        return self._population
+
+    def is_empty(self) -> cint:
+        return cint(not self._occupied.any())
+
+    def find_edges(self) -> tuple[int, int, int, int]:
+        rows = np.flatnonzero(self._states.any(axis=1))
+        if not len(rows):
+            return 0, 0, 0, 0
+        cols = np.flatnonzero(self._states.any(axis=0))
+        return (self._y0 + int(rows[0]), self._x0 + int(cols[0]),
+                self._y0 + int(rows[-1]), self._x0 + int(cols[-1]))
+
+    # stepping
+
+    def _next_states(self, padded: np.ndarray) -> np.ndarray:
+        """the next generation of the cells inside padded (the last two axes
+           have a border of one cell)"""
+        raise NotImplementedError
+
+    def _rule_changed(self) -> None:
+        """call when set_rule installs a new rule: drops the states the rule
+           doesn't have and recomputes every cell in the next generation"""
+        self._states[self._states >= self._max_cell_states.value] = 0
+        self._occupied = self._tile_view(self._states).any(axis=(1, 3))
+        self._delta_forward = True
+        self._pop_valid = False
+
+    def _active_tiles(self) -> np.ndarray:
+        """tiles that changed or were edited, plus their neighbors (the
+           diagonal ones too if the neighborhood has diagonal neighbors)"""
+        if self._delta_forward:
+            return np.ones(self._occupied.shape, bool)
+        changed = ((self._flags & hqlifealgo.CHANGED) != 0) | self._local_delta_forward
+        active = changed.copy()
+        active[1:] |= changed[:-1]
+        active[:-1] |= changed[1:]
+        active[:, 1:] |= changed[:, :-1]
+        active[:, :-1] |= changed[:, 1:]
+        if self._moore:
+            active[1:, 1:] |= changed[:-1, :-1]
+            active[1:, :-1] |= changed[:-1, 1:]
+            active[:-1, 1:] |= changed[1:, :-1]
+            active[:-1, :-1] |= changed[1:, 1:]
+        return active
+
+    def _dogen(self) -> None:
+        """compute one generation, only touching tiles near last changes"""
+        self._fit_margin()
+        active = self._active_tiles()
+        total = active.size
+        count = int(np.count_nonzero(active))
+        tiles = self._tile_view(self._states)
+        if count * hqlifealgo.DENSE_FRACTION >= total:
+            new = self._next_states(self._cells)
+            new_tiles = self._tile_view(new)
+            self._flags = np.where((new_tiles != tiles).any(axis=(1, 3)), hqlifealgo.CHANGED, 0).astype(np.uint8)
+            self._occupied = new_tiles.any(axis=(1, 3))
+            self._states[...] = new
+        elif count:
+            tys, txs = np.nonzero(active)
+            # each active tile plus its border of one cell, taken from the
+            # bordered array (whose row 0 / column 0 is the border)
+            rows = tys[:, None] * TILE + np.arange(TILE + 2)
+            cols = txs[:, None] * TILE + np.arange(TILE + 2)
+            new = self._next_states(self._cells[rows[:, :, None], cols[:, None, :]])
+            old = tiles[tys, :, txs, :]
+            self._flags[...] = 0
+            self._flags[tys, txs] = np.where((new != old).any(axis=(1, 2)), hqlifealgo.CHANGED, 0)
+            self._occupied[tys, txs] = new.any(axis=(1, 2))
+            tiles[tys, :, txs, :] = new
+        else:
+            self._flags[...] = 0
+        self._local_delta_forward[...] = False
+        self._delta_forward = False
+        self.running_hperf.tiles_calculated += count
+        self.running_hperf.tiles_skipped += total - count
+        self._generation += 1
+
+    def step(self) -> None:
+        """do inc gens"""
+        self._poller.bail_if_calculating()
+        for _ in range(self._increment):
+            if self._poller.poll():
+                break
+            self._dogen()
+        self._pop_valid = False
+        self.step_hperf, self.inc_hperf = self.running_hperf.report_step(
+            self.step_hperf, self.inc_hperf, float(self._generation), self._verbose)
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import copy
 import io
+import os
 import sys
 from typing import TextIO
 
@@ -147,6 +149,16 @@ def get_debug_file() -> TextIO:
     return open(get_debug_file_name(), "w+", encoding="utf-8")
 
 
+def atomic_write(path: str, data: str | bytes, mode: str = "wb") -> None:
+    """Write a file under a temporary name and then rename it, so that
+       readers (eg. other processes sharing a cache) never see a partial
+       file.  Raises OSError."""
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, mode) as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
 perf_status_line: io.StringIO = io.StringIO("")  # Buffer for status updates.
 
 
@@ -160,6 +172,11 @@ class HPerf(object):
     depth_sum: float = 0.0
     time_stamp: float = 0.0
     gen_val: float = 0.0
+    tiles_calculated: float = 0.0  # QuickLife tiles recomputed
+    tiles_skipped: float = 0.0     # QuickLife tiles left alone because nothing near them changed
+    gc_count: float = 0.0          # HashLife garbage collections
+    gc_time: float = 0.0           # seconds spent collecting garbage
+    gc_reclaimed: float = 0.0      # bytes of node storage reclaimed
     report_mask: cint = cint((1 << 16) - 1)  # node count between checks
     report_interval: float = 2.0  # time between update status bar
 
@@ -171,6 +188,11 @@ class HPerf(object):
         self.depth_sum = 0.0
         self.time_stamp = get_time()
         self.gen_val = 0.0
+        self.tiles_calculated = 0.0
+        self.tiles_skipped = 0.0
+        self.gc_count = 0.0
+        self.gc_time = 0.0
+        self.gc_reclaimed = 0.0
 
     def report(self, mark: HPerf, verbose: cint) -> HPerf:
         """Return value in mark"""
@@ -228,8 +250,18 @@ class HPerf(object):
                                    .format(gens_per_sec, node_count / elapsed, fps, 1 + depth_delta / node_count,
                                            half_frac, nodes_per_gen, node_count))
             life_status(perf_status_line.readline())
+            tiles = (self.tiles_calculated - mark.tiles_calculated) + (self.tiles_skipped - mark.tiles_skipped)
+            if tiles > 0:
+                life_status("TILES calculated {} skipped {} ({:.1%})"
+                            .format(self.tiles_calculated - mark.tiles_calculated,
+                                    self.tiles_skipped - mark.tiles_skipped,
+                                    (self.tiles_skipped - mark.tiles_skipped) / tiles))
+            if self.gc_count > mark.gc_count:
+                life_status("GC count {} pause {:.3f}s reclaimed {} bytes"
+                            .format(self.gc_count - mark.gc_count, self.gc_time - mark.gc_time,
+                                    self.gc_reclaimed - mark.gc_reclaimed))
         self.gen_val = new_gen
-        return self, self
+        return copy.copy(self), copy.copy(self)
 
     def fast_inc(self, depth: cint, half: cint) -> cint:
         self.depth_sum += depth
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the engines import their helpers (eg. overloading) from base itself
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "base")]
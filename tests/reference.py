@@ -0,0 +1,89 @@
+import collections
+
+import numpy as np
+
+# Brute-force steppers the engines are checked against: plain Python over
+# dicts of {(x, y): state} for the live cells, written from the definitions
+# of the rules rather than from any table or kernel the engines share.
+MOORE = [(dx, dy) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dx or dy]
+# Golly's hexagonal grid on square cells leaves out the NE and SW neighbors
+HEXAGONAL = [(dx, dy) for dx, dy in MOORE if dx != -dy]
+VON_NEUMANN = [(dx, dy) for dx, dy in MOORE if not dx or not dy]
+
+
+def box(r, middle=True):
+    """the Moore neighborhood of range r, as Larger than Life's NM"""
+    return [(dx, dy) for dy in range(-r, r + 1) for dx in range(-r, r + 1) if middle or dx or dy]
+
+
+def diamond(r, middle=True):
+    """the von Neumann neighborhood of range r, as Larger than Life's NN"""
+    return [(dx, dy) for dx, dy in box(r, middle) if abs(dx) + abs(dy) <= r]
+
+
+def torus(left, top, wd, ht):
+    """a wrap function for step on a wd x ht torus with the given top left cell"""
+    return lambda x, y: (left + (x - left) % wd, top + (y - top) % ht)
+
+
+def step(cells, birth, survival, neighbors=MOORE, states=2, wrap=None):
+    """one generation of a Life-like or Generations rule: state 1 is alive,
+       and a cell that doesn't survive decays through the states above 1;
+       wrap maps the neighbors of cells on a bounded grid back onto it"""
+    counts = collections.Counter((x + dx, y + dy) for (x, y), s in cells.items() if s == 1
+                                 for dx, dy in neighbors)
+    if wrap is not None:
+        wrapped = collections.Counter()
+        for pos, n in counts.items():
+            wrapped[wrap(*pos)] += n
+        counts = wrapped
+    result = {}
+    for pos in set(counts) | set(cells):
+        state, n = cells.get(pos, 0), counts[pos]
+        if state == 0:
+            state = 1 if n in birth else 0
+        elif state > 1 or n not in survival:
+            state = (state + 1) % states
+        if state:
+            result[pos] = state
+    return result
+
+
+def step_with(cells, rule):
+    """one generation of a two-state rule given as rule(alive, neighbors),
+       where neighbors is the set of offsets of the live Moore neighbors"""
+    result = {}
+    for x, y in set((x + dx, y + dy) for x, y in cells for dx, dy in MOORE) | set(cells):
+        neighbors = frozenset((dx, dy) for dx, dy in MOORE if (x + dx, y + dy) in cells)
+        if rule((x, y) in cells, neighbors):
+            result[x, y] = 1
+    return result
+
+
+def run(cells, generations, *rule, **kwargs):
+    for _ in range(generations):
+        cells = step(cells, *rule, **kwargs)
+    return cells
+
+
+def soup(seed, size=32, density=0.4, states=2, left=0, top=0):
+    """a random square of cells with its top left corner at (left, top)"""
+    rng = np.random.default_rng(seed)
+    alive = rng.random((size, size)) < density
+    values = rng.integers(1, states, (size, size))
+    return {(left + int(x), top + int(y)): int(values[y, x]) for y, x in zip(*np.nonzero(alive))}
+
+
+def load(algo, cells):
+    """write the cells into the universe"""
+    xs, ys = (np.array(c, np.int64) for c in zip(*cells)) if cells else (np.zeros(0, np.int64),) * 2
+    assert algo.set_cells(xs, ys, np.array(list(cells.values()), np.int64)).value >= 0
+    algo.end_of_pattern()
+
+
+def cells_of(algo):
+    """the universe's cells in the reference's form"""
+    if algo.is_empty().value:
+        return {}
+    xs, ys, states = algo.live_cells_in(*algo.find_edges())
+    return {(x, y): s for x, y, s in zip(xs.tolist(), ys.tolist(), states.tolist())}
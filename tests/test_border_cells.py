@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from base.lifealgo import cint
+import base.generationsalgo as generationsalgo
+import base.hlifealgo as hlifealgo
+import base.hqlifealgo as hqlifealgo
+import base.jvnalgo as jvnalgo
+import base.ruleloaderalgo as ruleloaderalgo
+import base.sparsealgo as sparsealgo
+
+ENGINES = [(hqlifealgo.HQLifeAlgo, "B3/S23"), (hlifealgo.HLifeAlgo, "B3/S23"), (sparsealgo.SparseAlgo, "B3/S23"),
+           (generationsalgo.GenerationsAlgo, "345/2/4"), (generationsalgo.HGenerationsAlgo, "345/2/4"),
+           (jvnalgo.HJvNAlgo, "JvN29"), (ruleloaderalgo.HRuleLoaderAlgo, "B3/S23")]
+TOPOLOGIES = ["P24,18", "T24,18", "K24*,18"]
+GENERATIONS = 8
+
+
+def source(algo, x, y):
+    """the grid cell a border cell shows, worked out from the topology
+       directly rather than from LifeAlgo.wrap_cells"""
+    g = algo.grid
+    col, row = x - g["left"], y - g["top"]
+    w, h = g["wd"], g["ht"]
+    if algo.bounded_plane:
+        return None
+    if not 0 <= row < h and algo.twist["h"]:
+        col = w - 1 - col
+    return g["left"] + col % w, g["top"] + row % h
+
+
+def create_border_cells_by_cell(algo):
+    g = algo.grid
+    border = [(x, y) for x in range(g["left"] - 1, g["right"] + 2) for y in (g["top"] - 1, g["bottom"] + 1)]
+    border += [(x, y) for y in range(g["top"], g["bottom"] + 1) for x in (g["left"] - 1, g["right"] + 1)]
+    states = []
+    for x, y in border:
+        shown = source(algo, x, y)
+        states.append(algo.get_cell(cint(shown[0]), cint(shown[1])).value if shown else 0)
+    for (x, y), state in zip(border, states):
+        if state:
+            algo.set_cell(cint(x), cint(y), cint(state))
+    algo.end_of_pattern()
+
+
+def delete_border_cells_by_cell(algo):
+    g = algo.grid
+    top, left, bottom, right = algo.find_edges()
+    for y in range(min(top, g["top"]), max(bottom, g["bottom"]) + 1):
+        for x in range(min(left, g["left"]), max(right, g["right"]) + 1):
+            if not (g["top"] <= y <= g["bottom"] and g["left"] <= x <= g["right"]):
+                algo.set_cell(cint(x), cint(y), cint(0))
+    algo.end_of_pattern()
+
+
+def grid_cells(algo):
+    g = algo.grid
+    return [[algo.get_cell(cint(x), cint(y)).value for x in range(g["left"] - 3, g["right"] + 4)]
+            for y in range(g["top"] - 3, g["bottom"] + 4)]
+
+
+@pytest.mark.parametrize("topology", TOPOLOGIES)
+@pytest.mark.parametrize("engine, rule", ENGINES, ids=lambda e: getattr(e, "__name__", e))
+def test_border_emulation(engine, rule, topology):
+    bulk, by_cell = engine(), engine()
+    rng = np.random.default_rng(0)
+    for algo in (bulk, by_cell):
+        assert algo.set_rule(rule + ":" + topology) is None
+        algo.increment = 1
+    g = bulk.grid
+    states = rng.integers(0, bulk.num_cell_states.value, (g["ht"], g["wd"])) * (rng.random((g["ht"], g["wd"])) < 0.4)
+    for y, x in zip(*np.nonzero(states)):
+        for algo in (bulk, by_cell):
+            algo.set_cell(cint(g["left"] + int(x)), cint(g["top"] + int(y)), cint(int(states[y, x])))
+    for algo in (bulk, by_cell):
+        algo.end_of_pattern()
+    for _ in range(GENERATIONS):
+        assert bulk.create_border_cells()
+        create_border_cells_by_cell(by_cell)
+        assert grid_cells(bulk) == grid_cells(by_cell)
+        bulk.step()
+        by_cell.step()
+        assert bulk.delete_border_cells()
+        delete_border_cells_by_cell(by_cell)
+        assert grid_cells(bulk) == grid_cells(by_cell)
+    assert bulk.population == by_cell.population
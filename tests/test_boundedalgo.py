@@ -0,0 +1,119 @@
+import pytest
+
+from base.lifealgo import cint
+import base.boundedalgo as boundedalgo
+import reference
+
+
+def test_outside_grid():
+    algo = boundedalgo.BoundedAlgo()
+    assert algo.set_rule("B3/S23:P10,8") is None
+    assert algo.set_cell(cint(0), cint(0), cint(1)).value == 0
+    assert algo.set_cell(cint(5), cint(0), cint(1)).value == -1
+    algo.end_of_pattern()
+    # cells outside the grid read as dead
+    assert algo.get_cell(cint(0), cint(0)).value == 1
+    assert algo.get_cell(cint(5), cint(0)).value == 0
+    assert algo.get_cell(cint(0), cint(-100)).value == 0
+
+
+@pytest.mark.parametrize("topology", ["T260,256", "P260,256"])
+def test_band_pool(monkeypatch, topology):
+    # two worker bands meet at y = 0, and the soups straddle it and the edges
+    monkeypatch.setattr(boundedalgo, "PARALLEL_CELLS", 0)
+    algo = boundedalgo.BoundedAlgo()
+    algo.workers = 2
+    assert algo.set_rule("B3/S23:" + topology) is None
+    left, top, wd, ht = -130, -128, 260, 256
+    cells = {}
+    for seed, (x, y) in enumerate([(left, top), (left + wd - 24, top + ht - 24), (-12, -12), (left + wd - 24, -12)]):
+        cells.update(reference.soup(seed, size=24, left=x, top=y))
+    reference.load(algo, cells)
+    wrap = reference.torus(left, top, wd, ht) if topology[0] == "T" else None
+    for increment in (1, 20):
+        algo.increment = increment
+        algo.step()
+        for _ in range(increment):
+            cells = reference.step(cells, {3}, {2, 3}, wrap=wrap)
+            cells = {(x, y): s for (x, y), s in cells.items() if left <= x < left + wd and top <= y < top + ht}
+        assert reference.cells_of(algo) == cells
+    assert algo._band_pool is not None
+    algo._close_pool()
+
+
+def torus(twist_h=False, twist_v=False, shift_h=0, shift_v=0):
+    """which cell (c, r) shows on a torus, Klein bottle or cross-surface,
+       crossing the left or right edge first and then the top or bottom;
+       a shift with a twist moves the mirrored edge by a cell"""
+    def show(c, r, w, h):
+        if not 0 <= c < w:
+            r = h - 1 - r - shift_v if twist_v else r + (shift_v if c >= w else -shift_v)
+            c %= w
+        if not 0 <= r < h:
+            c = w - 1 - c - shift_h if twist_h else c + (shift_h if r >= h else -shift_h)
+            r %= h
+        return c % w, r
+    return show
+
+
+def sphere(c, r, w, h):
+    """which cell (c, r) shows on a sphere, whose top edge is joined to its
+       left edge and bottom edge to its right; the corners show themselves"""
+    if c in (-1, w) and r in (-1, h):
+        return min(max(c, 0), w - 1), min(max(r, 0), h - 1)
+    if c < 0:
+        return r, 0
+    if r < 0:
+        return 0, c
+    if c >= w:
+        return r, h - 1
+    if r >= h:
+        return w - 1, c
+    return c, r
+
+
+def plane(c, r, w, h):
+    return (c, r) if 0 <= c < w and 0 <= r < h else None
+
+
+def surface_step(cells, birth, survival, neighbors, show, left, top, w, h):
+    """one generation on the grid, each cell counting the cells its
+       neighbors show"""
+    result = {}
+    for r in range(h):
+        for c in range(w):
+            n = 0
+            for dx, dy in neighbors:
+                shown = show(c + dx, r + dy, w, h)
+                n += shown is not None and (left + shown[0], top + shown[1]) in cells
+            if n in (survival if (left + c, top + r) in cells else birth):
+                result[left + c, top + r] = 1
+    return result
+
+
+# the cell each topology's border shows, worked out from its definition
+SURFACES = {"P40,30": plane, "T40,30": torus(), "T33,17": torus(), "T40+3,30": torus(shift_h=3),
+            "T40,30-2": torus(shift_v=-2), "K40*,30": torus(twist_h=True), "K40,30*": torus(twist_v=True),
+            "K33*,17": torus(twist_h=True), "K40*+1,30": torus(twist_h=True, shift_h=1),
+            "K40,30*+1": torus(twist_v=True, shift_v=1), "C40,30": torus(True, True), "S35": sphere}
+
+
+@pytest.mark.parametrize("rule, birth, survival, neighbors", [
+    ("B3/S23", {3}, {2, 3}, reference.MOORE), ("B2/S34H", {2}, {3, 4}, reference.HEXAGONAL),
+], ids=["life", "hexagonal"])
+@pytest.mark.parametrize("topology", SURFACES)
+def test_topologies(rule, birth, survival, neighbors, topology):
+    # every topology steps natively, so a step can run several generations
+    algo = boundedalgo.BoundedAlgo()
+    assert algo.set_rule(rule + ":" + topology) is None
+    g = algo.grid
+    left, top, w, h = g["left"], g["top"], g["wd"], g["ht"]
+    cells = {pos: s for pos, s in reference.soup(w * h, size=max(w, h), left=left, top=top).items()
+             if pos[0] < left + w and pos[1] < top + h}
+    reference.load(algo, cells)
+    for increment in (1, 1, 5, 16):
+        algo.increment = increment
+        algo.step()
+        for _ in range(increment):
+            cells = surface_step(cells, birth, survival, neighbors, SURFACES[topology], left, top, w, h)
+        assert reference.cells_of(algo) == cells
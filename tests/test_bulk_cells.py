@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from base.lifealgo import LifeAlgo, cint
+import base.generationsalgo as generationsalgo
+import base.hlifealgo as hlifealgo
+import base.hqlifealgo as hqlifealgo
+import base.jvnalgo as jvnalgo
+import base.ruleloaderalgo as ruleloaderalgo
+import base.sparsealgo as sparsealgo
+
+ENGINES = [hqlifealgo.HQLifeAlgo, hlifealgo.HLifeAlgo, sparsealgo.SparseAlgo, generationsalgo.GenerationsAlgo,
+           generationsalgo.HGenerationsAlgo, jvnalgo.HJvNAlgo, ruleloaderalgo.HRuleLoaderAlgo]
+RECTS = [(-40, -50, 39, 49), (-10, -30, 20, 5), (5, 5, 5, 45), (-40, 7, 40, 7), (200, 200, 300, 300)]
+
+
+def random_cells(algo, count, seed=0):
+    rng = np.random.default_rng(seed)
+    xs, ys = rng.integers(-50, 50, count), rng.integers(-40, 40, count)
+    states = rng.integers(1, algo.num_cell_states.value, count)
+    # the last of several writes to a cell wins, as with set_cell
+    cells = {}
+    for x, y, state in zip(xs.tolist(), ys.tolist(), states.tolist()):
+        cells[x, y] = state
+    return xs, ys, states, cells
+
+
+def as_set(cells):
+    return set(zip(*(c.tolist() for c in cells)))
+
+
+@pytest.mark.parametrize("engine", ENGINES, ids=lambda e: e.__name__)
+def test_round_trip(engine):
+    algo = engine()
+    xs, ys, states, cells = random_cells(algo, 300)
+    assert algo.set_cells(xs, ys, states).value == 0
+    algo.end_of_pattern()
+    assert algo.population == len(cells)
+    for (x, y), state in cells.items():
+        assert algo.get_cell(cint(x), cint(y)).value == state
+    for rect in RECTS:
+        top, left, bottom, right = rect
+        expected = {(x, y, s) for (x, y), s in cells.items() if top <= y <= bottom and left <= x <= right}
+        assert as_set(algo.live_cells_in(*rect)) == expected
+        assert as_set(LifeAlgo.live_cells_in(algo, *rect)) == expected
+
+
+@pytest.mark.parametrize("engine", ENGINES, ids=lambda e: e.__name__)
+def test_clear_and_reject(engine):
+    algo = engine()
+    xs, ys, states, cells = random_cells(algo, 200, seed=1)
+    algo.set_cells(xs, ys, states)
+    algo.end_of_pattern()
+    algo.clear_rect(cint(-10), cint(-20), cint(10), cint(20))
+    algo.end_of_pattern()
+    left = {(x, y): s for (x, y), s in cells.items() if not (-10 <= y <= 10 and -20 <= x <= 20)}
+    assert algo.population == len(left)
+    assert not len(algo.live_cells_in(-10, -20, 10, 20)[0])
+    # a state the rule doesn't have sets nothing
+    bad = np.array([algo.num_cell_states.value], np.int64)
+    assert algo.set_cells(np.array([100]), np.array([100]), bad).value == -1
+    assert algo.get_cell(cint(100), cint(100)).value == 0
+
+
+def test_multi_state_hashlife():
+    # multi-state leaves are single cells, not 4x4 bitmaps
+    algo = generationsalgo.HGenerationsAlgo()
+    algo.set_cells(np.array([0, 1, 2]), np.array([0, 0, 0]), np.array([1, 2, 1]))
+    algo.end_of_pattern()
+    assert algo.population == 3
+    assert as_set(algo.live_cells_in(0, 0, 0, 2)) == {(0, 0, 1), (1, 0, 2), (2, 0, 1)}
+
+
+@pytest.mark.parametrize("engine", ENGINES, ids=lambda e: e.__name__)
+def test_last_write_wins(engine):
+    algo = engine()
+    algo.set_cells(np.array([3, 3, 5, 5]), np.array([4, 4, 6, 6]), np.array([1, 0, 0, 1]))
+    algo.end_of_pattern()
+    assert algo.get_cell(cint(3), cint(4)).value == 0
+    assert algo.get_cell(cint(5), cint(6)).value == 1
+    assert algo.population == 1
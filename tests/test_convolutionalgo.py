@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+import base.convolutionalgo as convolutionalgo
+import reference
+
+CIRCLE = [(dx, dy) for dx, dy in reference.box(7, middle=False) if dx * dx + dy * dy <= 7 * 7 + 7]
+CROSS = [(dx, dy) for dx, dy in reference.box(2, middle=False) if dx == 0 or dy == 0]
+# a weight of 2 is the same neighbor counted twice
+WEIGHTED = [(dx, dy) for (dx, dy), w in zip(reference.box(1), [1, 2, 1, 2, 0, 2, 1, 2, 1]) for _ in range(w)]
+
+
+@pytest.mark.parametrize("rule, neighbors, survival, birth, states", [
+    ("R7,C0,S50-89,B50-69,NC", CIRCLE, range(50, 90), range(50, 70), 2),
+    ("R2,C3,S2-4,B3,N+", CROSS, range(2, 5), {3}, 3),
+    ("R1,C0,S3-5,B4-5,NW121202121", WEIGHTED, range(3, 6), {4, 5}, 2),
+], ids=["circle-fft", "cross-direct", "weighted"])
+@pytest.mark.parametrize("grid", ["", ":T40,36"], ids=["plane", "torus"])
+def test_convolution(rule, neighbors, survival, birth, states, grid):
+    algo = convolutionalgo.ConvolutionAlgo()
+    assert algo.set_rule(rule + grid) is None
+    wrap = reference.torus(-20, -18, 40, 36) if grid else None
+    cells = reference.soup(6, size=36, states=states, left=-20, top=-18)
+    reference.load(algo, cells)
+    for increment in (1, 1, 4):
+        algo.increment = increment
+        algo.step()
+        cells = reference.run(cells, increment, set(birth), set(survival), neighbors, states=states, wrap=wrap)
+        assert reference.cells_of(algo) == cells
+    assert cells
+
+
+def test_fft_matches_direct():
+    rng = np.random.default_rng(0)
+    bordered = (rng.random((70, 90)) < 0.3).astype(np.int32)
+    kernel = rng.integers(-3, 4, (11, 11))
+    transform = convolutionalgo.kernel_transform(kernel, (convolutionalgo.fast_length(70),
+                                                          convolutionalgo.fast_length(90)))
+    assert np.array_equal(convolutionalgo.correlate_fft(bordered, transform, 11),
+                          convolutionalgo.correlate_direct(bordered, kernel))
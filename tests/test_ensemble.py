@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+import base.ensemble as ensemble
+import reference
+
+HEIGHT, WIDTH, GENERATIONS = 20, 37, 200
+
+
+def as_array(cells):
+    grid = np.zeros((HEIGHT, WIDTH), bool)
+    for x, y in cells:
+        grid[y, x] = True
+    return grid
+
+
+@pytest.mark.parametrize("torus", [False, True], ids=["plane", "torus"])
+def test_ensemble(torus):
+    members = [{(5, 5): 1, (6, 5): 1, (5, 6): 1, (6, 6): 1},        # a block
+               {(30, 10): 1, (31, 10): 1, (32, 10): 1},            # a blinker
+               {(1, 0): 1, (2, 1): 1, (0, 2): 1, (1, 2): 1, (2, 2): 1}]  # a glider
+    members += [{pos: 1 for pos in reference.soup(seed, size=HEIGHT)} for seed in range(8)]
+    wrap = reference.torus(0, 0, WIDTH, HEIGHT) if torus else None
+    histories = []
+    for cells in members:
+        history = [cells]
+        for _ in range(GENERATIONS):
+            cells = reference.step(cells, {3}, {2, 3}, wrap=wrap)
+            cells = {(x, y): 1 for x, y in cells if 0 <= x < WIDTH and 0 <= y < HEIGHT}
+            history.append(cells)
+        histories.append(history)
+
+    batch = ensemble.Ensemble.from_cells(np.array([as_array(m) for m in members]), torus=torus)
+    batch.step(GENERATIONS)
+    assert batch.generation == GENERATIONS
+    for m, history in enumerate(histories):
+        states = [frozenset(cells) for cells in history]
+        # a member retires the first time it repeats one of its states
+        first_repeat = next((g for g in range(1, GENERATIONS + 1) if states[g] in states[max(0, g - ensemble.MAX_PERIOD):g]), None)
+        if first_repeat is None:
+            assert batch.active[m] and not batch.settled[m]
+            last = GENERATIONS
+        else:
+            last = first_repeat
+            assert not batch.active[m]
+            assert batch.settled_at[m] + batch.period[m] == last
+            assert states[batch.settled_at[m]] == states[last]
+        assert np.array_equal(batch.cells(m), as_array(history[last]))
+        assert batch.population[m] == len(history[last])
+    # the block and blinker settle at once; some soups settle later and some never
+    assert list(batch.period[:2]) == [1, 2]
+    assert batch.settled[3:].any() and batch.active[3:].any()
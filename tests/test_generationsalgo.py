@@ -0,0 +1,24 @@
+import pytest
+
+import base.generationsalgo as generationsalgo
+import reference
+
+
+@pytest.mark.parametrize("rule, survival, birth, states", [
+    ("345/2/4", {3, 4, 5}, {2}, 4),
+    ("12/34/3", {1, 2}, {3, 4}, 3),
+    ("23/3/2", {2, 3}, {3}, 2),
+], ids=["star-wars", "12/34/3", "life"])
+@pytest.mark.parametrize("engine", [generationsalgo.GenerationsAlgo, generationsalgo.HGenerationsAlgo],
+                         ids=lambda e: e.__name__)
+def test_generations(engine, rule, survival, birth, states):
+    algo = engine()
+    assert algo.set_rule(rule) is None
+    assert algo.num_cell_states.value == states
+    cells = reference.soup(4, size=40, states=states, left=-20, top=33)
+    reference.load(algo, cells)
+    for increment in (1, 1, 2, 8):
+        algo.increment = increment
+        algo.step()
+        cells = reference.run(cells, increment, birth, survival, states=states)
+        assert reference.cells_of(algo) == cells
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from base.lifealgo import cint
+import base.generationsalgo as generationsalgo
+import base.hlifealgo as hlifealgo
+import reference
+
+# each hashlife engine with a rule that runs Life on it
+HASHLIFE = [(hlifealgo.HLifeAlgo, "B3/S23"), (generationsalgo.HGenerationsAlgo, "23/3/2")]
+
+
+def counted_gc(engine):
+    """the engine, failing instead of looping when collections stop making progress"""
+
+    class CountedGC(engine):
+        def _collect_garbage(self, *extra):
+            assert self.running_hperf.gc_count < 10, "no progress between collections"
+            return super(CountedGC, self)._collect_garbage(*extra)
+
+    return CountedGC
+
+
+def soup(algo, seed, size=64, density=0.35):
+    rng = np.random.default_rng(seed)
+    ys, xs = np.nonzero(rng.random((size, size)) < density)
+    algo.set_cells(xs, ys, np.ones(len(xs), np.int64))
+    algo.end_of_pattern()
+
+
+def cells_of(algo):
+    return set(zip(*(c.tolist() for c in algo.live_cells_in(*algo.find_edges())[:2])))
+
+
+@pytest.mark.parametrize("seed", [2, 5])
+@pytest.mark.parametrize("engine, rule", HASHLIFE, ids=lambda e: getattr(e, "__name__", e))
+def test_low_memory(engine, rule, seed):
+    # at the smallest max_memory this soup overflows the store mid-step
+    low, high = counted_gc(engine)(), engine()
+    low.max_memory = cint(hlifealgo.MIN_MAX_MEMORY)
+    for algo in (low, high):
+        algo.set_rule(rule)
+        soup(algo, seed)
+        algo.increment = 1 << 12
+        algo.step()
+    assert low.running_hperf.gc_count >= 1
+    assert low.generation == high.generation == 1 << 12
+    assert cells_of(low) == cells_of(high)
+
+
+@pytest.mark.parametrize("left, top", [(0, 0), (-45, 17)])
+def test_life(left, top):
+    algo = hlifealgo.HLifeAlgo()
+    assert algo.set_rule("B3/S23") is None
+    cells = reference.soup(1, size=48, left=left, top=top)
+    reference.load(algo, cells)
+    for increment in (1, 1, 2, 8, 32, 64):
+        algo.increment = increment
+        algo.step()
+        cells = reference.run(cells, increment, {3}, {2, 3})
+        assert reference.cells_of(algo) == cells
+    assert algo.generation == 108
+    assert algo.population == len(cells)
+
+
+def test_clipboard_survives_gc():
+    algo = counted_gc(hlifealgo.HLifeAlgo)()
+    algo.max_memory = cint(hlifealgo.MIN_MAX_MEMORY)
+    assert algo.set_rule("B3/S23") is None
+    cells = reference.soup(2, size=64, density=0.35)
+    reference.load(algo, cells)
+    algo.clipboard = algo.current_state
+    algo.increment = 1 << 12
+    algo.step()
+    assert algo.running_hperf.gc_count >= 1
+    assert algo.running_hperf.gc_reclaimed > 0
+    # the collections renumbered the clipboard's node but kept its cells
+    algo.current_state = algo.clipboard
+    assert reference.cells_of(algo) == cells
@@ -0,0 +1,80 @@
+import threading
+
+import numba as nb
+import pytest
+
+import base.generationsalgo as generationsalgo
+import base.hqlifealgo as hqlifealgo
+import reference
+
+LIFE = ({3}, {2, 3})
+
+
+@pytest.mark.parametrize("left, top", [(0, 0), (-45, 17), (1000, -3000)])
+def test_life(left, top):
+    # the soup straddles word, brick and tile boundaries wherever it lies
+    algo = hqlifealgo.HQLifeAlgo()
+    assert algo.set_rule("B3/S23") is None
+    cells = reference.soup(1, size=48, left=left, top=top)
+    reference.load(algo, cells)
+    for increment in (1, 1, 1, 5, 32):
+        algo.increment = increment
+        algo.step()
+        cells = reference.run(cells, increment, *LIFE)
+        assert reference.cells_of(algo) == cells
+    assert algo.generation == 40
+    assert algo.population == len(cells)
+
+
+def test_skip_stable_tiles():
+    # a glider crosses quiet tiles into a block, far from a blinker
+    algo = hqlifealgo.HQLifeAlgo()
+    assert algo.set_rule("B3/S23") is None
+    cells = {(1, 0): 1, (2, 1): 1, (0, 2): 1, (1, 2): 1, (2, 2): 1,
+             (70, 72): 1, (71, 72): 1, (70, 73): 1, (71, 73): 1,
+             (300, 5): 1, (300, 6): 1, (300, 7): 1}
+    reference.load(algo, cells)
+    for _ in range(300):
+        algo.step()
+        cells = reference.step(cells, *LIFE)
+        assert reference.cells_of(algo) == cells
+    assert algo.running_hperf.tiles_skipped > algo.running_hperf.tiles_calculated > 0
+
+
+@pytest.fixture
+def all_threads():
+    yield
+    hqlifealgo.set_threads(0)
+
+
+def test_set_threads(all_threads):
+    limit = nb.config.NUMBA_NUM_THREADS
+    hqlifealgo.set_threads(1)
+    assert nb.get_num_threads() == 1
+    hqlifealgo.set_threads(limit + 1)
+    assert nb.get_num_threads() == limit
+    hqlifealgo.set_threads(0)
+    assert nb.get_num_threads() == limit
+
+
+@pytest.mark.parametrize("threads", [1, 0], ids=["one", "all"])
+def test_concurrent_steps(all_threads, threads):
+    # the kernels release the GIL, so universes can step in several threads
+    hqlifealgo.set_threads(threads)
+    universes = [(hqlifealgo.HQLifeAlgo(), "B3/S23", {3}, {2, 3}, 2),
+                 (hqlifealgo.HQLifeAlgo(), "B36/S23", {3, 6}, {2, 3}, 2),
+                 (generationsalgo.GenerationsAlgo(), "345/2/4", {2}, {3, 4, 5}, 4),
+                 (generationsalgo.GenerationsAlgo(), "23/3/2", {3}, {2, 3}, 2)]
+    expected = []
+    for seed, (algo, rule, birth, survival, states) in enumerate(universes):
+        assert algo.set_rule(rule) is None
+        cells = reference.soup(seed, size=64, states=states)
+        reference.load(algo, cells)
+        algo.increment = 12
+        expected.append(reference.run(cells, 12, birth, survival, states=states))
+    workers = [threading.Thread(target=universe[0].step) for universe in universes]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert [reference.cells_of(universe[0]) for universe in universes] == expected
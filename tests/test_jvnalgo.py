@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+import base.jvnalgo as jvnalgo
+import reference
+
+ORDINARY_EAST, EXCITED_EAST = 9, 13  # an ordinary transmission state pointing east, quiet and excited
+
+
+def calc(rule_name):
+    rule = jvnalgo.RULE_NAMES.index(rule_name)
+    if rule == jvnalgo.HUTTON32:
+        return jvnalgo.hutton_calc
+    return lambda c, n, s, e, w: jvnalgo.jvn_calc(rule, c, n, s, e, w)
+
+
+def jvn_step(cells, calc):
+    """one generation, one call of the transition function per cell"""
+    result = {}
+    for x, y in set((x + dx, y + dy) for x, y in cells for dx, dy in reference.VON_NEUMANN) | set(cells):
+        state = int(calc(*(cells.get((x + dx, y + dy), 0) for dx, dy in ((0, 0), (0, -1), (0, 1), (1, 0), (-1, 0)))))
+        if state:
+            result[x, y] = state
+    return result
+
+
+@pytest.mark.parametrize("engine, rule", [(jvnalgo.JvNAlgo, rule) for rule in jvnalgo.RULE_NAMES] +
+                         [(jvnalgo.HJvNAlgo, "JvN29")], ids=lambda e: getattr(e, "__name__", e))
+def test_jvn(engine, rule):
+    algo = engine()
+    assert algo.set_rule(rule) is None
+    cells = reference.soup(7, size=24, density=0.3, states=jvnalgo.NUM_STATES[rule], left=-50, top=20)
+    reference.load(algo, cells)
+    for increment in (1, 1, 4):
+        algo.increment = increment
+        algo.step()
+        for _ in range(increment):
+            cells = jvn_step(cells, calc(rule))
+        assert reference.cells_of(algo) == cells
+
+
+def test_transmission_line():
+    # an excitation moves one cell a generation along the line
+    algo = jvnalgo.JvNAlgo()
+    line = np.full(40, ORDINARY_EAST)
+    line[0] = EXCITED_EAST
+    assert algo.set_cells(np.arange(40), np.zeros(40, np.int64), line).value >= 0
+    algo.end_of_pattern()
+    for t in range(1, 30):
+        algo.step()
+        assert [x for (x, y), s in reference.cells_of(algo).items() if s == EXCITED_EAST] == [t]
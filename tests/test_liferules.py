@@ -0,0 +1,142 @@
+import base64
+
+import numpy as np
+import pytest
+
+import base.generationsalgo as generationsalgo
+import base.hlifealgo as hlifealgo
+import base.hqlifealgo as hqlifealgo
+import base.liferules as liferules
+import reference
+
+
+@pytest.mark.parametrize("rule, canon", [
+    ("B3,10/S2,11L", "B3,10/S2,11L"),
+    ("b11,3,10/s12l", "B3,10,11/S12L"),
+    ("B1,0,3/S2L", "B013/S2L"),         # no count needs two digits
+    ("B123/S23L", "B123/S23L"),
+])
+def test_triangular_counts(rule, canon):
+    parsed = liferules.LifeRules.parse(rule)
+    assert parsed[0] == canon
+    assert liferules.LifeRules.parse(canon)[0] == canon
+
+
+@pytest.mark.parametrize("rule, error", [
+    ("B3,10/S2", "Commas are only allowed in triangular rules."),
+    ("B3,,10/S2L", "Commas must separate counts."),
+    ("B3,/S2L", "Commas must separate counts."),
+    ("B3,13/S2L", "Digit greater than neighborhood allows."),
+])
+def test_triangular_count_errors(rule, error):
+    assert liferules.LifeRules.parse(rule) == error
+
+
+def test_triangular_generations():
+    algo = generationsalgo.GenerationsAlgo()
+    assert algo.set_rule("2,11/3,10/4L") is None
+    assert algo.get_rule() == "2,11/3,10/4L"
+
+
+@pytest.mark.parametrize("rule, birth, survival, neighbors", [
+    ("B3/S23", {3}, {2, 3}, reference.MOORE),
+    ("B36/S125", {3, 6}, {1, 2, 5}, reference.MOORE),
+    ("B24/S35H", {2, 4}, {3, 5}, reference.HEXAGONAL),
+    ("B13/S012V", {1, 3}, {0, 1, 2}, reference.VON_NEUMANN),
+])
+def test_leaf_table(rule, birth, survival, neighbors):
+    rules = liferules.LifeRules()
+    assert rules.set_rule(rule) is None
+    for block in np.random.default_rng(0).integers(0, 1 << 16, 2000).tolist():
+        cells = {(i % 4, i // 4): 1 for i in range(16) if (block >> i) & 1}
+        result = reference.step(cells, birth, survival, neighbors)
+        center = sum(1 << ((y - 1) * 2 + x - 1) for x, y in result if 1 <= x <= 2 and 1 <= y <= 2)
+        assert rules.leaf_table[block] == center
+
+
+def test_rule_cache(tmp_path):
+    built = []
+
+    def build(birth, survival):
+        built.append((birth, survival))
+        return liferules.CompiledRule.compile(liferules.make_rule3x3(frozenset(birth), frozenset(survival)), True)
+
+    cache = liferules.RuleCache(size=2)
+    life = cache.get("B3/S23", lambda: build({3}, {2, 3}))
+    assert cache.get("B3/S23", lambda: build({3}, {2, 3})) is life
+    cache.get("B36/S23", lambda: build({3, 6}, {2, 3}))
+    cache.get("B2/S", lambda: build({2}, set()))
+    # the least recently used rule was evicted
+    assert len(cache) == 2
+    assert cache.get("B3/S23", lambda: build({3}, {2, 3})) is not life
+    assert len(built) == 4
+
+    # a second process reloads the tables from the cache directory
+    saved, loaded = liferules.RuleCache(), liferules.RuleCache()
+    saved.cache_dir = loaded.cache_dir = str(tmp_path)
+    compiled = saved.get("B36/S23", lambda: build({3, 6}, {2, 3}))
+    copy = loaded.get("B36/S23", lambda: build({3, 6}, {2, 3}))
+    assert len(built) == 5
+    assert (copy.birth, copy.survival, copy.totalistic) == (frozenset({3, 6}), frozenset({2, 3}), True)
+    assert np.array_equal(copy.leaf_table, compiled.leaf_table)
+    assert not copy.leaf_table.flags.writeable
+
+
+def test_rules_share_tables():
+    a, b = liferules.LifeRules(), liferules.LifeRules()
+    assert a.set_rule("B36/S23") is None and b.set_rule("b36s23") is None
+    assert a.leaf_table is b.leaf_table
+
+
+def pair_letter(neighbors):
+    """the Hensel letter of two neighbors, from their geometry"""
+    (ax, ay), (bx, by) = neighbors
+    corners = (ax != 0 and ay != 0) + (bx != 0 and by != 0)
+    if corners == 1:
+        return "a" if abs(ax - bx) + abs(ay - by) == 1 else "k"
+    opposite = (ax, ay) == (-bx, -by)
+    return ("n" if opposite else "c") if corners == 2 else ("i" if opposite else "e")
+
+
+def b2_minus_a(alive, neighbors):
+    """B2-a/S12"""
+    if alive:
+        return len(neighbors) in (1, 2)
+    return len(neighbors) == 2 and pair_letter(neighbors) != "a"
+
+
+def b2ce_s1e(alive, neighbors):
+    """B2ce/S1e"""
+    if alive:
+        return len(neighbors) == 1 and 0 in next(iter(neighbors))
+    return len(neighbors) == 2 and pair_letter(neighbors) in "ce"
+
+
+def life(alive, neighbors):
+    return len(neighbors) in ((2, 3) if alive else (3,))
+
+
+def map_rule(rule):
+    """the rule as a MAP string, NW the top bit of the neighborhood and SE the bottom"""
+    order = [(-1, -1), (0, -1), (1, -1), (-1, 0), (0, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]
+    bits = [rule(i & 16 != 0, frozenset(d for b, d in enumerate(order) if b != 4 and (i << b) & 256))
+            for i in range(512)]
+    return "MAP" + base64.b64encode(np.packbits(bits).tobytes()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("engine", [hqlifealgo.HQLifeAlgo, hlifealgo.HLifeAlgo], ids=lambda e: e.__name__)
+@pytest.mark.parametrize("rule, reference_rule", [
+    ("B2-a/S12", b2_minus_a),
+    ("B2ce/S1e", b2ce_s1e),
+    ("B3aceijknqry/S2aceikn3aceijknqry", life),
+    (map_rule(b2_minus_a), b2_minus_a),
+], ids=["B2-a/S12", "B2ce/S1e", "B3/S23-letters", "MAP"])
+def test_isotropic(engine, rule, reference_rule):
+    algo = engine()
+    assert algo.set_rule(rule) is None
+    cells = reference.soup(3, size=24, density=0.3)
+    reference.load(algo, cells)
+    for _ in range(8):
+        algo.step()
+        cells = reference.step_with(cells, reference_rule)
+        assert reference.cells_of(algo) == cells
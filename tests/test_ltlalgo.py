@@ -0,0 +1,25 @@
+import pytest
+
+import base.ltlalgo as ltlalgo
+import reference
+
+
+@pytest.mark.parametrize("rule, neighbors, survival, birth, states, density", [
+    ("R2,C0,M1,S6..9,B6..7,NM", reference.box(2), range(6, 10), range(6, 8), 2, 0.4),
+    ("R3,C0,M0,S8..14,B9..11,NN", reference.diamond(3, middle=False), range(8, 15), range(9, 12), 2, 0.4),
+    ("R5,C3,M1,S34..58,B34..45,NM", reference.box(5), range(34, 59), range(34, 46), 3, 0.5),
+], ids=["R2-moore", "R3-neumann", "R5-decay"])
+@pytest.mark.parametrize("grid", ["", ":T40,36"], ids=["plane", "torus"])
+def test_ltl(rule, neighbors, survival, birth, states, density, grid):
+    # the soup fills the torus from top to bottom, so its cells wrap
+    algo = ltlalgo.LtLAlgo()
+    assert algo.set_rule(rule + grid) is None
+    wrap = reference.torus(-20, -18, 40, 36) if grid else None
+    cells = reference.soup(5, size=36, density=density, states=states, left=-20, top=-18)
+    reference.load(algo, cells)
+    for increment in (1, 1, 4):
+        algo.increment = increment
+        algo.step()
+        cells = reference.run(cells, increment, set(birth), set(survival), neighbors, states=states, wrap=wrap)
+        assert reference.cells_of(algo) == cells
+    assert cells
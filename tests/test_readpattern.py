@@ -0,0 +1,122 @@
+import gzip
+import io
+
+import numpy as np
+import pytest
+
+from base.lifealgo import cint
+import base.bgolly as bgolly
+import base.generationsalgo as generationsalgo
+import base.hlifealgo as hlifealgo
+import base.hqlifealgo as hqlifealgo
+import base.readpattern as readpattern
+import reference
+
+GLIDER = {(1, 0): 1, (2, 1): 1, (0, 2): 1, (1, 2): 1, (2, 2): 1}
+
+
+def cells_of(algo):
+    if algo.is_empty().value:
+        return {}
+    xs, ys, states = algo.live_cells_in(*algo.find_edges())
+    return {(x, y): s for x, y, s in zip(xs.tolist(), ys.tolist(), states.tolist())}
+
+
+def read(tmp_path, text, engine=hqlifealgo.HQLifeAlgo, name="pattern"):
+    path = tmp_path / name
+    path.write_bytes(text if isinstance(text, bytes) else text.encode())
+    algo = engine()
+    return algo, readpattern.read_pattern(str(path), algo)
+
+
+@pytest.mark.parametrize("text", [
+    "#N Glider\nx = 3, y = 3, rule = B3/S23\nbo$2bo$3o!\n",
+    "x = 3, y = 3\nb\no$2bo$\n3o!\n",
+    "bo$2bo$3o!\n",
+    ".O.\n..O\nOOO\n",
+    "#Life 1.06\n1 0\n2 1\n0 2\n1 2\n2 2\n",
+    "#Life 1.05\n#P 0 0\n.*\n..*\n***\n",
+    "!glider\n.O\n2.O\n3O\n",
+], ids=["rle", "split-rle", "plain-rle", "text", "life-1.06", "life-1.05", "dblife"])
+def test_formats(tmp_path, text):
+    algo, err = read(tmp_path, text)
+    assert err is None
+    assert algo.get_rule() == "B3/S23"
+    assert cells_of(algo) == GLIDER
+
+
+def test_gzip_and_xrle(tmp_path):
+    algo, err = read(tmp_path, gzip.compress(b"#CXRLE Pos=-5,7 Gen=42\nx = 3, y = 3\nbo$2bo$3o!\n"))
+    assert err is None
+    assert algo.generation == 42
+    assert cells_of(algo) == {(x - 5, y + 7): s for (x, y), s in GLIDER.items()}
+
+
+def test_multi_state_rle(tmp_path):
+    algo, err = read(tmp_path, "x = 5, y = 2, rule = 12/34/30\n2A.pA$4.B!\n", generationsalgo.GenerationsAlgo)
+    assert err is None
+    assert cells_of(algo) == {(0, 0): 1, (1, 0): 1, (3, 0): 25, (4, 1): 2}
+    # two-state universes reject the states, or the rule itself
+    assert read(tmp_path, "x = 2, y = 1\noB!\n")[1] == readpattern.STATE_ERROR
+    assert read(tmp_path, "x = 1, y = 1, rule = 12/34/30\nA!\n")[1] is not None
+
+
+def test_bounded_grid(tmp_path):
+    # a pattern that fits is centred, and one that doesn't is clipped
+    algo, err = read(tmp_path, "x = 3, y = 3, rule = B3/S23:T10,10\nbo$2bo$3o!\n")
+    assert err is None
+    assert cells_of(algo) == {(x - 1, y - 1): s for (x, y), s in GLIDER.items()}
+    algo, err = read(tmp_path, "x = 12, y = 1, rule = B3/S23:P4,4\n12o!\n")
+    assert err is None
+    assert cells_of(algo) == {(x, -2): 1 for x in range(-2, 2)}
+
+
+def test_macrocell(tmp_path):
+    algo = hlifealgo.HLifeAlgo()
+    (xs, ys), states = zip(*GLIDER), list(GLIDER.values())
+    algo.set_cells(np.array(xs), np.array(ys), np.array(states))
+    algo.end_of_pattern()
+    os = io.StringIO()
+    algo.write_native_format(os, "")
+    copy, err = read(tmp_path, os.getvalue(), hlifealgo.HLifeAlgo)
+    assert err is None
+    assert cells_of(copy) == GLIDER
+    assert read(tmp_path, os.getvalue())[1] == "Cannot read macrocell format."
+
+
+def test_read_universe(tmp_path):
+    path = tmp_path / "pattern"
+    path.write_text("x = 1, y = 1, rule = 12/34/3\nB!\n")
+    algo = bgolly.read_universe(str(path))
+    assert isinstance(algo, generationsalgo.HGenerationsAlgo)
+    assert algo.get_rule() == "12/34/3"
+    assert algo.get_cell(cint(0), cint(0)).value == 2
+    # the universe run is chosen for the pattern read, not just the rule
+    path.write_text("x = 3, y = 3\nbo$2bo$3o!\n")
+    pattern = bgolly.read_universe(str(path))
+    assert bgolly.choose_algorithm(pattern.get_rule(), pattern)[2] == "5 cells in a 3x3 box"
+
+
+def universe(cells):
+    algo = hqlifealgo.HQLifeAlgo()
+    reference.load(algo, cells)
+    return algo
+
+
+@pytest.mark.parametrize("rule, cells, max_gen, name, hashed", [
+    ("B3/S23", reference.soup(0), -1, "QuickLife", False),
+    ("B3/S23", {**reference.soup(0, size=8), (3000, 4000): 1}, -1, "Sparse", False),
+    ("B3/S23", reference.soup(0), 1 << 20, "HashLife", False),
+    ("345/2/4", None, 1 << 20, "Generations", True),
+    ("345/2/4", None, -1, "Generations", False),
+    ("JvN29", None, 1 << 20, "JvN", True),
+    ("B3/S23:T100,100", None, -1, "Bounded", False),
+    ("B3,10/S2,11L", None, 1 << 20, "QuickLife", False),
+    ("R2,C0,M1,S6..9,B6..7,NM", None, 1 << 20, "Larger than Life", False),
+    ("LifeHistory", None, -1, "Super", False),
+    ("nonsense", None, -1, "QuickLife", False),
+], ids=["dense", "sparse", "long-run", "generations-long", "generations", "jvn-long", "bounded",
+        "triangular", "ltl", "history", "unknown"])
+def test_choose_algorithm(rule, cells, max_gen, name, hashed):
+    pattern = None if cells is None else universe(cells)
+    assert bgolly.choose_algorithm(rule, pattern, max_gen)[:2] == (name, hashed)
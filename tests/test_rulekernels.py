@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+import base.hqlifealgo as hqlifealgo
+import base.liferules as liferules
+import base.rulekernels as rulekernels
+import reference
+
+NEIGHBORHOODS = [(liferules.MOORE, reference.MOORE), (liferules.HEXAGONAL, reference.HEXAGONAL),
+                 (liferules.VON_NEUMANN, reference.VON_NEUMANN)]
+
+
+def random_rule(rng, neighbors):
+    """random birth and survival counts, without B0"""
+    counts = np.arange(len(neighbors) + 1)
+    return set(counts[1:][rng.random(len(counts) - 1) < 0.4].tolist()), set(counts[rng.random(len(counts)) < 0.4].tolist())
+
+
+def block_cells(block):
+    """the live cells of a block of words, bit b of word w being x = 32 * w + b"""
+    ys, ws, bs = np.nonzero((block[..., None] >> np.arange(32, dtype=np.uint32)) & 1)
+    return {(int(w) * 32 + int(b), int(y)): 1 for y, w, b in zip(ys, ws, bs)}
+
+
+def expected_words(padded, birth, survival, neighbors):
+    """the next generation of the inside of each bordered block, by the reference"""
+    blocks, rows, words = padded.shape[0], padded.shape[1] - 2, padded.shape[2] - 2
+    out = np.zeros((blocks, rows, words), np.uint32)
+    for i in range(blocks):
+        for x, y in reference.step(block_cells(padded[i]), birth, survival, neighbors):
+            if 1 <= y <= rows and 32 <= x < 32 * (words + 1):
+                out[i, y - 1, x // 32 - 1] |= np.uint32(1 << x % 32)
+    return out
+
+
+@pytest.mark.parametrize("words", [3, 4], ids=["odd-words", "even-words"])
+@pytest.mark.parametrize("mask, neighbors", NEIGHBORHOODS, ids=["moore", "hexagonal", "von-neumann"])
+def test_count_words(mask, neighbors, words):
+    rng = np.random.default_rng(words)
+    padded = rng.integers(0, 1 << 32, (3, 10, words + 2), dtype=np.uint32)
+    for _ in range(4):
+        birth, survival = random_rule(rng, neighbors)
+        new = hqlifealgo.count_words(padded, sum(1 << n for n in birth), sum(1 << n for n in survival), mask)
+        assert np.array_equal(new, expected_words(padded, birth, survival, neighbors))
+
+
+@pytest.mark.parametrize("mask, neighbors", NEIGHBORHOODS, ids=["moore", "hexagonal", "von-neumann"])
+def test_rule_kernel(tmp_path, mask, neighbors):
+    rng = np.random.default_rng(mask)
+    padded = rng.integers(0, 1 << 32, (2, 8, 5), dtype=np.uint32)
+    for _ in range(3):
+        birth, survival = random_rule(rng, neighbors)
+        assert rulekernels.rule_kernel(None, frozenset(birth), frozenset(survival), mask) is None
+        kernel = rulekernels.rule_kernel(str(tmp_path), frozenset(birth), frozenset(survival), mask)
+        assert np.array_equal(kernel(padded), expected_words(padded, birth, survival, neighbors))
+    assert len(list((tmp_path / "kernels").glob("rule_*.py"))) == 3
+
+
+def test_next_words(tmp_path, monkeypatch):
+    # with a cache directory the totalistic rules step with their own kernel
+    monkeypatch.setattr(liferules.rule_cache, "cache_dir", str(tmp_path))
+    rules = liferules.LifeRules()
+    assert rules.set_rule("B36/S23") is None
+    padded = np.random.default_rng(0).integers(0, 1 << 32, (3, 12, 4), dtype=np.uint32)
+    new = hqlifealgo.next_words(padded, rules)
+    assert len(list((tmp_path / "kernels").glob("rule_*.py"))) == 1
+    assert np.array_equal(new, expected_words(padded, {3, 6}, {2, 3}, reference.MOORE))
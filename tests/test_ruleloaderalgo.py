@@ -0,0 +1,121 @@
+import collections
+
+import numpy as np
+import pytest
+
+import base.liferules as liferules
+import base.ruleloaderalgo as ruleloaderalgo
+import base.util as util
+import reference
+
+HEAD, TAIL, WIRE = 1, 2, 3
+
+# exactly one orthogonal neighbor alive gives a birth, and every live cell
+# dies; rotate4 turns the one transition for north into all four
+LONELY_BIRTH = "@RULE LonelyBirth\n@TABLE\nn_states:2\nneighborhood:vonNeumann\nsymmetries:rotate4\n" \
+               "var a={0,1}\nvar b={0,1}\nvar c={0,1}\nvar d={0,1}\n0,1,0,0,0,1\n1,a,b,c,d,0\n"
+
+
+def wireworld(states):
+    """WireWorld as a .rule file with unused states up to states - 1 (which
+       never change and aren't heads), so 6 states are too many for a flat
+       table and step by walking the tree"""
+    any_state = "{" + ",".join(map(str, range(states))) + "}"
+    no_head = "{" + ",".join(str(s) for s in range(states) if s != HEAD) + "}"
+    lines = ["@RULE WireWorld", "@TABLE", "n_states:{}".format(states), "neighborhood:Moore", "symmetries:permute"]
+    lines += ["var a{}={}".format(i, any_state) for i in range(8)]
+    lines += ["var n{}={}".format(i, no_head) for i in range(7)]
+    lines += ["1,a0,a1,a2,a3,a4,a5,a6,a7,2", "2,a0,a1,a2,a3,a4,a5,a6,a7,3",
+              "3,1,n0,n1,n2,n3,n4,n5,n6,1", "3,1,1,n0,n1,n2,n3,n4,n5,1"]
+    return "\n".join(lines) + "\n"
+
+
+def wireworld_step(cells):
+    heads = collections.Counter((x + dx, y + dy) for (x, y), s in cells.items() if s == HEAD
+                                for dx, dy in reference.MOORE)
+    following = {HEAD: TAIL, TAIL: WIRE}
+    return {pos: following.get(s, HEAD if s == WIRE and heads[pos] in (1, 2) else s) for pos, s in cells.items()}
+
+
+@pytest.fixture
+def user_rules(tmp_path, monkeypatch):
+    """a user rules directory to write .rule files in"""
+    monkeypatch.setattr(util.errorhandler, "get_user_rules", lambda: str(tmp_path) + "/")
+    return tmp_path
+
+
+@pytest.mark.parametrize("states", [4, 6], ids=["flat", "tree"])
+@pytest.mark.parametrize("engine", [ruleloaderalgo.RuleLoaderAlgo, ruleloaderalgo.HRuleLoaderAlgo],
+                         ids=lambda e: e.__name__)
+def test_wireworld(user_rules, engine, states):
+    (user_rules / "WireWorld.rule").write_text(wireworld(states))
+    algo = engine()
+    assert algo.set_rule("WireWorld") is None
+    assert (algo._rule.flat is None) == (states > 4)
+    cells = reference.soup(8, size=24, density=0.6, states=states, left=-7, top=-9)
+    reference.load(algo, cells)
+    for increment in (1, 1, 2, 8):
+        algo.increment = increment
+        algo.step()
+        for _ in range(increment):
+            cells = wireworld_step(cells)
+        assert reference.cells_of(algo) == cells
+
+
+def test_symmetries(user_rules):
+    (user_rules / "LonelyBirth.rule").write_text(LONELY_BIRTH)
+    algo = ruleloaderalgo.RuleLoaderAlgo()
+    assert algo.set_rule("LonelyBirth") is None
+    cells = reference.soup(9, size=24, density=0.2)
+    reference.load(algo, cells)
+    for _ in range(6):
+        algo.step()
+        cells = reference.step(cells, {1}, set(), reference.VON_NEUMANN)
+        assert reference.cells_of(algo) == cells
+
+
+def test_life_tree():
+    algo = ruleloaderalgo.RuleLoaderAlgo()
+    assert algo.set_rule("B3/S23") is None
+    cells = reference.soup(10, size=32)
+    reference.load(algo, cells)
+    for _ in range(8):
+        algo.step()
+        cells = reference.step(cells, {3}, {2, 3})
+        assert reference.cells_of(algo) == cells
+
+
+@pytest.fixture
+def rule_cache_dir(tmp_path, monkeypatch):
+    """compile .rule files through an on-disk cache, not the process's"""
+    monkeypatch.setattr(liferules.rule_cache, "cache_dir", str(tmp_path / "cache"))
+    ruleloaderalgo.compile_section.cache_clear()
+    yield tmp_path / "cache"
+    ruleloaderalgo.compile_section.cache_clear()
+
+
+def test_cached_rule(user_rules, rule_cache_dir):
+    def saved():
+        return {p.name for p in rule_cache_dir.iterdir()}
+
+    (user_rules / "WireWorld.rule").write_text(wireworld(4))
+    algo = ruleloaderalgo.RuleLoaderAlgo()
+    life = saved()
+    assert algo.set_rule("WireWorld") is None
+    added = sorted(saved() - life)
+    assert len(added) == 2 and added[0].endswith(".flat.npy") and added[1].endswith(".tree.npy")
+    # a later process maps the saved arrays instead of compiling the table
+    ruleloaderalgo.compile_section.cache_clear()
+    algo = ruleloaderalgo.RuleLoaderAlgo()
+    assert algo.set_rule("WireWorld") is None
+    assert isinstance(algo._rule.flat, np.memmap)
+    cells = reference.soup(8, size=24, density=0.6, states=4)
+    reference.load(algo, cells)
+    for _ in range(4):
+        algo.step()
+        cells = wireworld_step(cells)
+    assert reference.cells_of(algo) == cells
+    # the cache is keyed by the contents, so an edited file is compiled again
+    (user_rules / "WireWorld.rule").write_text(wireworld(6))
+    assert algo.set_rule("WireWorld") is None
+    assert len(saved()) == len(life) + 3
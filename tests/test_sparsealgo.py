@@ -0,0 +1,30 @@
+import pytest
+
+import base.sparsealgo as sparsealgo
+import reference
+
+
+def bounds(cells):
+    xs, ys = zip(*cells)
+    return min(ys), min(xs), max(ys), max(xs)
+
+
+@pytest.mark.parametrize("rule, birth, survival, neighbors", [
+    ("B3/S23", {3}, {2, 3}, reference.MOORE),
+    ("B2/S34H", {2}, {3, 4}, reference.HEXAGONAL),
+], ids=["life", "hexagonal"])
+def test_spread_out(rule, birth, survival, neighbors):
+    # soups far apart in every direction, up to the edge of the key range
+    algo = sparsealgo.SparseAlgo()
+    assert algo.set_rule(rule) is None
+    cells = {}
+    for seed, (left, top) in enumerate([(0, 0), (-1000000, 5000000), (1500000000, -7), (-5, -1500000000)]):
+        cells.update(reference.soup(seed, size=16, left=left, top=top))
+    reference.load(algo, cells)
+    for increment in (1, 1, 5):
+        algo.increment = increment
+        algo.step()
+        cells = reference.run(cells, increment, birth, survival, neighbors)
+        assert reference.cells_of(algo) == cells
+        assert algo.population == len(cells)
+        assert tuple(algo.find_edges()) == bounds(cells)
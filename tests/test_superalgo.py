@@ -0,0 +1,66 @@
+import collections
+
+import pytest
+
+import base.superalgo as superalgo
+import reference
+
+BOUNDARY = 6
+
+
+def history_step(cells, birth, survival):
+    """one generation of a History rule, cell by cell: odd states are alive,
+       a death leaves a mark (4 for the marked live states 3 and 5, else 2),
+       a birth on a marked cell (4) stays marked, and live neighbors of a
+       boundary cell die"""
+    counts = collections.Counter((x + dx, y + dy) for (x, y), s in cells.items() if s & 1
+                                 for dx, dy in reference.MOORE)
+    bounded = {(x + dx, y + dy) for (x, y), s in cells.items() if s == BOUNDARY for dx, dy in reference.MOORE}
+    result = {}
+    for pos in set(counts) | set(cells):
+        state, n = cells.get(pos, 0), counts[pos]
+        if state & 1:
+            if pos in bounded or n not in survival:
+                state = 2 if state == 1 else 4
+        elif n in birth and state != BOUNDARY:
+            state = 3 if state == 4 else 1
+        if state:
+            result[pos] = state
+    return result
+
+
+@pytest.mark.parametrize("rule, birth, survival", [
+    ("LifeHistory", {3}, {2, 3}),
+    ("B36/S23History", {3, 6}, {2, 3}),
+])
+def test_history(rule, birth, survival):
+    algo = superalgo.SuperAlgo()
+    assert algo.set_rule(rule) is None
+    assert algo.num_cell_states.value == superalgo.HISTORY_STATES
+    cells = reference.soup(11, size=32, states=superalgo.HISTORY_STATES, left=-9, top=4)
+    reference.load(algo, cells)
+    for increment in (1, 1, 6):
+        algo.increment = increment
+        algo.step()
+        for _ in range(increment):
+            cells = history_step(cells, birth, survival)
+        assert reference.cells_of(algo) == cells
+
+
+@pytest.mark.parametrize("rule, birth, survival", [
+    ("LifeSuper", {3}, {2, 3}),
+    ("B36/S23Super", {3, 6}, {2, 3}),
+])
+def test_super_live_plane(rule, birth, survival):
+    # without boundary cells the odd states follow the plain rule, whatever
+    # labels the extra states put on them
+    algo = superalgo.SuperAlgo()
+    assert algo.set_rule(rule) is None
+    cells = {pos: s for pos, s in reference.soup(12, size=32, states=superalgo.SUPER_STATES).items()
+             if s != BOUNDARY}
+    reference.load(algo, cells)
+    live = {pos: 1 for pos, s in cells.items() if s & 1}
+    for _ in range(10):
+        algo.step()
+        live = reference.step(live, birth, survival)
+        assert {pos: 1 for pos, s in reference.cells_of(algo).items() if s & 1} == live